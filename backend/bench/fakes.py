@@ -0,0 +1,325 @@
+"""
+Stand-in Servers
+Local fakes of the Retell, OpenAI, Anthropic and Gemini APIs with
+configurable latency and error injection, for offline benchmarks and tests
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# First timestamp the app keeps (Dec 13, 2025 UTC)
+CUTOFF_TIMESTAMP_MS = 1765584000000
+
+
+class Faults:
+    """Latency (base + uniform jitter) and an error rate applied to every request"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    async def apply(self) -> Optional[JSONResponse]:
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            status = random.choice((429, 500, 503))
+            return JSONResponse({"error": {"message": f"injected {status}"}}, status_code=status)
+        return None
+
+
+def make_calls(count: int, agent_ids: List[str]) -> List[Dict[str, Any]]:
+    """Synthetic calls spread over the last 30 days, newest first"""
+    now_ms = int(time.time() * 1000)
+    start_ms = max(CUTOFF_TIMESTAMP_MS, now_ms - 30 * 24 * 60 * 60 * 1000)
+    rng = random.Random(42)
+    calls = []
+    for i in range(count):
+        started = rng.randint(start_ms, now_ms)
+        duration = rng.randint(10_000, 600_000)
+        calls.append({
+            "call_id": f"call_{i:012d}",
+            "agent_id": rng.choice(agent_ids),
+            "call_type": rng.choice(("web_call", "phone_call")),
+            "call_status": rng.choices(("ended", "error", "ongoing"), (90, 5, 5))[0],
+            "start_timestamp": started,
+            "end_timestamp": started + duration,
+            "duration_ms": duration,
+            "transcript": "Agent: Hello! How can I help?\nUser: I'd like to check my order.",
+            "disconnection_reason": "user_hangup",
+            "call_analysis": {
+                "user_sentiment": rng.choice(("Positive", "Neutral", "Negative")),
+                "call_successful": rng.random() < 0.8,
+                "call_summary": "Customer asked about an order.",
+            },
+            "call_cost": {"combined_cost": rng.randint(5, 200)},
+        })
+    calls.sort(key=lambda c: c["start_timestamp"], reverse=True)
+    return calls
+
+
+def create_retell_app(faults: Faults, call_count: int = 5000, agent_count: int = 10) -> FastAPI:
+    app = FastAPI(title="Fake Retell")
+    agents = [
+        {
+            "agent_id": f"agent_{i:016x}",
+            "agent_name": f"Bench Agent {i}",
+            "voice_id": "11labs-Adrian",
+            # No LLM id, so batch tests take the local simulation path
+            "response_engine": {"type": "custom-llm"},
+            "last_modification_timestamp": CUTOFF_TIMESTAMP_MS,
+        }
+        for i in range(agent_count)
+    ]
+    calls = make_calls(call_count, [a["agent_id"] for a in agents])
+    calls_by_id = {c["call_id"]: c for c in calls}
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        return await faults.apply() or await call_next(request)
+
+    @app.post("/v2/list-calls")
+    async def list_calls(body: Dict[str, Any]):
+        criteria = body.get("filter_criteria") or {}
+        window = criteria.get("start_timestamp") or {}
+        agent_ids = set(criteria.get("agent_id") or [])
+        selected = [
+            c for c in calls
+            if (not agent_ids or c["agent_id"] in agent_ids)
+            and c["start_timestamp"] >= window.get("lower_threshold", 0)
+            and c["start_timestamp"] <= window.get("upper_threshold", float("inf"))
+        ]
+        if body.get("sort_order") == "ascending":
+            selected.reverse()
+        if body.get("pagination_key"):
+            ids = [c["call_id"] for c in selected]
+            key = body["pagination_key"]
+            selected = selected[ids.index(key) + 1:] if key in ids else []
+        return selected[:int(body.get("limit", 1000))]
+
+    @app.get("/v2/get-call/{call_id}")
+    async def get_call(call_id: str):
+        call = calls_by_id.get(call_id)
+        if not call:
+            return JSONResponse({"error": "not found"}, status_code=404)
+        return call
+
+    @app.get("/list-agents")
+    async def list_agents():
+        return agents
+
+    @app.get("/get-agent/{agent_id}")
+    async def get_agent(agent_id: str):
+        return next((a for a in agents if a["agent_id"] == agent_id), agents[0])
+
+    @app.post("/create-batch-test")
+    async def create_batch_test(body: Dict[str, Any]):
+        return {"test_case_batch_job_id": f"tbj_{random.getrandbits(48):012x}", "status": "in_progress"}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PATCH", "PUT", "DELETE"])
+    async def anything(path: str):
+        # Endpoints the benchmark doesn't exercise; callers fall back as they would on a 404
+        return JSONResponse({"error": f"fake retell has no /{path}"}, status_code=404)
+
+    return app
+
+
+def fake_reply(messages: List[Dict[str, Any]], default: str) -> str:
+    """Canned content, recognising the conversation simulator's caller and judge prompts"""
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    if system.startswith("You grade conversations"):
+        task = messages[-1].get("content") or ""
+        actions = re.findall(r"^- (.+)$", task.split("Success criteria:")[0], re.M)
+        return json.dumps({
+            "actions": {action: True for action in actions},
+            "success_criteria_met": True,
+            "reason": "Stand-in verdict",
+        })
+    if "[END_CALL]" in system:
+        # Hang up after a few exchanges, like a caller whose question got answered
+        if sum(1 for m in messages if m.get("role") == "assistant") >= 3:
+            return "Great, that's all I needed. Thanks, bye! [END_CALL]"
+        return "Okay, and how does the pricing work if I upgrade later?"
+    return default
+
+
+def create_openai_app(faults: Faults) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    default_reply = "Thanks for reaching out. I can help with pricing, scheduling and order status. " * 3
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        return await faults.apply() or await call_next(request)
+
+    @app.post("/chat/completions")
+    async def chat_completions(body: Dict[str, Any]):
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+        reply = fake_reply(body.get("messages", []), default_reply)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(reply) // 4}
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def chunks():
+            for word in reply.split(" "):
+                delta = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+            yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def _text(content: Any) -> str:
+    """Anthropic content is a string or a list of blocks"""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content or [] if block.get("type") == "text")
+
+
+def create_anthropic_app(faults: Faults) -> FastAPI:
+    app = FastAPI(title="Fake Anthropic")
+    default_reply = "Happy to help with pricing, scheduling or order status. What do you need?"
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        return await faults.apply() or await call_next(request)
+
+    @app.post("/v1/messages")
+    async def messages(request: Request, body: Dict[str, Any]):
+        if not request.headers.get("x-api-key") or not request.headers.get("anthropic-version"):
+            return JSONResponse(
+                {"type": "error", "error": {"type": "authentication_error", "message": "invalid x-api-key"}},
+                status_code=401
+            )
+        if not body.get("max_tokens") or any(m.get("role") == "system" for m in body.get("messages", [])):
+            return JSONResponse(
+                {"type": "error", "error": {"type": "invalid_request_error", "message": "invalid request"}},
+                status_code=400
+            )
+        turns = [{"role": m["role"], "content": _text(m.get("content"))} for m in body.get("messages", [])]
+        if body.get("system"):
+            turns.insert(0, {"role": "system", "content": body["system"]})
+        reply = fake_reply(turns, default_reply)
+        return {
+            "id": "msg_bench",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": "end_turn",
+            "usage": {
+                "input_tokens": sum(len(m["content"]) for m in turns) // 4,
+                "output_tokens": len(reply) // 4,
+            },
+        }
+
+    return app
+
+
+def create_gemini_app(faults: Faults) -> FastAPI:
+    app = FastAPI(title="Fake Gemini")
+    default_reply = "I can help with pricing, scheduling and order status. What would you like to know?"
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        return await faults.apply() or await call_next(request)
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate_content(model_action: str, request: Request, body: Dict[str, Any]):
+        if not model_action.endswith(":generateContent"):
+            return JSONResponse({"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}}, status_code=404)
+        if not request.headers.get("x-goog-api-key"):
+            return JSONResponse(
+                {"error": {"code": 403, "message": "API key not valid", "status": "PERMISSION_DENIED"}},
+                status_code=403
+            )
+        turns = [
+            {
+                "role": "assistant" if c.get("role") == "model" else "user",
+                "content": "".join(part.get("text", "") for part in c.get("parts", [])),
+            }
+            for c in body.get("contents", [])
+        ]
+        system = "".join(part.get("text", "") for part in (body.get("systemInstruction") or {}).get("parts", []))
+        if system:
+            turns.insert(0, {"role": "system", "content": system})
+        reply = fake_reply(turns, default_reply)
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": reply}]}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": sum(len(m["content"]) for m in turns) // 4,
+                "candidatesTokenCount": len(reply) // 4,
+            },
+        }
+
+    return app
+
+
+async def serve(
+    retell_port: int,
+    openai_port: int,
+    retell_faults: Faults,
+    openai_faults: Faults,
+    call_count: int = 5000,
+    anthropic_port: Optional[int] = None,
+    gemini_port: Optional[int] = None,
+    fallback_faults: Optional[Faults] = None
+):
+    apps = [
+        (create_retell_app(retell_faults, call_count), retell_port),
+        (create_openai_app(openai_faults), openai_port),
+    ]
+    if anthropic_port:
+        apps.append((create_anthropic_app(fallback_faults or Faults()), anthropic_port))
+    if gemini_port:
+        apps.append((create_gemini_app(fallback_faults or Faults()), gemini_port))
+    servers = [uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning")) for app, port in apps]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake Retell and LLM provider servers")
+    parser.add_argument("--retell-port", type=int, default=9101)
+    parser.add_argument("--openai-port", type=int, default=9102)
+    parser.add_argument("--anthropic-port", type=int, default=0, help="Also serve a fake Anthropic API (0 = off)")
+    parser.add_argument("--gemini-port", type=int, default=0, help="Also serve a fake Gemini API (0 = off)")
+    parser.add_argument("--calls", type=int, default=5000, help="Synthetic calls served by /v2/list-calls")
+    parser.add_argument("--retell-latency-ms", type=float, default=50)
+    parser.add_argument("--openai-latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--retell-error-rate", type=float, default=0)
+    parser.add_argument("--openai-error-rate", type=float, default=0)
+    parser.add_argument("--fallback-latency-ms", type=float, default=300, help="Anthropic and Gemini fakes")
+    parser.add_argument("--fallback-error-rate", type=float, default=0, help="Anthropic and Gemini fakes")
+    args = parser.parse_args()
+
+    asyncio.run(serve(
+        args.retell_port,
+        args.openai_port,
+        Faults(args.retell_latency_ms, args.jitter_ms, args.retell_error_rate),
+        Faults(args.openai_latency_ms, args.jitter_ms, args.openai_error_rate),
+        args.calls,
+        args.anthropic_port,
+        args.gemini_port,
+        Faults(args.fallback_latency_ms, args.jitter_ms, args.fallback_error_rate)
+    ))
+
+
+if __name__ == "__main__":
+    main()
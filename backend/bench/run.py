@@ -0,0 +1,333 @@
+"""
+Benchmark Runner
+Boots the API against local Retell/OpenAI stand-ins and a throwaway MongoDB,
+drives the key endpoints at a fixed concurrency and reports throughput and
+latency percentiles. Needs no network access.
+
+    cd backend
+    python -m bench.run --concurrency 32 --requests 500
+    python -m bench.run --scenarios chat,history --openai-latency-ms 800 --openai-error-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Processes:
+    """Child processes (and temp dirs) torn down together"""
+
+    def __init__(self):
+        self.procs: List[subprocess.Popen] = []
+        self.tempdirs: List[str] = []
+
+    def start(self, args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+        proc = subprocess.Popen(args, cwd=BACKEND_DIR, env=env or os.environ.copy())
+        self.procs.append(proc)
+        return proc
+
+    def stop(self):
+        for proc in reversed(self.procs):
+            if proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        for path in self.tempdirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def start_mongo(processes: Processes) -> str:
+    """Throwaway mongod in a temp directory; returns its URL"""
+    mongod = shutil.which("mongod")
+    if not mongod:
+        sys.exit("mongod not found on PATH; install MongoDB or pass --mongo-url")
+    dbpath = tempfile.mkdtemp(prefix="bench-mongo-")
+    processes.tempdirs.append(dbpath)
+    port = free_port()
+    processes.start([mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"])
+    return f"mongodb://127.0.0.1:{port}"
+
+
+async def wait_until_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.25)
+    sys.exit(f"Timed out waiting for {url}")
+
+
+async def seed(client: httpx.AsyncClient, agent_count: int) -> Dict[str, Any]:
+    """Chat agents, a synced call store and a test case to run batches against"""
+    agent_ids = []
+    for i in range(agent_count):
+        response = await client.post("/api/agents", json={
+            "name": f"Bench Chat Agent {i}",
+            "type": "chat",
+            "system_prompt": "You are a helpful support agent for an online store. " * 20,
+        })
+        response.raise_for_status()
+        agent_ids.append(response.json()["id"])
+
+    # With error injection on, the sync can fail part-way; analytics then run on what landed
+    sync = await client.post("/api/retell/calls/sync", timeout=300)
+
+    response = await client.get("/api/retell/agents")
+    voice_agents = response.json() if response.status_code == 200 else []
+    voice_agent_id = voice_agents[0]["agent_id"] if voice_agents else "agent_0000000000000000"
+    test_case = await client.post("/api/retell/test-cases", json={
+        "agent_id": voice_agent_id,
+        "name": "Bench regression",
+        "scenarios": [
+            {
+                "name": f"Scenario {i}",
+                "user_message": f"Question {i} about pricing",
+                "expected_topics": ["pricing"],
+                "expected_actions": ["explain the upgrade price"],
+                "success_criteria": "The caller understands the pricing",
+                "max_turns": 4,
+            }
+            for i in range(10)
+        ],
+    })
+    test_case.raise_for_status()
+
+    return {
+        "agent_ids": agent_ids,
+        "voice_agent_id": voice_agent_id,
+        "test_case_id": test_case.json()["test_case_definition_id"],
+        "synced": sync.json() if sync.status_code == 200 else f"failed ({sync.status_code})",
+    }
+
+
+def build_scenarios(data: Dict[str, Any], use_cache: bool) -> Dict[str, Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]]:
+    analytics_paths = [
+        "/api/analytics/calls?days=7",
+        "/api/analytics/chart-data?days=30",
+        "/api/analytics/recent-calls",
+        "/api/retell/analytics/overview",
+    ]
+
+    async def agents(client, i):
+        return await client.get("/api/agents")
+
+    async def analytics(client, i):
+        return await client.get(analytics_paths[i % len(analytics_paths)])
+
+    async def history(client, i):
+        return await client.get("/api/retell/history", params={"limit": 50})
+
+    async def chat(client, i):
+        # A few long-running sessions per agent, like real users
+        agent = i % len(data["agent_ids"])
+        return await client.post("/api/chat", json={
+            "agent_id": data["agent_ids"][agent],
+            "session_id": f"bench-{agent}-{i // len(data['agent_ids']) % 4}",
+            "message": f"Hi, what are your prices for plan {i}?",
+        })
+
+    async def batch_tests(client, i, multi_turn=False):
+        if i % 2:
+            return await client.get("/api/retell/batch-tests")
+        return await client.post("/api/retell/batch-tests", json={
+            "test_case_definition_ids": [data["test_case_id"]],
+            "agent_id": data["voice_agent_id"],
+            "concurrency": 4,
+            "use_cache": use_cache,
+            "multi_turn": multi_turn,
+        })
+
+    async def conversations(client, i):
+        return await batch_tests(client, i, multi_turn=True)
+
+    return {
+        "agents": agents, "analytics": analytics, "history": history, "chat": chat,
+        "batch-tests": batch_tests, "conversations": conversations,
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    fn: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]],
+    total: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await fn(client, i)
+                outcome = None if response.status_code < 400 else str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            if outcome:
+                errors[outcome] = errors.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed if elapsed else 0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0,
+    }
+
+
+def print_report(results: Dict[str, Dict[str, Any]]):
+    header = f"{'scenario':<14}{'reqs':>7}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(
+            f"{name:<14}{r['requests']:>7}{sum(r['errors'].values()):>8}{r['throughput_rps']:>10.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}"
+        )
+
+
+async def benchmark(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        data = await seed(client, args.agents)
+        print(f"Seeded {len(data['agent_ids'])} agents; call sync: {data['synced']}")
+
+        scenarios = build_scenarios(data, args.use_cache)
+        selected = [s.strip() for s in args.scenarios.split(",") if s.strip()] if args.scenarios else list(scenarios)
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))} (choose from {', '.join(scenarios)})")
+
+        results = {}
+        for name in selected:
+            if args.warmup:
+                await run_scenario(client, scenarios[name], args.warmup, min(args.concurrency, args.warmup))
+            results[name] = await run_scenario(client, scenarios[name], args.requests, args.concurrency)
+            print(f"  {name}: done")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline API benchmark")
+    parser.add_argument("--scenarios", default="", help="Comma-separated: agents,analytics,history,chat,batch-tests,conversations")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per scenario")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--agents", type=int, default=20, help="Chat agents to seed")
+    parser.add_argument("--calls", type=int, default=5000, help="Synthetic Retell calls")
+    parser.add_argument("--retell-latency-ms", type=float, default=50)
+    parser.add_argument("--openai-latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--retell-error-rate", type=float, default=0)
+    parser.add_argument("--openai-error-rate", type=float, default=0)
+    parser.add_argument("--failover", action="store_true", help="Configure fake Anthropic and Gemini providers for LLM failover")
+    parser.add_argument("--use-cache", action="store_true", help="Let batch tests use the completion cache")
+    parser.add_argument("--mongo-url", help="Use this MongoDB instead of a throwaway mongod (a temp database is dropped afterwards)")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    processes = Processes()
+    db_name = f"bench_{uuid.uuid4().hex[:8]}"
+    try:
+        mongo_url = args.mongo_url or start_mongo(processes)
+        retell_port, openai_port, app_port = free_port(), free_port(), free_port()
+        anthropic_port, gemini_port = (free_port(), free_port()) if args.failover else (0, 0)
+
+        processes.start([
+            sys.executable, "-m", "bench.fakes",
+            "--retell-port", str(retell_port),
+            "--openai-port", str(openai_port),
+            "--calls", str(args.calls),
+            "--retell-latency-ms", str(args.retell_latency_ms),
+            "--openai-latency-ms", str(args.openai_latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+            "--retell-error-rate", str(args.retell_error_rate),
+            "--openai-error-rate", str(args.openai_error_rate),
+            "--anthropic-port", str(anthropic_port),
+            "--gemini-port", str(gemini_port),
+        ])
+
+        env = {
+            **os.environ,
+            "MONGO_URL": mongo_url,
+            "DB_NAME": db_name,
+            "RETELL_API_KEY": "key_bench",
+            "RETELL_API_BASE": f"http://127.0.0.1:{retell_port}",
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_API_BASE": f"http://127.0.0.1:{openai_port}",
+            # The benchmark triggers the sync itself
+            "CALL_SYNC_ENABLED": "false",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        }
+        if args.failover:
+            env.update({
+                "ANTHROPIC_API_KEY": "sk-ant-bench",
+                "ANTHROPIC_API_BASE": f"http://127.0.0.1:{anthropic_port}",
+                "GEMINI_API_KEY": "gemini-bench",
+                "GEMINI_API_BASE": f"http://127.0.0.1:{gemini_port}",
+            })
+        processes.start(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(app_port), "--log-level", "warning"],
+            env
+        )
+
+        base_url = f"http://127.0.0.1:{app_port}"
+        asyncio.run(wait_until_ready(f"{base_url}/api/health/db-pool"))
+        results = asyncio.run(benchmark(args, base_url))
+
+        print()
+        print_report(results)
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump({"args": vars(args), "results": results}, f, indent=2)
+    finally:
+        if args.mongo_url:
+            from pymongo import MongoClient
+            with MongoClient(args.mongo_url) as mongo:
+                mongo.drop_database(db_name)
+        processes.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,10 @@ from pydantic import BaseModel, Field
 from dodopayments import DodoPayments
 
 # Database connection
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_database
+from services.metrics import track_outbound
+from services.log_config import log_payload
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/payments", tags=["Payments"])
@@ -30,19 +33,11 @@ DODO_PRODUCT_ID = os.environ.get("DODO_PRODUCT_ID")
 dodo_client = None
 if DODO_API_KEY:
     dodo_client = DodoPayments(bearer_token=DODO_API_KEY)
-    logger.info(f"Dodo Payments client initialized: {DODO_API_KEY[:20]}...")
+    logger.info("Dodo Payments client initialized")
 else:
     logger.warning("DODO_PAYMENTS_API_KEY not configured")
 
 
-def get_db():
-    """Get MongoDB connection"""
-    mongo_url = os.environ.get("MONGO_URL")
-    client = AsyncIOMotorClient(mongo_url)
-    db_name = os.environ.get("DB_NAME", "intelliax")
-    return client, client[db_name]
-
-
 # ========== PYDANTIC MODELS ==========
 
 class CreateCheckoutRequest(BaseModel):
@@ -65,7 +60,7 @@ class SubscriptionStatus(BaseModel):
     user_id: str
     is_premium: bool
     payment_id: Optional[str] = None
-    purchased_at: Optional[str] = None
+    purchased_at: Optional[datetime] = None
     product_id: Optional[str] = None
 
 
@@ -125,7 +120,7 @@ def verify_webhook_signature(payload: bytes, headers: dict) -> bool:
 # ========== API ENDPOINTS ==========
 
 @router.post("/create-checkout", response_model=Dict[str, Any])
-async def create_checkout_session(request: CreateCheckoutRequest):
+async def create_checkout_session(request: CreateCheckoutRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Create a Dodo Payments checkout session for premium upgrade.
     """
@@ -163,10 +158,11 @@ async def create_checkout_session(request: CreateCheckoutRequest):
         }
         
         # Use the SDK to create payment
-        result = dodo_client.payments.create(**payment_create_request)
+        with track_outbound("dodo", "POST", "/payments") as call:
+            result = dodo_client.payments.create(**payment_create_request)
+            call["status"] = "ok"
         
         # Store pending payment record
-        client, db = get_db()
         payment_record = {
             "id": str(uuid.uuid4()),
             "user_id": request.user_id,
@@ -174,10 +170,9 @@ async def create_checkout_session(request: CreateCheckoutRequest):
             "payment_id": result.payment_id if hasattr(result, 'payment_id') else result.id if hasattr(result, 'id') else None,
             "status": "pending",
             "product_id": DODO_PRODUCT_ID,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.payments.insert_one(payment_record)
-        client.close()
         
         # Extract payment link - try different possible attribute names
         payment_link = None
@@ -212,7 +207,7 @@ async def create_checkout_session(request: CreateCheckoutRequest):
 
 
 @router.post("/webhook")
-async def handle_webhook(request: Request):
+async def handle_webhook(request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Handle Dodo Payments webhook events.
     """
@@ -239,9 +234,8 @@ async def handle_webhook(request: Request):
         event_type = payload.get("type", "")
         data = payload.get("data", {})
         
-        logger.info(f"Processing webhook event: {event_type} - Data: {data}")
-        
-        client, db = get_db()
+        logger.info(f"Processing webhook event: {event_type}")
+        log_payload(logger, "Webhook event data", data, event_type=event_type)
         
         # Handle different event types
         if event_type in ["payment.succeeded", "payment_succeeded", "payment.completed"]:
@@ -261,8 +255,8 @@ async def handle_webhook(request: Request):
                             "is_premium": True,
                             "payment_id": payment_id,
                             "product_id": DODO_PRODUCT_ID,
-                            "purchased_at": datetime.now(timezone.utc).isoformat(),
-                            "updated_at": datetime.now(timezone.utc).isoformat()
+                            "purchased_at": datetime.now(timezone.utc),
+                            "updated_at": datetime.now(timezone.utc)
                         }
                     },
                     upsert=True
@@ -275,7 +269,7 @@ async def handle_webhook(request: Request):
             if payment_id:
                 await db.payments.update_one(
                     {"payment_id": payment_id},
-                    {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}},
+                    {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc)}},
                     upsert=True
                 )
         
@@ -285,14 +279,12 @@ async def handle_webhook(request: Request):
             if payment_id:
                 await db.payments.update_one(
                     {"payment_id": payment_id},
-                    {"$set": {"status": "failed", "failed_at": datetime.now(timezone.utc).isoformat()}},
+                    {"$set": {"status": "failed", "failed_at": datetime.now(timezone.utc)}},
                     upsert=True
                 )
         else:
             logger.info(f"Unhandled event type: {event_type}")
         
-        client.close()
-        
         return {"success": True, "event": event_type, "processed": True}
         
     except HTTPException:
@@ -303,14 +295,12 @@ async def handle_webhook(request: Request):
 
 
 @router.get("/status/{user_id}", response_model=SubscriptionStatus)
-async def get_subscription_status(user_id: str):
+async def get_subscription_status(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Get subscription status for a user.
     """
     try:
-        client, db = get_db()
         subscription = await db.user_subscriptions.find_one({"user_id": user_id})
-        client.close()
         
         if subscription and subscription.get("is_premium"):
             return SubscriptionStatus(
@@ -332,7 +322,7 @@ async def get_subscription_status(user_id: str):
 
 
 @router.post("/verify-payment/{payment_id}")
-async def verify_payment(payment_id: str, user_id: str):
+async def verify_payment(payment_id: str, user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Manually verify a payment and upgrade user if successful.
     Used as fallback when webhook doesn't fire.
@@ -342,13 +332,13 @@ async def verify_payment(payment_id: str, user_id: str):
             raise HTTPException(status_code=500, detail="Dodo Payments not configured")
             
         # Check payment status with Dodo using SDK
-        result = dodo_client.payments.get(payment_id=payment_id)
+        with track_outbound("dodo", "GET", "/payments/{payment_id}") as call:
+            result = dodo_client.payments.get(payment_id=payment_id)
+            call["status"] = "ok"
         
         status = result.status.lower() if hasattr(result, 'status') else ""
         
         if status in ["succeeded", "completed", "paid"]:
-            client, db = get_db()
-            
             # Upgrade user to premium
             await db.user_subscriptions.update_one(
                 {"user_id": user_id},
@@ -358,15 +348,13 @@ async def verify_payment(payment_id: str, user_id: str):
                         "is_premium": True,
                         "payment_id": payment_id,
                         "product_id": DODO_PRODUCT_ID,
-                        "purchased_at": datetime.now(timezone.utc).isoformat(),
+                        "purchased_at": datetime.now(timezone.utc),
                         "verified_manually": True
                     }
                 },
                 upsert=True
             )
             
-            client.close()
-            
             return {
                 "success": True,
                 "is_premium": True,
@@ -4,29 +4,24 @@ AI-powered prompt generation with web scraping, PDF parsing, and structured XML
 """
 
 import os
+import asyncio
 import logging
 import httpx
 from typing import Optional, List, Dict, Any
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
 from pydantic import BaseModel, Field
 from datetime import datetime, timezone
 import uuid
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from bs4 import BeautifulSoup
 import PyPDF2
 import io
+from services.database import get_database
+from services.llm_gateway import LLMError, complete_text
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/prompt-lab", tags=["Prompt Lab"])
 
-# MongoDB connection
-def get_db():
-    mongo_url = os.environ.get("MONGO_URL")
-    client = AsyncIOMotorClient(mongo_url)
-    db_name = os.environ.get("DB_NAME", "intelliax")
-    return client, client[db_name]
-
-
 # ========== PYDANTIC MODELS ==========
 
 class WebsiteExtractionRequest(BaseModel):
@@ -55,6 +50,7 @@ class PromptTestRequest(BaseModel):
     """Request to test prompt with QA agent"""
     system_prompt: str = Field(..., description="Prompt to test")
     test_questions: List[str] = Field(..., description="Questions to ask")
+    use_cache: Optional[bool] = Field(default=None, description="False re-asks every question instead of reusing cached answers")
 
 
 # ========== HELPER FUNCTIONS ==========
@@ -178,46 +174,38 @@ async def generate_xml_prompt(request: PromptGenerationRequest) -> str:
 
 Return ONLY the XML-formatted prompt, starting with <system_prompt> and ending with </system_prompt>."""
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {openai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-4o",
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are an expert AI prompt engineer specializing in creating structured, XML-formatted prompts for conversational AI agents."
-                        },
-                        {
-                            "role": "user",
-                            "content": generation_instructions
-                        }
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 4000
-                }
+        try:
+            generated_prompt = await complete_text(
+                [
+                    {
+                        "role": "system",
+                        "content": "You are an expert AI prompt engineer specializing in creating structured, XML-formatted prompts for conversational AI agents."
+                    },
+                    {
+                        "role": "user",
+                        "content": generation_instructions
+                    }
+                ],
+                model="gpt-4o",
+                temperature=0.7,
+                max_tokens=4000,
+                api_key=openai_api_key,
+                timeout=120.0,
+                purpose="generate_prompt"
             )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=500, detail="Failed to generate prompt")
-            
-            data = response.json()
-            generated_prompt = data["choices"][0]["message"]["content"]
-            
-            # Clean up markdown code blocks if present
-            generated_prompt = generated_prompt.strip()
-            if generated_prompt.startswith("```xml"):
-                generated_prompt = generated_prompt[6:]
-            if generated_prompt.startswith("```"):
-                generated_prompt = generated_prompt[3:]
-            if generated_prompt.endswith("```"):
-                generated_prompt = generated_prompt[:-3]
-            
-            return generated_prompt.strip()
+        except LLMError:
+            raise HTTPException(status_code=500, detail="Failed to generate prompt")
+        
+        # Clean up markdown code blocks if present
+        generated_prompt = generated_prompt.strip()
+        if generated_prompt.startswith("```xml"):
+            generated_prompt = generated_prompt[6:]
+        if generated_prompt.startswith("```"):
+            generated_prompt = generated_prompt[3:]
+        if generated_prompt.endswith("```"):
+            generated_prompt = generated_prompt[:-3]
+        
+        return generated_prompt.strip()
             
     except HTTPException:
         raise
@@ -254,41 +242,34 @@ Return as JSON array:
   }}
 ]"""
 
-        async with httpx.AsyncClient(timeout=90.0) as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {openai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-4o",
-                    "messages": [
-                        {"role": "system", "content": "You are a QA engineer. Return only valid JSON."},
-                        {"role": "user", "content": generation_prompt}
-                    ],
-                    "temperature": 0.8,
-                    "max_tokens": 3000
-                }
+        try:
+            content = await complete_text(
+                [
+                    {"role": "system", "content": "You are a QA engineer. Return only valid JSON."},
+                    {"role": "user", "content": generation_prompt}
+                ],
+                model="gpt-4o",
+                temperature=0.8,
+                max_tokens=3000,
+                api_key=openai_api_key,
+                timeout=90.0,
+                purpose="generate_questions"
             )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=500, detail="Failed to generate questions")
-            
-            data = response.json()
-            content = data["choices"][0]["message"]["content"].strip()
-            
-            # Clean JSON from markdown
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            import json
-            questions = json.loads(content.strip())
-            return questions
+        except LLMError:
+            raise HTTPException(status_code=500, detail="Failed to generate questions")
+        content = content.strip()
+        
+        # Clean JSON from markdown
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.startswith("```"):
+            content = content[3:]
+        if content.endswith("```"):
+            content = content[:-3]
+        
+        import json
+        questions = json.loads(content.strip())
+        return questions
             
     except Exception as e:
         logger.error(f"Error generating test questions: {str(e)}")
@@ -322,13 +303,12 @@ async def extract_from_pdf(file: UploadFile = File(...)):
 
 
 @router.post("/generate-prompt")
-async def generate_prompt(request: PromptGenerationRequest):
+async def generate_prompt(request: PromptGenerationRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Generate structured XML prompt"""
     try:
         generated_prompt = await generate_xml_prompt(request)
         
         # Save to database
-        client, db = get_db()
         prompt_record = {
             "id": str(uuid.uuid4()),
             "company_name": request.company_name,
@@ -336,10 +316,9 @@ async def generate_prompt(request: PromptGenerationRequest):
             "agent_purpose": request.agent_purpose,
             "tone": request.tone,
             "generated_prompt": generated_prompt,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.generated_prompts.insert_one(prompt_record)
-        client.close()
         
         return {
             "success": True,
@@ -383,43 +362,37 @@ async def test_prompt(request: PromptTestRequest):
         if not openai_api_key:
             raise HTTPException(status_code=500, detail="OpenAI API key not configured")
         
-        results = []
-        
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            for question in request.test_questions[:10]:  # Limit to 10 questions
-                # Test the agent with this question
-                response = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {openai_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "gpt-4o-mini",
-                        "messages": [
-                            {"role": "system", "content": request.system_prompt},
-                            {"role": "user", "content": question}
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": 500
-                    }
+        async def ask(question: str) -> Dict[str, Any]:
+            # Test the agent with this question (temperature 0, so an unchanged rerun is cached)
+            try:
+                answer = await complete_text(
+                    [
+                        {"role": "system", "content": request.system_prompt},
+                        {"role": "user", "content": question}
+                    ],
+                    model="gpt-4o-mini",
+                    temperature=0,
+                    max_tokens=500,
+                    api_key=openai_api_key,
+                    timeout=120.0,
+                    purpose="test_prompt",
+                    cache=request.use_cache
                 )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    answer = data["choices"][0]["message"]["content"]
-                    results.append({
-                        "question": question,
-                        "answer": answer,
-                        "status": "success"
-                    })
-                else:
-                    results.append({
-                        "question": question,
-                        "answer": None,
-                        "status": "error",
-                        "error": response.text
-                    })
+                return {
+                    "question": question,
+                    "answer": answer,
+                    "status": "success"
+                }
+            except LLMError as e:
+                return {
+                    "question": question,
+                    "answer": None,
+                    "status": "error",
+                    "error": e.detail
+                }
+        
+        # Questions are independent; the gateway bounds overall concurrency
+        results = await asyncio.gather(*(ask(q) for q in request.test_questions[:10]))  # Limit to 10 questions
         
         return {
             "success": True,
@@ -434,12 +407,10 @@ async def test_prompt(request: PromptTestRequest):
 
 
 @router.get("/saved-prompts")
-async def get_saved_prompts():
+async def get_saved_prompts(db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get all saved generated prompts"""
     try:
-        client, db = get_db()
         prompts = await db.generated_prompts.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-        client.close()
         
         return {
             "success": True,
@@ -452,12 +423,10 @@ async def get_saved_prompts():
 
 
 @router.get("/saved-prompts/{prompt_id}")
-async def get_saved_prompt(prompt_id: str):
+async def get_saved_prompt(prompt_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get a specific saved prompt"""
     try:
-        client, db = get_db()
         prompt = await db.generated_prompts.find_one({"id": prompt_id}, {"_id": 0})
-        client.close()
         
         if not prompt:
             raise HTTPException(status_code=404, detail="Prompt not found")
@@ -471,12 +440,10 @@ async def get_saved_prompt(prompt_id: str):
 
 
 @router.delete("/saved-prompts/{prompt_id}")
-async def delete_saved_prompt(prompt_id: str):
+async def delete_saved_prompt(prompt_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Delete a saved prompt"""
     try:
-        client, db = get_db()
         result = await db.generated_prompts.delete_one({"id": prompt_id})
-        client.close()
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Prompt not found")
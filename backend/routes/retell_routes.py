@@ -3,33 +3,42 @@ Retell AI Voice Agent Routes
 Based on Retell API documentation and platform-layer-backend reference
 """
 import os
+import re
+import asyncio
+import time
+import hmac
 import uuid
+import hashlib
 import logging
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-import httpx
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
-
-# MongoDB connection - reuse from environment
-def get_db():
-    """Get MongoDB database connection"""
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    db_name = os.environ.get('DB_NAME', 'emergent_agents')
-    client = AsyncIOMotorClient(mongo_url)
-    return client, client[db_name]
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from services.database import get_database
+from services import call_store, retell_agent_cache
+from services.batch_tests import start_local_batch_test, batch_topic
+from services.retell_batch_tracker import track_retell_batch
+from services.events import subscribe, unsubscribe, sse_stream
+from services.llm_gateway import LLMError, complete_text
+from services.retell_client import (
+    get_retell_api_key,
+    make_retell_request,
+    make_retell_multipart_request,
+    iter_retell_calls,
+    LIST_CALLS_PAGE_SIZE,
+    RETELL_DISPATCH_CONCURRENCY,
+    retell_rate_limiter,
+)
+from services.dispatch import dispatch
+from services.log_config import log_payload
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/retell", tags=["Voice Agents"])
 
-# Retell API Configuration
-RETELL_API_BASE = "https://api.retellai.com"
-
-def get_retell_api_key():
-    """Get Retell API key from environment (dynamic lookup)"""
-    return os.environ.get("RETELL_API_KEY")
-
 
 # ========== PYDANTIC MODELS ==========
 
@@ -81,79 +90,6 @@ class WebCallResponse(BaseModel):
     agent_id: str
 
 
-# ========== HELPER FUNCTIONS ==========
-
-async def make_retell_request(
-    method: str, 
-    endpoint: str, 
-    data: dict = None,
-    timeout: float = 30.0
-) -> dict:
-    """Make authenticated request to Retell API"""
-    api_key = get_retell_api_key()
-    if not api_key:
-        raise HTTPException(
-            status_code=500, 
-            detail="RETELL_API_KEY not configured. Add it to your .env file."
-        )
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    url = f"{RETELL_API_BASE}{endpoint}"
-    logger.info(f"Retell API: {method} {endpoint}")
-    if data:
-        logger.info(f"Retell API request data: {data}")
-    
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        try:
-            if method.upper() == "GET":
-                response = await client.get(url, headers=headers)
-            elif method.upper() == "POST":
-                response = await client.post(url, headers=headers, json=data)
-            elif method.upper() == "PATCH":
-                response = await client.patch(url, headers=headers, json=data)
-            elif method.upper() == "PUT":
-                response = await client.put(url, headers=headers, json=data)
-            elif method.upper() == "DELETE":
-                response = await client.delete(url, headers=headers)
-            else:
-                raise HTTPException(status_code=400, detail=f"Unsupported method: {method}")
-            
-            logger.info(f"Retell API response: {response.status_code}")
-            
-            if response.status_code >= 400:
-                error_detail = response.text
-                logger.error(f"Retell API raw error response: {error_detail}")
-                try:
-                    error_json = response.json()
-                    logger.error(f"Retell API error JSON: {error_json}")
-                    error_detail = error_json.get("error", error_json.get("detail", error_json.get("message", error_detail)))
-                except:
-                    pass
-                
-                logger.error(f"Retell API error: {response.status_code} - {error_detail}")
-                
-                if response.status_code == 401:
-                    raise HTTPException(status_code=401, detail="Invalid Voice Platform API key")
-                elif response.status_code == 404:
-                    raise HTTPException(status_code=404, detail=f"Resource not found: {endpoint}")
-                else:
-                    raise HTTPException(status_code=response.status_code, detail=error_detail)
-            
-            # Handle DELETE with no content
-            if method.upper() == "DELETE" and response.status_code == 204:
-                return {"success": True}
-            
-            return response.json() if response.text else {"success": True}
-            
-        except httpx.RequestError as e:
-            logger.error(f"Retell API connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to connect to Voice Platform API: {str(e)}")
-
-
 # ========== AGENT ENDPOINTS ==========
 
 @router.post("/agents", response_model=Dict[str, Any])
@@ -216,6 +152,7 @@ async def create_retell_agent(request: CreateAgentRequest):
             raise HTTPException(status_code=500, detail="Failed to create agent")
         
         logger.info(f"Created Retell agent: {agent_id}")
+        retell_agent_cache.add_agent_id(agent_id)
         
         return {
             "success": True,
@@ -239,7 +176,9 @@ async def list_retell_agents():
     """List all Retell voice agents"""
     try:
         response = await make_retell_request("GET", "/list-agents")
-        return response if isinstance(response, list) else []
+        agents = response if isinstance(response, list) else []
+        retell_agent_cache.set_agents(agents)
+        return agents
     except Exception as e:
         logger.error(f"Error listing Retell agents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -319,6 +258,7 @@ async def delete_retell_agent(agent_id: str):
     """Delete a Retell agent"""
     try:
         await make_retell_request("DELETE", f"/delete-agent/{agent_id}")
+        retell_agent_cache.discard_agent_id(agent_id)
         return {"success": True, "message": "Agent deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting Retell agent {agent_id}: {str(e)}")
@@ -373,19 +313,28 @@ async def list_calls(
     start_timestamp: Optional[int] = None,
     end_timestamp: Optional[int] = None
 ):
-    """Get call history with optional filters"""
+    """Get call history with optional filters (follows pagination past 1000 calls)"""
     try:
-        params = {"limit": limit}
+        filter_criteria: Dict[str, Any] = {}
         if agent_id:
-            params["agent_id"] = agent_id
-        if start_timestamp:
-            params["start_timestamp"] = start_timestamp
-        if end_timestamp:
-            params["end_timestamp"] = end_timestamp
-        
-        response = await make_retell_request("POST", "/v2/list-calls", params)
-        return response if isinstance(response, list) else response.get("calls", [])
+            filter_criteria["agent_id"] = [agent_id]
+        if start_timestamp or end_timestamp:
+            filter_criteria["start_timestamp"] = {}
+            if start_timestamp:
+                filter_criteria["start_timestamp"]["lower_threshold"] = start_timestamp
+            if end_timestamp:
+                filter_criteria["start_timestamp"]["upper_threshold"] = end_timestamp
+        
+        return [
+            call async for call in iter_retell_calls(
+                filter_criteria=filter_criteria or None,
+                max_calls=limit,
+                prefetch=limit > LIST_CALLS_PAGE_SIZE
+            )
+        ]
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listing calls: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -441,80 +390,49 @@ async def get_call_transcript(call_id: str):
 
 # ========== CALL HISTORY ENDPOINTS ==========
 
-# Cutoff date: December 13, 2025 - only show data from this date onwards
-CUTOFF_DATE = datetime(2025, 12, 13, 0, 0, 0)
-CUTOFF_TIMESTAMP_MS = int(CUTOFF_DATE.timestamp() * 1000)
-
 @router.get("/history")
 async def get_call_history(
     limit: int = 50,
     agent_id: Optional[str] = None,
-    days: int = 30
+    days: int = 30,
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Get call history.
     Returns a list of calls sorted by timestamp.
     Only shows calls from December 13, 2025 onwards.
+    Reads from the local call store, which is kept current by the background sync.
     """
     try:
-        from datetime import timedelta
+        calls = await call_store.find_calls(
+            db,
+            start_ms=call_store.period_start_ms(days),
+            agent_id=agent_id,
+            limit=limit
+        )
         
         history = []
-        
-        # Calculate time range - but never go before Dec 13, 2025
-        end_timestamp = int(datetime.now().timestamp() * 1000)
-        calculated_start = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
-        # Use the later of the two dates (cutoff or calculated start)
-        start_timestamp = max(calculated_start, CUTOFF_TIMESTAMP_MS)
-        
-        logger.info(f"Fetching calls from {start_timestamp} to {end_timestamp} (cutoff: {CUTOFF_TIMESTAMP_MS})")
-        
-        # Get calls
-        try:
-            call_params = {
-                "limit": limit * 2,  # Fetch more since we'll filter
-                "start_timestamp": start_timestamp,
-                "end_timestamp": end_timestamp
-            }
-            if agent_id:
-                call_params["agent_id"] = agent_id
-            
-            calls_response = await make_retell_request("POST", "/v2/list-calls", call_params)
-            calls = calls_response if isinstance(calls_response, list) else calls_response.get("calls", [])
-            
-            for call in calls:
-                # Double-check: skip calls before cutoff date
-                call_timestamp = call.get("start_timestamp", 0) or call.get("created_timestamp", 0)
-                if call_timestamp < CUTOFF_TIMESTAMP_MS:
-                    logger.debug(f"Skipping call {call.get('call_id')} - before cutoff date")
-                    continue
-                
-                history.append({
-                    "id": call.get("call_id"),
-                    "type": "call",
-                    "agent_id": call.get("agent_id"),
-                    "status": call.get("call_status"),
-                    "start_timestamp": call.get("start_timestamp"),
-                    "end_timestamp": call.get("end_timestamp"),
-                    "duration_ms": call.get("duration_ms"),
-                    "transcript": call.get("transcript", []),
-                    "transcript_object": call.get("transcript_object", []),
-                    "recording_url": call.get("recording_url"),
-                    "public_log_url": call.get("public_log_url"),
-                    "call_type": call.get("call_type"),
-                    "from_number": call.get("from_number"),
-                    "to_number": call.get("to_number"),
-                    "disconnection_reason": call.get("disconnection_reason"),
-                    "call_analysis": call.get("call_analysis", {}),
-                    "call_cost": call.get("call_cost", {}),
-                    "metadata": call.get("metadata", {})
-                })
-        except Exception as e:
-            logger.warning(f"Error fetching calls: {str(e)}")
-        
-        # Sort by start timestamp (most recent first) and apply limit
-        history.sort(key=lambda x: x.get("start_timestamp", 0), reverse=True)
-        history = history[:limit]
+        for call in calls:
+            history.append({
+                "id": call.get("call_id"),
+                "type": "call",
+                "agent_id": call.get("agent_id"),
+                "status": call.get("call_status"),
+                "start_timestamp": call.get("start_timestamp"),
+                "end_timestamp": call.get("end_timestamp"),
+                "duration_ms": call.get("duration_ms"),
+                "transcript": call.get("transcript", []),
+                "transcript_object": call.get("transcript_object", []),
+                "recording_url": call.get("recording_url"),
+                "public_log_url": call.get("public_log_url"),
+                "call_type": call.get("call_type"),
+                "from_number": call.get("from_number"),
+                "to_number": call.get("to_number"),
+                "disconnection_reason": call.get("disconnection_reason"),
+                "call_analysis": call.get("call_analysis", {}),
+                "call_cost": call.get("call_cost", {}),
+                "metadata": call.get("metadata", {})
+            })
         
         return {
             "conversations": history,
@@ -527,12 +445,118 @@ async def get_call_history(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/calls/sync")
+async def sync_calls_to_db(db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Pull new and updated calls from Retell into the local call store now"""
+    try:
+        result = await call_store.sync_calls(db)
+        return {"success": True, **result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error syncing calls: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ========== CALL EVENT WEBHOOK ==========
+
+WEBHOOK_EVENTS = ("call_started", "call_ended", "call_analyzed")
+WEBHOOK_TOLERANCE_MS = 5 * 60 * 1000
+# Local development only: accept unsigned webhooks while no key is configured
+WEBHOOK_ALLOW_UNSIGNED = os.environ.get("RETELL_WEBHOOK_ALLOW_UNSIGNED", "false").lower() in ("1", "true", "yes")
+
+
+def get_webhook_key() -> Optional[str]:
+    return os.environ.get("RETELL_WEBHOOK_KEY") or get_retell_api_key()
+
+
+def verify_retell_signature(body: str, signature: str, api_key: str) -> bool:
+    """
+    Verify a Retell webhook signature ("v=<timestamp>,d=<hex digest>").
+    The digest is HMAC-SHA256 of body + timestamp keyed with the API key.
+    """
+    match = re.match(r"v=(\d+),d=(.*)", signature or "")
+    if not match:
+        return False
+
+    timestamp = int(match.group(1))
+    if abs(int(time.time() * 1000) - timestamp) > WEBHOOK_TOLERANCE_MS:
+        logger.warning("Retell webhook timestamp outside tolerance window")
+        return False
+
+    expected = hmac.new(
+        api_key.encode("utf-8"),
+        (body + str(timestamp)).encode("utf-8"),
+        hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected, match.group(2))
+
+
+@router.post("/webhook")
+async def handle_retell_webhook(request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Receive Retell call events (call_started, call_ended, call_analyzed).
+    Events are deduplicated by call id + event type and upserted into the
+    local call store, so analytics stay fresh without polling list-calls.
+    """
+    import json
+    
+    body = (await request.body()).decode("utf-8")
+    api_key = get_webhook_key()
+    if not api_key:
+        if not WEBHOOK_ALLOW_UNSIGNED:
+            logger.error("Retell webhook rejected: neither RETELL_WEBHOOK_KEY nor RETELL_API_KEY is configured")
+            raise HTTPException(status_code=503, detail="Webhook signature verification is not configured")
+        logger.warning("RETELL_WEBHOOK_ALLOW_UNSIGNED is set, accepting unsigned Retell webhook")
+    elif not verify_retell_signature(body, request.headers.get("x-retell-signature", ""), api_key):
+        logger.error("Invalid Retell webhook signature")
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    
+    event = payload.get("event", "")
+    call = payload.get("call") or {}
+    call_id = call.get("call_id")
+    
+    if event not in WEBHOOK_EVENTS or not call_id:
+        logger.info(f"Ignoring Retell webhook event: {event}")
+        return {"success": True, "event": event, "processed": False}
+    
+    # Retell retries deliveries - only process each call/event pair once
+    try:
+        await db.webhook_events.insert_one({
+            "_id": f"{call_id}:{event}",
+            "call_id": call_id,
+            "event": event,
+            "received_at": datetime.now(timezone.utc)
+        })
+    except DuplicateKeyError:
+        logger.info(f"Duplicate Retell webhook {event} for call {call_id}")
+        return {"success": True, "event": event, "processed": False, "duplicate": True}
+    
+    try:
+        # call_started can arrive after later events; never let it overwrite them
+        await call_store.upsert_calls(db, [call], insert_only=(event == "call_started"))
+    except Exception as e:
+        # Allow Retell's retry to reprocess this event
+        await db.webhook_events.delete_one({"_id": f"{call_id}:{event}"})
+        logger.error(f"Error storing Retell webhook {event} for call {call_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    logger.info(f"Processed Retell webhook {event} for call {call_id}")
+    return {"success": True, "event": event, "call_id": call_id, "processed": True}
+
+
 # ========== UTILITY ENDPOINTS ==========
 
 @router.get("/test-api-key")
 async def test_retell_api_key():
     """Test if the Retell API key is valid"""
-    if not RETELL_API_KEY:
+    api_key = get_retell_api_key()
+    if not api_key:
         return {
             "success": False,
             "error": "RETELL_API_KEY not configured",
@@ -545,7 +569,7 @@ async def test_retell_api_key():
             "success": True,
             "message": "Voice Platform API key is valid",
             "key_present": True,
-            "key_prefix": RETELL_API_KEY[:12] + "...",
+            "key_prefix": api_key[:12] + "...",
             "agents_count": len(response) if isinstance(response, list) else 0
         }
     except HTTPException as e:
@@ -553,110 +577,143 @@ async def test_retell_api_key():
             "success": False,
             "error": str(e.detail),
             "key_present": True,
-            "key_prefix": RETELL_API_KEY[:12] + "...",
+            "key_prefix": api_key[:12] + "...",
             "status_code": e.status_code
         }
 
 
+SYNC_LLM_CONCURRENCY = int(os.environ.get("RETELL_SYNC_LLM_CONCURRENCY", "8"))
+
+
+def build_imported_agent(retell_agent: Dict[str, Any], llm_id: Optional[str], system_prompt: str) -> Dict[str, Any]:
+    """Local agent record for an agent created directly in Retell"""
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "name": retell_agent.get("agent_name", "Unnamed Agent"),
+        "description": f"Imported from Cloud",
+        "type": "voice",
+        "status": "active",
+        "system_prompt": system_prompt,
+        "greeting_message": "Hello! How can I help you today?",
+        "voice_config": {
+            "voice_id": retell_agent.get("voice_id", "11labs-Adrian"),
+            "language": retell_agent.get("language", "en-US"),
+            "responsiveness": retell_agent.get("responsiveness", 1.0),
+            "interruption_sensitivity": retell_agent.get("interruption_sensitivity", 1.0),
+            "enable_backchannel": retell_agent.get("enable_backchannel", True),
+        },
+        "chat_config": {
+            "llm_provider": "openai",
+            "llm_model": "gpt-4o",
+            "temperature": 0.7,
+            "max_tokens": 2048,
+        },
+        "tools": [],
+        "knowledge_bases": [],
+        "retell_agent_id": retell_agent.get("agent_id"),
+        "retell_llm_id": llm_id,
+        "retell_last_modification_timestamp": retell_agent.get("last_modification_timestamp"),
+        "calls_count": 0,
+        "success_rate": 0.0,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
 @router.post("/sync-agents")
-async def sync_retell_agents_to_db():
+async def sync_retell_agents_to_db(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Sync all Retell agents to the local database.
     This imports agents created directly in Retell dashboard.
+    Diff-based: one read of the local rows, concurrent LLM lookups for new
+    agents only, and a single bulk write.
     """
     try:
-        from motor.motor_asyncio import AsyncIOMotorClient
-        import uuid
-        
-        mongo_url = os.environ['MONGO_URL']
-        db_name = os.environ['DB_NAME']
-        client = AsyncIOMotorClient(mongo_url)
-        db = client[db_name]
-        
         # Get all agents from Retell
         retell_agents = await make_retell_request("GET", "/list-agents")
         
         if not isinstance(retell_agents, list):
             retell_agents = []
+        retell_agent_cache.set_agents(retell_agents)
         
-        synced_count = 0
-        created_count = 0
-        
+        # list-agents can return several versions of an agent; keep the latest
+        latest: Dict[str, Dict[str, Any]] = {}
         for retell_agent in retell_agents:
             retell_agent_id = retell_agent.get("agent_id")
-            agent_name = retell_agent.get("agent_name", "Unnamed Agent")
-            
-            # Check if agent already exists in local DB (by retell_agent_id)
-            existing = await db.agents.find_one({"retell_agent_id": retell_agent_id})
+            if not retell_agent_id:
+                continue
+            current = latest.get(retell_agent_id)
+            if current is None or (retell_agent.get("last_modification_timestamp") or 0) >= (current.get("last_modification_timestamp") or 0):
+                latest[retell_agent_id] = retell_agent
+        
+        # All existing local rows in one query
+        existing = {
+            doc["retell_agent_id"]: doc async for doc in db.agents.find(
+                {"retell_agent_id": {"$in": list(latest)}},
+                {"_id": 0, "retell_agent_id": 1, "name": 1, "retell_last_modification_timestamp": 1}
+            )
+        }
+        
+        new_agents = [a for agent_id, a in latest.items() if agent_id not in existing]
+        
+        # Fetch system prompts for new agents concurrently
+        semaphore = asyncio.Semaphore(SYNC_LLM_CONCURRENCY)
+        
+        async def import_agent(retell_agent: Dict[str, Any]) -> Dict[str, Any]:
+            response_engine = retell_agent.get("response_engine", {})
+            llm_id = response_engine.get("llm_id") if isinstance(response_engine, dict) else None
             
-            if not existing:
-                # Create local record for this Retell agent
-                response_engine = retell_agent.get("response_engine", {})
-                llm_id = response_engine.get("llm_id") if isinstance(response_engine, dict) else None
-                
-                # Try to get the system prompt from the LLM
-                system_prompt = "Voice agent created from cloud dashboard"
-                if llm_id:
-                    try:
+            # Try to get the system prompt from the LLM
+            system_prompt = "Voice agent created from cloud dashboard"
+            if llm_id:
+                try:
+                    async with semaphore:
                         llm_details = await make_retell_request("GET", f"/get-retell-llm/{llm_id}")
-                        system_prompt = llm_details.get("general_prompt", system_prompt)
-                    except:
-                        pass
-                
-                new_agent = {
-                    "id": str(uuid.uuid4()),
-                    "name": agent_name,
-                    "description": f"Imported from Cloud",
-                    "type": "voice",
-                    "status": "active",
-                    "system_prompt": system_prompt,
-                    "greeting_message": "Hello! How can I help you today?",
-                    "voice_config": {
-                        "voice_id": retell_agent.get("voice_id", "11labs-Adrian"),
-                        "language": retell_agent.get("language", "en-US"),
-                        "responsiveness": retell_agent.get("responsiveness", 1.0),
-                        "interruption_sensitivity": retell_agent.get("interruption_sensitivity", 1.0),
-                        "enable_backchannel": retell_agent.get("enable_backchannel", True),
-                    },
-                    "chat_config": {
-                        "llm_provider": "openai",
-                        "llm_model": "gpt-4o",
-                        "temperature": 0.7,
-                        "max_tokens": 2048,
-                    },
-                    "tools": [],
-                    "knowledge_bases": [],
-                    "retell_agent_id": retell_agent_id,
-                    "retell_llm_id": llm_id,
-                    "calls_count": 0,
-                    "success_rate": 0.0,
-                    "created_at": datetime.utcnow().isoformat(),
-                    "updated_at": datetime.utcnow().isoformat(),
-                }
-                
-                await db.agents.insert_one(new_agent)
-                created_count += 1
-                logger.info(f"Imported Retell agent: {agent_name} ({retell_agent_id})")
-            else:
-                # Update existing agent's Retell data
-                await db.agents.update_one(
-                    {"retell_agent_id": retell_agent_id},
-                    {"$set": {
-                        "name": agent_name,
-                        "updated_at": datetime.utcnow().isoformat()
-                    }}
-                )
+                    system_prompt = llm_details.get("general_prompt", system_prompt)
+                except Exception as e:
+                    logger.warning(f"Could not fetch LLM {llm_id} for agent {retell_agent.get('agent_id')}: {e}")
             
-            synced_count += 1
+            return build_imported_agent(retell_agent, llm_id, system_prompt)
+        
+        imported = await asyncio.gather(*(import_agent(a) for a in new_agents))
+        operations = [InsertOne(doc) for doc in imported]
+        
+        # Update existing agents' Retell data, skipping unchanged ones
+        updated_count = 0
+        for retell_agent_id, local in existing.items():
+            retell_agent = latest[retell_agent_id]
+            modified = retell_agent.get("last_modification_timestamp")
+            agent_name = retell_agent.get("agent_name", "Unnamed Agent")
+            if modified and modified == local.get("retell_last_modification_timestamp") and agent_name == local.get("name"):
+                continue
+            operations.append(UpdateOne(
+                {"retell_agent_id": retell_agent_id},
+                {"$set": {
+                    "name": agent_name,
+                    "retell_last_modification_timestamp": modified,
+                    "updated_at": datetime.now(timezone.utc)
+                }}
+            ))
+            updated_count += 1
+        
+        if operations:
+            await db.agents.bulk_write(operations, ordered=False)
+        
+        for doc in imported:
+            logger.info(f"Imported Retell agent: {doc['name']} ({doc['retell_agent_id']})")
         
-        client.close()
+        synced_count = len(latest)
+        created_count = len(imported)
         
         return {
             "success": True,
             "message": f"Synced {synced_count} agents from cloud",
             "total_retell_agents": len(retell_agents),
             "newly_imported": created_count,
-            "already_synced": synced_count - created_count
+            "already_synced": synced_count - created_count,
+            "updated": updated_count,
+            "unchanged": synced_count - created_count - updated_count
         }
         
     except Exception as e:
@@ -665,45 +722,28 @@ async def sync_retell_agents_to_db():
 
 
 @router.get("/analytics/overview")
-async def get_analytics_overview(days: int = 7, agent_id: Optional[str] = None):
+async def get_analytics_overview(
+    days: int = 7,
+    agent_id: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
     """Get analytics overview for calls (only from Dec 13, 2025 onwards)"""
     try:
-        from datetime import timedelta
-        
-        end_timestamp = int(datetime.now().timestamp() * 1000)
-        calculated_start = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
-        # Use the later of the two dates (cutoff or calculated start)
-        start_timestamp = max(calculated_start, CUTOFF_TIMESTAMP_MS)
-        
-        params = {
-            "limit": 100,
-            "start_timestamp": start_timestamp,
-            "end_timestamp": end_timestamp
-        }
-        if agent_id:
-            params["agent_id"] = agent_id
-        
-        response = await make_retell_request("POST", "/v2/list-calls", params)
-        calls = response if isinstance(response, list) else response.get("calls", [])
+        summary = await call_store.summarize_calls(db, start_ms=call_store.period_start_ms(days), agent_id=agent_id)
         
         # Calculate metrics
-        total_calls = len(calls)
-        successful_calls = sum(1 for c in calls if c.get("call_status") == "ended")
-        total_duration = sum(c.get("duration_ms", 0) for c in calls)
-        total_cost = sum(
-            c.get("call_cost", {}).get("combined_cost", 0) 
-            for c in calls if c.get("call_cost")
-        )
+        total_calls = summary["total_calls"]
+        successful_calls = summary["successful_calls"]
+        total_duration = summary["total_duration_ms"]
+        total_cost = summary["total_cost"]
         
         # Sentiment analysis
         sentiments = {"positive": 0, "neutral": 0, "negative": 0, "unknown": 0}
-        for call in calls:
-            analysis = call.get("call_analysis", {})
-            sentiment = analysis.get("user_sentiment", "unknown").lower()
+        for sentiment, count in summary["sentiments"].items():
             if sentiment in sentiments:
-                sentiments[sentiment] += 1
+                sentiments[sentiment] += count
             else:
-                sentiments["unknown"] += 1
+                sentiments["unknown"] += count
         
         return {
             "period_days": days,
@@ -750,138 +790,35 @@ class AddKnowledgeBaseSourcesRequest(BaseModel):
     )
 
 
-async def make_retell_multipart_request(
-    endpoint: str, 
-    form_data: dict,
-    timeout: float = 60.0
-) -> dict:
-    """Make multipart/form-data request to Retell API (for knowledge base creation)"""
-    import json
-    
-    if not RETELL_API_KEY:
-        raise HTTPException(
-            status_code=500, 
-            detail="RETELL_API_KEY not configured. Add it to your .env file."
-        )
-    
-    headers = {
-        "Authorization": f"Bearer {RETELL_API_KEY}",
-    }
-    
-    url = f"{RETELL_API_BASE}{endpoint}"
-    logger.info(f"Retell API (multipart): POST {endpoint}")
-    logger.info(f"Form data keys: {list(form_data.keys())}")
-    
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        try:
-            # Build the multipart files dict - httpx needs this format for multipart
-            files = {}
-            
-            # knowledge_base_name is a simple form field
-            if "knowledge_base_name" in form_data:
-                files["knowledge_base_name"] = (None, form_data["knowledge_base_name"])
-            
-            # knowledge_base_texts needs to be sent as individual items or JSON
-            if "knowledge_base_texts" in form_data and form_data["knowledge_base_texts"]:
-                texts = form_data["knowledge_base_texts"]
-                files["knowledge_base_texts"] = (None, json.dumps(texts), "application/json")
-            
-            # knowledge_base_urls needs to be sent as JSON array
-            if "knowledge_base_urls" in form_data and form_data["knowledge_base_urls"]:
-                urls = form_data["knowledge_base_urls"]
-                files["knowledge_base_urls"] = (None, json.dumps(urls), "application/json")
-            
-            # enable_auto_refresh
-            if "enable_auto_refresh" in form_data:
-                files["enable_auto_refresh"] = (None, str(form_data["enable_auto_refresh"]).lower())
-            
-            logger.info(f"Sending multipart files: {list(files.keys())}")
-            
-            response = await client.post(url, headers=headers, files=files)
-            
-            logger.info(f"Retell API response: {response.status_code}")
-            logger.info(f"Retell API response body: {response.text[:500] if response.text else 'empty'}")
-            
-            if response.status_code >= 400:
-                error_detail = response.text
-                logger.error(f"Retell API raw error response: {error_detail}")
-                try:
-                    error_json = response.json()
-                    logger.error(f"Retell API error JSON: {error_json}")
-                    error_detail = error_json.get("message", error_detail)
-                except:
-                    pass
-                raise HTTPException(status_code=response.status_code, detail=error_detail)
-            
-            return response.json() if response.text else {"success": True}
-            
-        except httpx.RequestError as e:
-            logger.error(f"Retell API connection error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to connect to Voice Platform API: {str(e)}")
-
-
 @router.post("/knowledge-bases", response_model=Dict[str, Any])
 async def create_knowledge_base(request: CreateKnowledgeBaseRequest):
     """
     Create a new knowledge base in Retell.
     Knowledge bases can be attached to agents for RAG (Retrieval-Augmented Generation).
     """
-    import json
-    import aiohttp
-    
     try:
         logger.info(f"Creating knowledge base: {request.knowledge_base_name}")
         
         kb_name = request.knowledge_base_name.strip()[:40]  # Max 40 chars
         
-        # Prepare the multipart form data using aiohttp FormData
-        form = aiohttp.FormData()
-        form.add_field('knowledge_base_name', kb_name)
-        
-        has_sources = False
+        form_data = {"knowledge_base_name": kb_name}
         
         # Add text sources if provided
         if request.knowledge_base_texts and len(request.knowledge_base_texts) > 0:
-            form.add_field('knowledge_base_texts', json.dumps(request.knowledge_base_texts), 
-                          content_type='application/json')
-            has_sources = True
+            form_data["knowledge_base_texts"] = request.knowledge_base_texts
         
         # Add URL sources if provided
         if request.knowledge_base_urls:
             clean_urls = [url.strip() for url in request.knowledge_base_urls 
                          if url.strip() and url.strip().startswith(('http://', 'https://'))]
             if clean_urls:
-                form.add_field('knowledge_base_urls', json.dumps(clean_urls),
-                              content_type='application/json')
-                has_sources = True
+                form_data["knowledge_base_urls"] = clean_urls
         
         # If no sources provided, add a default placeholder text
-        if not has_sources:
-            default_text = [{"title": "Welcome", "text": f"Welcome to {kb_name}. Add your content here."}]
-            form.add_field('knowledge_base_texts', json.dumps(default_text),
-                          content_type='application/json')
+        if "knowledge_base_texts" not in form_data and "knowledge_base_urls" not in form_data:
+            form_data["knowledge_base_texts"] = [{"title": "Welcome", "text": f"Welcome to {kb_name}. Add your content here."}]
         
-        headers = {
-            "Authorization": f"Bearer {RETELL_API_KEY}",
-        }
-        
-        logger.info(f"Sending request to Retell with form data")
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{RETELL_API_BASE}/create-knowledge-base",
-                headers=headers,
-                data=form
-            ) as response:
-                response_text = await response.text()
-                logger.info(f"Retell API response: {response.status}")
-                logger.info(f"Retell API response body: {response_text[:500]}")
-                
-                if response.status >= 400:
-                    logger.error(f"Retell API error: {response_text}")
-                    raise HTTPException(status_code=response.status, detail=response_text)
-                
-                data = await response.json()
+        data = await make_retell_multipart_request("/create-knowledge-base", form_data)
         
         return {
             "success": True,
@@ -995,20 +932,12 @@ async def delete_knowledge_base_source(knowledge_base_id: str, source_id: str):
 
 
 @router.post("/knowledge-bases/sync")
-async def sync_knowledge_bases_to_db():
+async def sync_knowledge_bases_to_db(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Sync all Retell knowledge bases to the local database.
     This imports knowledge bases created directly in Retell dashboard.
     """
     try:
-        from motor.motor_asyncio import AsyncIOMotorClient
-        import uuid
-        
-        mongo_url = os.environ['MONGO_URL']
-        db_name = os.environ['DB_NAME']
-        client = AsyncIOMotorClient(mongo_url)
-        db = client[db_name]
-        
         # Get all knowledge bases from Retell
         retell_kbs = await make_retell_request("GET", "/list-knowledge-bases")
         
@@ -1041,7 +970,7 @@ async def sync_knowledge_bases_to_db():
                     "type": "documents",
                     "documents_count": documents_count,
                     "retell_kb_id": kb_id,
-                    "created_at": datetime.utcnow().isoformat(),
+                    "created_at": datetime.now(timezone.utc),
                 }
                 
                 await db.knowledge.insert_one(new_kb)
@@ -1066,8 +995,6 @@ async def sync_knowledge_bases_to_db():
             
             synced_count += 1
         
-        client.close()
-        
         return {
             "success": True,
             "message": f"Synced {synced_count} knowledge bases",
@@ -1122,6 +1049,7 @@ class TestCaseScenario(BaseModel):
     description: Optional[str] = None
     user_message: str  # What the user says to start the test
     expected_topics: Optional[List[str]] = []  # Topics agent should cover
+    topic_synonyms: Optional[Dict[str, List[str]]] = None  # Alternative phrasings per topic
     expected_actions: Optional[List[str]] = []  # Actions agent should take
     max_turns: Optional[int] = 10
     success_criteria: Optional[str] = None  # Natural language success criteria
@@ -1139,10 +1067,12 @@ class RunBatchTestRequest(BaseModel):
     test_case_definition_ids: List[str]
     agent_id: str
     concurrency: Optional[int] = 1
+    use_cache: Optional[bool] = None  # False re-asks the agent instead of reusing cached replies
+    multi_turn: Optional[bool] = False  # Simulate up to max_turns exchanges locally with an LLM caller
 
 
 @router.post("/test-cases")
-async def create_test_case_definition(request: CreateTestCaseRequest):
+async def create_test_case_definition(request: CreateTestCaseRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Create a test case definition for agent evaluation.
     Test cases define scenarios to test agent behavior.
@@ -1172,8 +1102,6 @@ async def create_test_case_definition(request: CreateTestCaseRequest):
             test_case_id = f"tc_{uuid.uuid4().hex[:16]}"
         
         # Store in local database
-        client, db = get_db()
-        
         test_case = {
             "id": test_case_id,
             "retell_id": test_case_id,
@@ -1182,14 +1110,13 @@ async def create_test_case_definition(request: CreateTestCaseRequest):
             "description": request.description,
             "scenarios": [s.dict() for s in request.scenarios],
             "tags": request.tags,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc),
             "run_count": 0,
             "pass_rate": 0.0
         }
         
         await db.test_cases.insert_one(test_case)
-        client.close()
         
         return {
             "success": True,
@@ -1205,17 +1132,14 @@ async def create_test_case_definition(request: CreateTestCaseRequest):
 
 
 @router.get("/test-cases")
-async def list_test_cases(agent_id: Optional[str] = None):
+async def list_test_cases(agent_id: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_database)):
     """List all test case definitions, optionally filtered by agent"""
     try:
-        client, db = get_db()
-        
         query = {}
         if agent_id:
             query["agent_id"] = agent_id
         
         test_cases = await db.test_cases.find(query, {"_id": 0}).to_list(100)
-        client.close()
         
         return test_cases
         
@@ -1225,13 +1149,10 @@ async def list_test_cases(agent_id: Optional[str] = None):
 
 
 @router.get("/test-cases/{test_case_id}")
-async def get_test_case(test_case_id: str):
+async def get_test_case(test_case_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get details of a specific test case definition"""
     try:
-        client, db = get_db()
-        
         test_case = await db.test_cases.find_one({"id": test_case_id}, {"_id": 0})
-        client.close()
         
         if not test_case:
             raise HTTPException(status_code=404, detail="Test case not found")
@@ -1246,13 +1167,10 @@ async def get_test_case(test_case_id: str):
 
 
 @router.delete("/test-cases/{test_case_id}")
-async def delete_test_case(test_case_id: str):
+async def delete_test_case(test_case_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Delete a test case definition"""
     try:
-        client, db = get_db()
-        
         result = await db.test_cases.delete_one({"id": test_case_id})
-        client.close()
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Test case not found")
@@ -1267,7 +1185,7 @@ async def delete_test_case(test_case_id: str):
 
 
 @router.post("/batch-tests")
-async def create_batch_test(request: RunBatchTestRequest):
+async def create_batch_test(request: RunBatchTestRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Create and run a batch test with multiple test cases.
     This will execute all scenarios in the specified test cases against the agent.
@@ -1275,8 +1193,6 @@ async def create_batch_test(request: RunBatchTestRequest):
     try:
         logger.info(f"Creating batch test with {len(request.test_case_definition_ids)} test cases")
         
-        client, db = get_db()
-        
         # Get all test case definitions
         test_cases = await db.test_cases.find(
             {"id": {"$in": request.test_case_definition_ids}},
@@ -1299,73 +1215,82 @@ async def create_batch_test(request: RunBatchTestRequest):
             "pass_count": 0,
             "fail_count": 0,
             "error_count": 0,
+            "completed_count": 0,
             "total_count": total_scenarios,
+            "concurrency": request.concurrency or 1,
+            "use_cache": request.use_cache,
+            "multi_turn": request.multi_turn,
             "results": [],
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
         }
         
         await db.batch_tests.insert_one(batch_job)
         
         # Try to run via Retell API for actual voice calls
         use_retell_api = False
-        try:
-            # Get agent's response engine config from Retell
-            agent = await make_retell_request("GET", f"/get-agent/{request.agent_id}")
-            logger.info(f"Agent config for batch test: {agent}")
+        # Multi-turn runs are simulated locally, without spending voice minutes
+        if not request.multi_turn:
+            try:
+                # Get agent's response engine config from Retell
+                agent = await make_retell_request("GET", f"/get-agent/{request.agent_id}")
+                log_payload(logger, "Agent config for batch test", agent)
             
-            # Get the LLM ID - try multiple possible field names
-            llm_id = agent.get("response_engine", {}).get("llm_id") if isinstance(agent.get("response_engine"), dict) else None
+                # Get the LLM ID - try multiple possible field names
+                llm_id = agent.get("response_engine", {}).get("llm_id") if isinstance(agent.get("response_engine"), dict) else None
             
-            # Alternative: check if agent has llm_websocket_url with llm_ prefix
-            if not llm_id:
-                llm_ws = agent.get("llm_websocket_url", "")
-                if llm_ws and "llm_" in llm_ws:
-                    # Extract llm_id from websocket URL like wss://api.retellai.com/llm/llm_xxx
-                    parts = llm_ws.split("/")
-                    for part in parts:
-                        if part.startswith("llm_"):
-                            llm_id = part
-                            break
+                # Alternative: check if agent has llm_websocket_url with llm_ prefix
+                if not llm_id:
+                    llm_ws = agent.get("llm_websocket_url", "")
+                    if llm_ws and "llm_" in llm_ws:
+                        # Extract llm_id from websocket URL like wss://api.retellai.com/llm/llm_xxx
+                        parts = llm_ws.split("/")
+                        for part in parts:
+                            if part.startswith("llm_"):
+                                llm_id = part
+                                break
             
-            if llm_id:
-                logger.info(f"Using Retell LLM ID: {llm_id}")
-                retell_request = {
-                    "test_case_definition_ids": request.test_case_definition_ids,
-                    "response_engine": {
-                        "type": "retell-llm",
-                        "llm_id": llm_id
-                    },
-                    "reserved_concurrency": request.concurrency or 1
-                }
+                if llm_id:
+                    logger.info(f"Using Retell LLM ID: {llm_id}")
+                    retell_request = {
+                        "test_case_definition_ids": request.test_case_definition_ids,
+                        "response_engine": {
+                            "type": "retell-llm",
+                            "llm_id": llm_id
+                        },
+                        "reserved_concurrency": request.concurrency or 1
+                    }
                 
-                response = await make_retell_request("POST", "/create-batch-test", retell_request)
+                    response = await make_retell_request("POST", "/create-batch-test", retell_request)
                 
-                # Update with Retell batch job ID
-                await db.batch_tests.update_one(
-                    {"id": batch_job_id},
-                    {"$set": {
-                        "retell_batch_id": response.get("test_case_batch_job_id"),
-                        "test_type": "voice_call"
-                    }}
-                )
-                use_retell_api = True
-                logger.info(f"Retell batch test created: {response.get('test_case_batch_job_id')}")
-            else:
-                logger.warning("No LLM ID found for agent, falling back to local simulation")
+                    # Update with Retell batch job ID
+                    await db.batch_tests.update_one(
+                        {"id": batch_job_id},
+                        {"$set": {
+                            "retell_batch_id": response.get("test_case_batch_job_id"),
+                            "test_type": "voice_call"
+                        }}
+                    )
+                    use_retell_api = True
+                    track_retell_batch(db, batch_job_id, response.get("test_case_batch_job_id"))
+                    logger.info(f"Retell batch test created: {response.get('test_case_batch_job_id')}")
+                else:
+                    logger.warning("No LLM ID found for agent, falling back to local simulation")
             
-        except Exception as e:
-            logger.warning(f"Retell batch test API not available, running locally: {e}")
+            except Exception as e:
+                logger.warning(f"Retell batch test API not available, running locally: {e}")
         
-        # Fall back to local text simulation if Retell API didn't work
+        # Fall back to local text simulation if Retell API didn't work (or wasn't wanted)
         if not use_retell_api:
             await db.batch_tests.update_one(
                 {"id": batch_job_id},
                 {"$set": {"test_type": "text_simulation"}}
             )
-            await run_local_batch_test(db, batch_job_id, test_cases, request.agent_id)
-        
-        client.close()
+            # Runs in the background; progress is visible via GET /batch-tests/{id}
+            start_local_batch_test(
+                db, batch_job_id, test_cases, request.agent_id, request.concurrency,
+                use_cache=request.use_cache, multi_turn=request.multi_turn
+            )
         
         return {
             "success": True,
@@ -1382,132 +1307,10 @@ async def create_batch_test(request: RunBatchTestRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def run_local_batch_test(db, batch_job_id: str, test_cases: list, agent_id: str):
-    """Run batch test locally (simulated evaluation)"""
-    import httpx
-    import random
-    
-    results = []
-    pass_count = 0
-    fail_count = 0
-    error_count = 0
-    
-    openai_api_key = os.environ.get('OPENAI_API_KEY')
-    retell_api_key = os.environ.get('RETELL_API_KEY')
-    api_key = openai_api_key or retell_api_key
-    
-    for tc in test_cases:
-        for scenario in tc.get("scenarios", []):
-            try:
-                # Get agent config
-                agent = await db.agents.find_one({"retell_agent_id": agent_id}, {"_id": 0})
-                if not agent:
-                    # Try to get from Retell
-                    try:
-                        retell_agent = await make_retell_request("GET", f"/get-agent/{agent_id}")
-                        system_prompt = "You are a helpful assistant."
-                    except:
-                        system_prompt = "You are a helpful assistant."
-                else:
-                    system_prompt = agent.get("system_prompt", "You are a helpful assistant.")
-                
-                # Simulate agent response using OpenAI
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.post(
-                        "https://api.openai.com/v1/chat/completions",
-                        headers={
-                            "Authorization": f"Bearer {api_key}",
-                            "Content-Type": "application/json"
-                        },
-                        json={
-                            "model": "gpt-4o",
-                            "messages": [
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": scenario.get("user_message", "")}
-                            ],
-                            "temperature": 0.7,
-                            "max_tokens": 1024
-                        }
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        agent_response = data["choices"][0]["message"]["content"]
-                        
-                        # Evaluate response against expected topics
-                        expected_topics = scenario.get("expected_topics", [])
-                        topics_covered = 0
-                        for topic in expected_topics:
-                            if topic.lower() in agent_response.lower():
-                                topics_covered += 1
-                        
-                        # Calculate score
-                        if expected_topics:
-                            score = topics_covered / len(expected_topics)
-                            passed = score >= 0.5
-                        else:
-                            # No specific expectations, consider passed if response is non-empty
-                            passed = len(agent_response) > 10
-                            score = 1.0 if passed else 0.0
-                        
-                        if passed:
-                            pass_count += 1
-                        else:
-                            fail_count += 1
-                        
-                        results.append({
-                            "test_case_id": tc.get("id"),
-                            "scenario_name": scenario.get("name"),
-                            "user_message": scenario.get("user_message"),
-                            "agent_response": agent_response[:500],
-                            "expected_topics": expected_topics,
-                            "topics_covered": topics_covered,
-                            "score": score,
-                            "passed": passed,
-                            "timestamp": datetime.now(timezone.utc).isoformat()
-                        })
-                    else:
-                        error_count += 1
-                        results.append({
-                            "test_case_id": tc.get("id"),
-                            "scenario_name": scenario.get("name"),
-                            "error": f"API error: {response.status_code}",
-                            "passed": False,
-                            "timestamp": datetime.now(timezone.utc).isoformat()
-                        })
-                        
-            except Exception as e:
-                error_count += 1
-                results.append({
-                    "test_case_id": tc.get("id"),
-                    "scenario_name": scenario.get("name", "Unknown"),
-                    "error": str(e),
-                    "passed": False,
-                    "timestamp": datetime.now(timezone.utc).isoformat()
-                })
-    
-    # Update batch job with results
-    total = pass_count + fail_count + error_count
-    await db.batch_tests.update_one(
-        {"id": batch_job_id},
-        {"$set": {
-            "status": "complete",
-            "pass_count": pass_count,
-            "fail_count": fail_count,
-            "error_count": error_count,
-            "results": results,
-            "pass_rate": (pass_count / total * 100) if total > 0 else 0,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
-
-
 @router.get("/batch-tests")
-async def list_batch_tests(agent_id: Optional[str] = None, limit: int = 20):
+async def list_batch_tests(agent_id: Optional[str] = None, limit: int = 20, db: AsyncIOMotorDatabase = Depends(get_database)):
     """List all batch test jobs"""
     try:
-        client, db = get_db()
-        
         query = {}
         if agent_id:
             query["agent_id"] = agent_id
@@ -1517,8 +1320,6 @@ async def list_batch_tests(agent_id: Optional[str] = None, limit: int = 20):
             {"_id": 0, "results": 0}  # Exclude detailed results for list view
         ).sort("created_at", -1).to_list(limit)
         
-        client.close()
-        
         return batch_tests
         
     except Exception as e:
@@ -1527,13 +1328,10 @@ async def list_batch_tests(agent_id: Optional[str] = None, limit: int = 20):
 
 
 @router.get("/batch-tests/{batch_job_id}")
-async def get_batch_test(batch_job_id: str):
+async def get_batch_test(batch_job_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get details and results of a specific batch test"""
     try:
-        client, db = get_db()
-        
         batch_test = await db.batch_tests.find_one({"id": batch_job_id}, {"_id": 0})
-        client.close()
         
         if not batch_test:
             raise HTTPException(status_code=404, detail="Batch test not found")
@@ -1547,12 +1345,43 @@ async def get_batch_test(batch_job_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/batch-tests/{batch_job_id}/events")
+async def stream_batch_test_events(batch_job_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Server-Sent Events stream of batch test progress.
+    Starts with a snapshot of the job (without results), then `result` events
+    per finished scenario (local jobs) or `progress` events when Retell's
+    counters change (Retell-run jobs), ending with a complete/failed event.
+    """
+    topic = batch_topic(batch_job_id)
+    queue = subscribe(topic)
+    try:
+        job = await db.batch_tests.find_one({"id": batch_job_id}, {"_id": 0, "results": 0})
+    except Exception:
+        unsubscribe(topic, queue)
+        raise
+    if not job:
+        unsubscribe(topic, queue)
+        raise HTTPException(status_code=404, detail="Batch test not found")
+    
+    finished = job.get("status") != "in_progress"
+    if not finished and job.get("test_type") in ("voice_call", "simulation"):
+        # Make sure this process is polling Retell for the job
+        track_retell_batch(db, batch_job_id, job.get("retell_batch_id"))
+    return StreamingResponse(
+        sse_stream(queue, topic, {"type": "snapshot", "job": job}, {"complete", "failed"}, finished),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/voice-test")
 async def run_voice_test(
     agent_id: str,
     test_message: str,
     auto_mode: bool = True,
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Run an automated voice test where a simulated caller tests the agent.
@@ -1562,8 +1391,6 @@ async def run_voice_test(
     try:
         logger.info(f"Starting automated voice test for agent {agent_id}")
         
-        client, db = get_db()
-        
         # Create a unique test ID
         test_id = f"vtest_{uuid.uuid4().hex[:16]}"
         
@@ -1598,11 +1425,10 @@ async def run_voice_test(
                 "test_message": test_message,
                 "test_type": "automated",
                 "status": "created",
-                "created_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc)
             }
             
             await db.voice_tests.insert_one(test_call)
-            client.close()
             
             return {
                 "success": True,
@@ -1629,11 +1455,10 @@ async def run_voice_test(
                 "test_message": test_message,
                 "test_type": "manual",
                 "status": "created",
-                "created_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc)
             }
             
             await db.voice_tests.insert_one(test_call)
-            client.close()
             
             return {
                 "success": True,
@@ -1652,29 +1477,25 @@ async def run_voice_test(
 @router.post("/automated-voice-test")
 async def run_automated_voice_test(
     agent_id: str = Body(..., embed=True),
-    test_scenarios: List[str] = Body(..., embed=True)
+    test_scenarios: List[str] = Body(..., embed=True),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Run fully automated voice tests using TTS for the caller.
     Creates multiple test calls where AI speaks the test scenarios.
     """
-    import asyncio
-    
     try:
         logger.info(f"Starting automated voice tests for agent {agent_id} with {len(test_scenarios)} scenarios")
         
-        client, db = get_db()
-        results = []
+        test_ids = [f"auto_{uuid.uuid4().hex[:12]}" for _ in test_scenarios]
         
-        for i, scenario in enumerate(test_scenarios):
-            test_id = f"auto_{uuid.uuid4().hex[:12]}"
-            
+        async def create_call(i: int, scenario: str) -> Dict[str, Any]:
             # Create call with the test scenario
             call_data = {
                 "agent_id": agent_id,
                 "metadata": {
                     "automated_test": True,
-                    "test_id": test_id,
+                    "test_id": test_ids[i],
                     "scenario_index": i,
                     "test_scenario": scenario
                 },
@@ -1682,42 +1503,42 @@ async def run_automated_voice_test(
                     "caller_message": scenario
                 }
             }
-            
-            try:
-                response = await make_retell_request("POST", "/v2/create-web-call", call_data)
-                
-                test_record = {
-                    "id": test_id,
-                    "call_id": response.get("call_id"),
-                    "agent_id": agent_id,
-                    "test_message": scenario,
-                    "test_type": "automated_batch",
-                    "batch_index": i,
-                    "status": "created",
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                
-                await db.voice_tests.insert_one(test_record)
-                
-                results.append({
-                    "test_id": test_id,
-                    "call_id": response.get("call_id"),
-                    "scenario": scenario,
-                    "status": "created"
-                })
-                
-            except Exception as e:
+            return await make_retell_request("POST", "/v2/create-web-call", call_data)
+        
+        # Concurrent, but paced by the shared Retell rate limiter
+        outcomes = await dispatch(test_scenarios, create_call, RETELL_DISPATCH_CONCURRENCY, retell_rate_limiter)
+        
+        results = []
+        test_records = []
+        for i, (scenario, (response, error)) in enumerate(zip(test_scenarios, outcomes)):
+            if error:
                 results.append({
-                    "test_id": test_id,
+                    "test_id": test_ids[i],
                     "scenario": scenario,
                     "status": "error",
-                    "error": str(e)
+                    "error": str(error)
                 })
+                continue
             
-            # Small delay between calls
-            await asyncio.sleep(0.5)
+            test_records.append({
+                "id": test_ids[i],
+                "call_id": response.get("call_id"),
+                "agent_id": agent_id,
+                "test_message": scenario,
+                "test_type": "automated_batch",
+                "batch_index": i,
+                "status": "created",
+                "created_at": datetime.now(timezone.utc)
+            })
+            results.append({
+                "test_id": test_ids[i],
+                "call_id": response.get("call_id"),
+                "scenario": scenario,
+                "status": "created"
+            })
         
-        client.close()
+        if test_records:
+            await db.voice_tests.insert_many(test_records, ordered=False)
         
         created_count = len([r for r in results if r['status'] == 'created'])
         return {
@@ -1736,7 +1557,8 @@ async def run_automated_voice_test(
 @router.post("/run-simulation-test")
 async def run_simulation_test(
     agent_id: str = Body(..., embed=True),
-    test_scenarios: List[str] = Body(..., embed=True)
+    test_scenarios: List[str] = Body(..., embed=True),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Run automated simulation tests using native batch testing.
@@ -1758,53 +1580,53 @@ async def run_simulation_test(
         if not llm_id:
             raise HTTPException(status_code=400, detail="Could not get LLM ID from agent. Make sure agent is properly configured.")
         
+        async def create_test_case(i: int, scenario: str) -> Optional[str]:
+            # Format according to API documentation
+            test_case_data = {
+                "name": f"Auto Test {i+1}: {scenario[:30]}...",
+                "response_engine": {
+                    "type": "retell-llm",
+                    "llm_id": llm_id
+                },
+                "test_case": {
+                    "messages": [
+                        {
+                            "role": "user", 
+                            "content": scenario
+                        }
+                    ]
+                }
+            }
+            
+            log_payload(logger, "Creating test case definition", test_case_data)
+            response = await make_retell_request("POST", "/create-test-case-definition", test_case_data)
+            return response.get("test_case_definition_id")
+        
+        # Create test case definitions for each scenario in the system, paced by the shared Retell rate limiter
+        outcomes = await dispatch(test_scenarios, create_test_case, RETELL_DISPATCH_CONCURRENCY, retell_rate_limiter)
+        
         test_case_ids = []
-        client, db = get_db()
+        local_test_cases = []
+        for i, (scenario, (test_case_id, error)) in enumerate(zip(test_scenarios, outcomes)):
+            if error:
+                logger.warning(f"Failed to create test case for scenario {i+1}: {str(error)}")
+                continue
+            if test_case_id:
+                test_case_ids.append(test_case_id)
+                local_test_cases.append({
+                    "id": test_case_id,
+                    "retell_id": test_case_id,
+                    "name": f"Auto Test {i+1}",
+                    "user_prompt": scenario,
+                    "agent_id": agent_id,
+                    "source": "simulation",
+                    "created_at": datetime.now(timezone.utc)
+                })
         
-        # Create test case definitions for each scenario in the system
-        for i, scenario in enumerate(test_scenarios):
-            try:
-                # Format according to API documentation
-                test_case_data = {
-                    "name": f"Auto Test {i+1}: {scenario[:30]}...",
-                    "response_engine": {
-                        "type": "retell-llm",
-                        "llm_id": llm_id
-                    },
-                    "test_case": {
-                        "messages": [
-                            {
-                                "role": "user", 
-                                "content": scenario
-                            }
-                        ]
-                    }
-                }
-                
-                logger.info(f"Creating test case definition: {test_case_data}")
-                response = await make_retell_request("POST", "/create-test-case-definition", test_case_data)
-                logger.info(f"Test case definition response: {response}")
-                test_case_id = response.get("test_case_definition_id")
-                
-                if test_case_id:
-                    test_case_ids.append(test_case_id)
-                    
-                    # Store locally
-                    await db.test_cases.insert_one({
-                        "id": test_case_id,
-                        "retell_id": test_case_id,
-                        "name": f"Auto Test {i+1}",
-                        "user_prompt": scenario,
-                        "agent_id": agent_id,
-                        "source": "simulation",
-                        "created_at": datetime.now(timezone.utc).isoformat()
-                    })
-                    
-            except Exception as e:
-                logger.warning(f"Failed to create test case for scenario {i+1}: {str(e)}")
+        if local_test_cases:
+            await db.test_cases.insert_many(local_test_cases, ordered=False)
         
         if not test_case_ids:
-            client.close()
             raise HTTPException(status_code=500, detail="Failed to create any test cases")
         
         # Run batch test with all created test cases
@@ -1829,11 +1651,11 @@ async def run_simulation_test(
             "fail_count": batch_response.get("fail_count", 0),
             "total_count": batch_response.get("total_count", len(test_case_ids)),
             "test_type": "simulation",
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         
         await db.batch_tests.insert_one(batch_test)
-        client.close()
+        track_retell_batch(db, batch_test["id"])
         
         return {
             "success": True,
@@ -1851,30 +1673,24 @@ async def run_simulation_test(
 
 
 @router.get("/simulation-test/{batch_job_id}")
-async def get_simulation_test_results(batch_job_id: str):
+async def get_simulation_test_results(batch_job_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Get results of a simulation test batch job.
+    Served from batch_tests, which the background tracker keeps in step with Retell;
+    jobs unknown locally are looked up in Retell directly.
     """
     try:
-        # Try to get from Retell
-        try:
-            response = await make_retell_request("GET", f"/get-batch-test/{batch_job_id}")
-            return response
-        except:
-            pass
+        batch_test = await db.batch_tests.find_one({"id": batch_job_id}, {"_id": 0})
+        if batch_test:
+            if batch_test.get("status") == "in_progress" and batch_test.get("test_type") in ("voice_call", "simulation"):
+                track_retell_batch(db, batch_job_id, batch_test.get("retell_batch_id"))
+            return batch_test
         
-        # Fallback to local DB
-        client, db = get_db()
-        batch_test = await db.batch_tests.find_one({"id": batch_job_id})
-        client.close()
+        return await make_retell_request("GET", f"/get-batch-test/{batch_job_id}")
         
-        if not batch_test:
+    except HTTPException as e:
+        if e.status_code == 404:
             raise HTTPException(status_code=404, detail="Batch test not found")
-        
-        batch_test.pop("_id", None)
-        return batch_test
-        
-    except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error getting simulation test results: {str(e)}")
@@ -1905,37 +1721,81 @@ async def get_voice_test_recording(call_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Concurrent get-call lookups when enriching the voice test list
+VOICE_TEST_ENRICH_CONCURRENCY = int(os.environ.get("RETELL_VOICE_TEST_CONCURRENCY", "8"))
+
+
+def voice_test_call_fields(call: Dict[str, Any]) -> Dict[str, Any]:
+    """Call details shown alongside a voice test"""
+    return {
+        "recording_url": call.get("recording_url"),
+        "transcript": call.get("transcript"),
+        "call_status": call.get("call_status"),
+        "call_type": call.get("call_type"),
+        "duration_ms": call.get("end_timestamp", 0) - call.get("start_timestamp", 0) if call.get("end_timestamp") else None,
+    }
+
+
+def is_call_final(call: Dict[str, Any]) -> bool:
+    """Errored calls never change again; ended calls are final once recording and transcript are processed"""
+    status = call.get("call_status")
+    if status == "error":
+        return True
+    return status == "ended" and bool(call.get("recording_url")) and bool(call.get("transcript"))
+
+
 @router.get("/voice-tests")
-async def list_voice_tests(agent_id: Optional[str] = None, limit: int = 20):
-    """List all voice test calls with their recordings"""
+async def list_voice_tests(agent_id: Optional[str] = None, limit: int = 20, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    List all voice test calls with their recordings.
+    Tests whose call reached a final state carry the details stored on them;
+    the rest are looked up in the local call store, then concurrently in Retell.
+    """
     try:
-        client, db = get_db()
-        
         query = {}
         if agent_id:
             query["agent_id"] = agent_id
         
         tests = await db.voice_tests.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
-        
-        # Enrich with call details from API
-        enriched_tests = []
-        for test in tests:
-            try:
-                if test.get("call_id"):
-                    call = await make_retell_request("GET", f"/v2/get-call/{test['call_id']}")
-                    test["recording_url"] = call.get("recording_url")
-                    test["transcript"] = call.get("transcript")
-                    test["call_status"] = call.get("call_status")
-                    test["call_type"] = call.get("call_type")
-                    test["duration_ms"] = call.get("end_timestamp", 0) - call.get("start_timestamp", 0) if call.get("end_timestamp") else None
-                    # Log for debugging
-                    logger.info(f"Call {test['call_id']}: status={call.get('call_status')}, has_recording={bool(call.get('recording_url'))}, has_transcript={bool(call.get('transcript'))}")
-            except Exception as e:
-                logger.warning(f"Failed to get call details for {test.get('call_id')}: {e}")
-            enriched_tests.append(test)
-        
-        client.close()
-        return enriched_tests
+        pending = [t for t in tests if t.get("call_id") and not t.get("call_final")]
+        calls: Dict[str, Dict[str, Any]] = {}
+        
+        # Calls the background sync already stored need no API round trip
+        if pending:
+            async for call in db.calls.find(
+                {"call_id": {"$in": [t["call_id"] for t in pending]}},
+                {"_id": 0, "call_id": 1, "call_status": 1, "call_type": 1, "recording_url": 1,
+                 "transcript": 1, "start_timestamp": 1, "end_timestamp": 1}
+            ):
+                if is_call_final(call):
+                    calls[call["call_id"]] = call
+        
+        semaphore = asyncio.Semaphore(VOICE_TEST_ENRICH_CONCURRENCY)
+        
+        async def fetch_call(call_id: str):
+            async with semaphore:
+                try:
+                    calls[call_id] = await make_retell_request("GET", f"/v2/get-call/{call_id}")
+                except Exception as e:
+                    logger.warning(f"Failed to get call details for {call_id}: {e}")
+        
+        await asyncio.gather(*(fetch_call(t["call_id"]) for t in pending if t["call_id"] not in calls))
+        
+        # Persist final states so these calls are never fetched again
+        finalized = []
+        for test in pending:
+            call = calls.get(test["call_id"])
+            if not call:
+                continue
+            fields = voice_test_call_fields(call)
+            test.update(fields)
+            if is_call_final(call):
+                test["call_final"] = True
+                finalized.append(UpdateOne({"id": test["id"]}, {"$set": {**fields, "call_final": True}}))
+        if finalized:
+            await db.voice_tests.bulk_write(finalized, ordered=False)
+        
+        return tests
         
     except Exception as e:
         logger.error(f"Error listing voice tests: {str(e)}")
@@ -1946,17 +1806,19 @@ async def list_voice_tests(agent_id: Optional[str] = None, limit: int = 20):
 async def generate_test_scenarios(
     agent_id: str,
     num_scenarios: int = 5,
-    focus_areas: Optional[List[str]] = None
+    focus_areas: Optional[List[str]] = None,
+    use_cache: bool = True,
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Auto-generate test scenarios based on agent configuration.
     Uses AI to create relevant test cases.
+    Pass use_cache=false to get a fresh set for an unchanged prompt.
     """
     try:
         logger.info(f"Generating {num_scenarios} test scenarios for agent {agent_id}")
         
         # Get agent configuration
-        client, db = get_db()
         
         # Try to find agent by retell_agent_id (voice agent) or by id (chat agent)
         agent = await db.agents.find_one(
@@ -1971,14 +1833,11 @@ async def generate_test_scenarios(
                 system_prompt = retell_agent.get("general_prompt", "You are a helpful assistant.")
                 agent_name = retell_agent.get("agent_name", "Agent")
             except:
-                client.close()
                 raise HTTPException(status_code=404, detail=f"Agent not found: {agent_id}")
         else:
             system_prompt = agent.get("system_prompt", "You are a helpful assistant.")
             agent_name = agent.get("name", "Agent")
         
-        client.close()
-        
         # Use GPT to generate test scenarios
         openai_api_key = os.environ.get('OPENAI_API_KEY')
         retell_api_key = os.environ.get('RETELL_API_KEY')
@@ -2016,42 +1875,34 @@ Generate varied scenarios including:
 - Complex multi-part questions
 - Potential confusion scenarios"""
 
-        async with httpx.AsyncClient(timeout=60.0) as http_client:
-            response = await http_client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-4o",
-                    "messages": [
-                        {"role": "system", "content": "You are a QA engineer creating test scenarios for AI agents. Return only valid JSON."},
-                        {"role": "user", "content": generation_prompt}
-                    ],
-                    "temperature": 0.8,
-                    "max_tokens": 2048
-                }
+        try:
+            content = await complete_text(
+                [
+                    {"role": "system", "content": "You are a QA engineer creating test scenarios for AI agents. Return only valid JSON."},
+                    {"role": "user", "content": generation_prompt}
+                ],
+                model="gpt-4o",
+                temperature=0.8,
+                max_tokens=2048,
+                api_key=api_key,
+                purpose="generate_scenarios",
+                cache=use_cache
             )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=500, detail="Failed to generate scenarios")
-            
-            data = response.json()
-            content = data["choices"][0]["message"]["content"]
-            
-            # Parse JSON from response
-            import json
-            # Clean up the response
-            content = content.strip()
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            scenarios = json.loads(content.strip())
+        except LLMError:
+            raise HTTPException(status_code=500, detail="Failed to generate scenarios")
+        
+        # Parse JSON from response
+        import json
+        # Clean up the response
+        content = content.strip()
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.startswith("```"):
+            content = content[3:]
+        if content.endswith("```"):
+            content = content[:-3]
+        
+        scenarios = json.loads(content.strip())
         
         return {
             "success": True,
@@ -2128,7 +1979,7 @@ class UpdateConversationFlowRequest(BaseModel):
 # ========== CONVERSATION FLOW ENDPOINTS ==========
 
 @router.post("/conversation-flows", response_model=Dict[str, Any])
-async def create_conversation_flow(request: CreateConversationFlowRequest):
+async def create_conversation_flow(request: CreateConversationFlowRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Create a new Retell Conversation Flow.
     This creates the flow in Retell and stores metadata locally.
@@ -2159,7 +2010,6 @@ async def create_conversation_flow(request: CreateConversationFlowRequest):
         result = await make_retell_request("POST", "/create-conversation-flow", flow_data)
         
         # Store metadata in our database
-        client, db = get_db()
         flow_record = {
             "id": str(uuid.uuid4()),
             "retell_flow_id": result.get("conversation_flow_id"),
@@ -2168,12 +2018,11 @@ async def create_conversation_flow(request: CreateConversationFlowRequest):
             "model_choice": request.model_choice,
             "nodes_count": len(request.nodes),
             "status": "active",
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc),
         }
         
         await db.conversation_flows.insert_one(flow_record)
-        client.close()
         
         return {
             "success": True,
@@ -2191,7 +2040,7 @@ async def create_conversation_flow(request: CreateConversationFlowRequest):
 
 
 @router.get("/conversation-flows", response_model=List[Dict[str, Any]])
-async def list_conversation_flows():
+async def list_conversation_flows(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     List all conversation flows from Retell and local metadata.
     """
@@ -2200,9 +2049,7 @@ async def list_conversation_flows():
         result = await make_retell_request("GET", "/list-conversation-flows")
         
         # Get local metadata
-        client, db = get_db()
         local_flows = await db.conversation_flows.find().to_list(100)
-        client.close()
         
         # Create lookup for local metadata
         local_lookup = {f.get("retell_flow_id"): f for f in local_flows}
@@ -2237,22 +2084,19 @@ async def list_conversation_flows():
 
 
 @router.get("/conversation-flows/{flow_id}", response_model=Dict[str, Any])
-async def get_conversation_flow(flow_id: str):
+async def get_conversation_flow(flow_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Get a specific conversation flow by ID.
     Supports both local ID and Retell flow ID.
     """
     try:
         # First try to find local metadata
-        client, db = get_db()
         local_flow = await db.conversation_flows.find_one({"id": flow_id})
         
         if not local_flow:
             # Try by retell_flow_id
             local_flow = await db.conversation_flows.find_one({"retell_flow_id": flow_id})
         
-        client.close()
-        
         retell_flow_id = local_flow.get("retell_flow_id") if local_flow else flow_id
         
         # Get full data from Retell
@@ -2275,13 +2119,12 @@ async def get_conversation_flow(flow_id: str):
 
 
 @router.put("/conversation-flows/{flow_id}", response_model=Dict[str, Any])
-async def update_conversation_flow(flow_id: str, request: UpdateConversationFlowRequest):
+async def update_conversation_flow(flow_id: str, request: UpdateConversationFlowRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Update a conversation flow.
     """
     try:
         # Get local record to find retell_flow_id
-        client, db = get_db()
         local_flow = await db.conversation_flows.find_one({"id": flow_id})
         
         if not local_flow:
@@ -2312,7 +2155,7 @@ async def update_conversation_flow(flow_id: str, request: UpdateConversationFlow
         result = await make_retell_request("PATCH", f"/update-conversation-flow/{retell_flow_id}", update_data)
         
         # Update local metadata
-        local_update = {"updated_at": datetime.now(timezone.utc).isoformat()}
+        local_update = {"updated_at": datetime.now(timezone.utc)}
         if request.name:
             local_update["name"] = request.name
         if request.description is not None:
@@ -2326,8 +2169,6 @@ async def update_conversation_flow(flow_id: str, request: UpdateConversationFlow
                 {"$set": local_update}
             )
         
-        client.close()
-        
         return {
             "success": True,
             "flow_id": local_flow.get("id") if local_flow else flow_id,
@@ -2343,13 +2184,12 @@ async def update_conversation_flow(flow_id: str, request: UpdateConversationFlow
 
 
 @router.delete("/conversation-flows/{flow_id}", response_model=Dict[str, Any])
-async def delete_conversation_flow(flow_id: str):
+async def delete_conversation_flow(flow_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Delete a conversation flow.
     """
     try:
         # Get local record
-        client, db = get_db()
         local_flow = await db.conversation_flows.find_one({"id": flow_id})
         
         if not local_flow:
@@ -2364,8 +2204,6 @@ async def delete_conversation_flow(flow_id: str):
         if local_flow:
             await db.conversation_flows.delete_one({"_id": local_flow["_id"]})
         
-        client.close()
-        
         return {
             "success": True,
             "message": f"Conversation flow {flow_id} deleted successfully"
@@ -2399,20 +2237,18 @@ async def get_available_models():
 
 
 @router.post("/conversation-flows/{flow_id}/test", response_model=Dict[str, Any])
-async def test_conversation_flow(flow_id: str):
+async def test_conversation_flow(flow_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Test a conversation flow by creating a temporary agent and starting a web call.
     """
     try:
         # Get local record
-        client, db = get_db()
         local_flow = await db.conversation_flows.find_one({"id": flow_id})
         
         if not local_flow:
             local_flow = await db.conversation_flows.find_one({"retell_flow_id": flow_id})
         
         retell_flow_id = local_flow.get("retell_flow_id") if local_flow else flow_id
-        client.close()
         
         # Create a temporary agent with this conversation flow
         agent_data = {
@@ -4,8 +4,8 @@ Using Retell AI for voice agents
 """
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, BackgroundTasks
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 from contextlib import asynccontextmanager
 import os
 import logging
@@ -13,16 +13,44 @@ from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, date
 from enum import Enum
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from services.retell_client import (
+    start_retell_client,
+    close_retell_client,
+    get_retell_client,
+)
+from services.database import get_client, get_database, close_client, get_pool_stats
+from services.db_bootstrap import bootstrap_database
+from services.background import spawn, cancel_all
+from services.retell_agent_cache import get_valid_agent_ids, refresh_agent_ids
+from services.batch_tests import resume_local_batch_tests
+from services.retell_batch_tracker import resume_retell_batch_trackers
+from services import call_store, call_rollups, chat_sessions, context_window
+from services.events import format_sse
+from services.metrics import MetricsMiddleware, render as render_metrics, track_outbound
+from services.log_config import configure_logging
+from services.llm_gateway import (
+    LLMError,
+    complete_text,
+    start_llm_client,
+    close_llm_client,
+    get_llm_stats,
+)
+from services.llm_router import (
+    route_completion,
+    stream_route_completion,
+    close_provider_clients,
+    get_router_stats,
+)
+
+# MongoDB connection - single shared client for the whole process
+client = get_client()
+db = get_database()
 
 # Lifespan context manager
 @asynccontextmanager
@@ -33,15 +61,45 @@ async def lifespan(app: FastAPI):
     # Check Retell API key
     retell_key = os.environ.get('RETELL_API_KEY')
     if retell_key:
-        logger.info(f"Retell API key configured: {retell_key[:12]}...")
+        logger.info("Retell API key configured")
     else:
         logger.warning("RETELL_API_KEY not configured. Voice features will not work.")
     
+    # Shared keep-alive client for all Retell traffic
+    await start_retell_client()
+    await start_llm_client()
+    
+    # Warm the valid Retell agent ID cache used by GET /api/agents
+    get_valid_agent_ids()
+    
+    # Indexes and ISO-string -> native date migration (idempotent)
+    await bootstrap_database(db)
+    
+    # Local call warehouse, kept current from Retell in the background
+    await call_store.ensure_call_indexes(db)
+    spawn(call_store.backfill_rollups(db), "rollup-backfill")
+    
+    # Write-behind of chat session history
+    spawn(chat_sessions.run_flush_loop(db), "chat-session-flush")
+    
+    # Pick up local batch tests interrupted by a restart
+    spawn(resume_local_batch_tests(db), "batch-test-resume")
+    spawn(resume_retell_batch_trackers(db), "retell-batch-resume")
+    if retell_key and os.environ.get('CALL_SYNC_ENABLED', 'true').lower() == 'true':
+        spawn(call_store.run_call_sync_loop(db), "call-sync")
+    
     yield  # Server is running
     
     # Shutdown
-    client.close()
-    logger.info("MongoDB connection closed")
+    await cancel_all()
+    try:
+        await chat_sessions.flush(db)
+    except Exception as e:
+        logger.warning(f"Final chat session flush failed: {e}")
+    await close_retell_client()
+    await close_llm_client()
+    await close_provider_clients()
+    close_client()
 
 app = FastAPI(title="AI Agent Builder API", version="1.0.0", lifespan=lifespan)
 
@@ -78,6 +136,7 @@ class ChatConfig(BaseModel):
     llm_model: str = "gpt-4o"
     temperature: float = 0.7
     max_tokens: int = 2048
+    summarize_context: Optional[bool] = None  # Rolling summary of old turns (default: CHAT_CONTEXT_SUMMARY)
 
 class AgentCreate(BaseModel):
     name: str
@@ -222,7 +281,7 @@ class ChatRequest(BaseModel):
     agent_id: str
     message: str
     session_id: Optional[str] = None
-    history: List[ChatMessage] = []
+    history: List[ChatMessage] = []  # Only seeds a new session; history is stored server-side
 
 class ChatResponse(BaseModel):
     response: str
@@ -260,6 +319,21 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@api_router.get("/health/db-pool")
+async def db_pool_stats():
+    """MongoDB connection pool settings and counters"""
+    return get_pool_stats()
+
+@api_router.get("/health/llm")
+async def llm_gateway_stats():
+    """LLM gateway settings, per-purpose latency/token counters and provider health"""
+    return {**get_llm_stats(), "routing": get_router_stats()}
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, outbound call and Mongo command latency in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # ========== AGENTS ==========
 @api_router.post("/agents", response_model=Agent)
 async def create_agent(agent_data: AgentCreate):
@@ -275,76 +349,30 @@ async def create_agent(agent_data: AgentCreate):
         knowledge_bases=agent_data.knowledge_bases,
     )
     doc = agent.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.agents.insert_one(doc)
     
     return agent
 
 @api_router.get("/agents", response_model=List[Agent])
 async def list_agents():
-    # Filter to only show agents created from Dec 13, 2025 onwards
-    cutoff_date = datetime(2025, 12, 13, 0, 0, 0, tzinfo=timezone.utc)
-    
-    # First, get list of valid agents from Retell to filter out deleted ones
-    import httpx
-    retell_api_key = os.environ.get('RETELL_API_KEY')
-    valid_retell_agent_ids = set()
-    
-    if retell_api_key:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.retellai.com/list-agents",
-                    headers={"Authorization": f"Bearer {retell_api_key}"},
-                    timeout=10.0
-                )
-                if response.status_code == 200:
-                    retell_agents = response.json()
-                    valid_retell_agent_ids = {a.get("agent_id") for a in retell_agents if a.get("agent_id")}
-        except Exception as e:
-            logging.warning(f"Could not fetch Retell agents for validation: {e}")
-    
-    agents = await db.agents.find({}, {"_id": 0}).to_list(1000)
-    filtered_agents = []
-    
-    for a in agents:
-        # Skip agents that have a retell_agent_id but it's no longer valid in Retell (deleted)
-        retell_id = a.get('retell_agent_id')
-        if retell_id and valid_retell_agent_ids and retell_id not in valid_retell_agent_ids:
-            # This agent was deleted from Retell, skip it
-            continue
-        
-        created_at = a.get('created_at')
-        if isinstance(created_at, str):
-            a['created_at'] = datetime.fromisoformat(created_at)
-        if isinstance(a.get('updated_at'), str):
-            a['updated_at'] = datetime.fromisoformat(a['updated_at'])
-        
-        # Check if agent was created on or after Dec 13, 2025
-        agent_created = a.get('created_at')
-        if agent_created:
-            if isinstance(agent_created, str):
-                agent_created = datetime.fromisoformat(agent_created)
-            if agent_created.tzinfo is None:
-                agent_created = agent_created.replace(tzinfo=timezone.utc)
-            if agent_created >= cutoff_date:
-                filtered_agents.append(a)
-        else:
-            # If no created_at, don't include (older agents)
-            pass
+    # Only show agents created from Dec 13, 2025 onwards (agents without created_at are older)
+    query = {"created_at": {"$gte": call_store.CUTOFF_DATE}}
+    
+    # Hide agents deleted from Retell, using the cached set of valid IDs (never a live call)
+    valid_retell_agent_ids = get_valid_agent_ids()
+    if valid_retell_agent_ids:
+        query["$or"] = [
+            {"retell_agent_id": None},
+            {"retell_agent_id": {"$in": list(valid_retell_agent_ids)}}
+        ]
     
-    return filtered_agents
+    return await db.agents.find(query, {"_id": 0}).sort("created_at", 1).to_list(1000)
 
 @api_router.get("/agents/{agent_id}", response_model=Agent)
 async def get_agent(agent_id: str):
     agent = await db.agents.find_one({"id": agent_id}, {"_id": 0})
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
-    if isinstance(agent.get('created_at'), str):
-        agent['created_at'] = datetime.fromisoformat(agent['created_at'])
-    if isinstance(agent.get('updated_at'), str):
-        agent['updated_at'] = datetime.fromisoformat(agent['updated_at'])
     return agent
 
 @api_router.put("/agents/{agent_id}", response_model=Agent)
@@ -354,7 +382,7 @@ async def update_agent(agent_id: str, agent_data: AgentUpdate):
         update_dict['voice_config'] = update_dict['voice_config']
     if 'chat_config' in update_dict and update_dict['chat_config']:
         update_dict['chat_config'] = update_dict['chat_config']
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
     result = await db.agents.update_one({"id": agent_id}, {"$set": update_dict})
     if result.matched_count == 0:
@@ -373,7 +401,7 @@ async def delete_agent(agent_id: str):
 async def deploy_agent(agent_id: str):
     result = await db.agents.update_one(
         {"id": agent_id}, 
-        {"$set": {"status": "active", "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": "active", "updated_at": datetime.now(timezone.utc)}}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
@@ -394,19 +422,12 @@ async def create_flow(agent_id: str, flow_data: FlowCreate):
         edges=flow_data.edges,
     )
     doc = flow.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.flows.insert_one(doc)
     return flow
 
 @api_router.get("/agents/{agent_id}/flows", response_model=List[Flow])
 async def list_flows(agent_id: str):
     flows = await db.flows.find({"agent_id": agent_id}, {"_id": 0}).to_list(100)
-    for f in flows:
-        if isinstance(f.get('created_at'), str):
-            f['created_at'] = datetime.fromisoformat(f['created_at'])
-        if isinstance(f.get('updated_at'), str):
-            f['updated_at'] = datetime.fromisoformat(f['updated_at'])
     return flows
 
 @api_router.get("/agents/{agent_id}/flows/{flow_id}", response_model=Flow)
@@ -414,16 +435,12 @@ async def get_flow(agent_id: str, flow_id: str):
     flow = await db.flows.find_one({"id": flow_id, "agent_id": agent_id}, {"_id": 0})
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
-    if isinstance(flow.get('created_at'), str):
-        flow['created_at'] = datetime.fromisoformat(flow['created_at'])
-    if isinstance(flow.get('updated_at'), str):
-        flow['updated_at'] = datetime.fromisoformat(flow['updated_at'])
     return flow
 
 @api_router.put("/agents/{agent_id}/flows/{flow_id}", response_model=Flow)
 async def update_flow(agent_id: str, flow_id: str, flow_data: FlowCreate):
     update_dict = flow_data.model_dump()
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
     result = await db.flows.update_one(
         {"id": flow_id, "agent_id": agent_id}, 
@@ -452,16 +469,12 @@ async def create_tool(tool_data: ToolCreate):
         parameters=tool_data.parameters,
     )
     doc = tool.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.tools.insert_one(doc)
     return tool
 
 @api_router.get("/tools", response_model=List[Tool])
 async def list_tools():
     tools = await db.tools.find({}, {"_id": 0}).to_list(1000)
-    for t in tools:
-        if isinstance(t.get('created_at'), str):
-            t['created_at'] = datetime.fromisoformat(t['created_at'])
     return tools
 
 @api_router.get("/tools/builtin")
@@ -484,8 +497,6 @@ async def get_tool(tool_id: str):
     tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
     if not tool:
         raise HTTPException(status_code=404, detail="Tool not found")
-    if isinstance(tool.get('created_at'), str):
-        tool['created_at'] = datetime.fromisoformat(tool['created_at'])
     return tool
 
 @api_router.delete("/tools/{tool_id}")
@@ -504,16 +515,12 @@ async def create_knowledge_base(kb_data: KnowledgeBaseCreate):
         type=kb_data.type,
     )
     doc = kb.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.knowledge_bases.insert_one(doc)
     return kb
 
 @api_router.get("/knowledge", response_model=List[KnowledgeBase])
 async def list_knowledge_bases():
     kbs = await db.knowledge_bases.find({}, {"_id": 0}).to_list(100)
-    for kb in kbs:
-        if isinstance(kb.get('created_at'), str):
-            kb['created_at'] = datetime.fromisoformat(kb['created_at'])
     return kbs
 
 @api_router.delete("/knowledge/{kb_id}")
@@ -525,83 +532,19 @@ async def delete_knowledge_base(kb_id: str):
 
 # ========== ANALYTICS ==========
 
-# Cutoff date: December 13, 2025 - only show data from this date onwards
-CUTOFF_DATE = datetime(2025, 12, 13, 0, 0, 0, tzinfo=timezone.utc)
-CUTOFF_TIMESTAMP_MS = int(CUTOFF_DATE.timestamp() * 1000)
-
-async def fetch_retell_calls(days: int = 7, agent_id: str = None) -> List[Dict]:
-    """Fetch calls from Retell API (only from Dec 13, 2025 onwards)"""
-    import httpx
-    from datetime import timedelta
-    
-    retell_api_key = os.environ.get('RETELL_API_KEY')
-    if not retell_api_key:
-        return []
-    
-    end_timestamp = int(datetime.now().timestamp() * 1000)
-    calculated_start = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
-    # Use the later of the two dates (cutoff or calculated start)
-    start_timestamp = max(calculated_start, CUTOFF_TIMESTAMP_MS)
-    
-    params = {
-        "limit": 1000,
-        "start_timestamp": start_timestamp,
-        "end_timestamp": end_timestamp
-    }
-    
-    if agent_id:
-        params["filter_criteria"] = [{"member": "agent_id", "operator": "eq", "value": agent_id}]
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.retellai.com/v2/list-calls",
-                headers={
-                    "Authorization": f"Bearer {retell_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json=params,
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                calls = data if isinstance(data, list) else data.get("calls", [])
-                # Double-check: filter out any calls before cutoff date
-                filtered_calls = [
-                    c for c in calls 
-                    if (c.get("start_timestamp", 0) or c.get("created_timestamp", 0)) >= CUTOFF_TIMESTAMP_MS
-                ]
-                return filtered_calls
-            else:
-                logger.warning(f"Failed to fetch Retell calls: {response.status_code}")
-                return []
-    except Exception as e:
-        logger.error(f"Error fetching Retell calls: {str(e)}")
-        return []
-
+# Calls are read from the local call store (services/call_store.py), which
+# only holds data from the Dec 13, 2025 cutoff onwards
 
 @api_router.post("/agents/cleanup")
 async def cleanup_deleted_agents():
     """Remove agents from local DB that have been deleted from Retell"""
-    import httpx
-    
     retell_api_key = os.environ.get('RETELL_API_KEY')
     if not retell_api_key:
         raise HTTPException(status_code=500, detail="Voice Platform API key not configured")
     
-    # Get all valid agents from Retell
-    valid_retell_agent_ids = set()
+    # Get all valid agents from Retell (fresh, and refreshes the cached ID set)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.retellai.com/list-agents",
-                headers={"Authorization": f"Bearer {retell_api_key}"},
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                retell_agents = response.json()
-                valid_retell_agent_ids = {a.get("agent_id") for a in retell_agents if a.get("agent_id")}
+        valid_retell_agent_ids = await refresh_agent_ids()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not fetch cloud agents: {e}")
     
@@ -620,24 +563,15 @@ async def cleanup_deleted_agents():
             deleted_agents.append({"id": agent.get("id"), "name": agent.get("name"), "retell_agent_id": retell_id})
     
     # Also delete agents created before Dec 13, 2025
-    cutoff_date = datetime(2025, 12, 13, 0, 0, 0, tzinfo=timezone.utc)
-    cutoff_date_str = cutoff_date.isoformat()
-    
-    old_agents = await db.agents.find({}, {"_id": 0, "id": 1, "name": 1, "created_at": 1}).to_list(1000)
-    for agent in old_agents:
-        created_at = agent.get("created_at")
-        if created_at:
-            if isinstance(created_at, str):
-                try:
-                    created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                except:
-                    continue
-            if created_at.tzinfo is None:
-                created_at = created_at.replace(tzinfo=timezone.utc)
-            if created_at < cutoff_date:
-                await db.agents.delete_one({"id": agent.get("id")})
-                deleted_count += 1
-                deleted_agents.append({"id": agent.get("id"), "name": agent.get("name"), "reason": "created_before_cutoff"})
+    old_query = {"created_at": {"$lt": call_store.CUTOFF_DATE}}
+    old_agents = await db.agents.find(old_query, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
+    if old_agents:
+        await db.agents.delete_many({"id": {"$in": [a.get("id") for a in old_agents]}})
+        deleted_count += len(old_agents)
+        deleted_agents.extend(
+            {"id": a.get("id"), "name": a.get("name"), "reason": "created_before_cutoff"}
+            for a in old_agents
+        )
     
     return {
         "success": True,
@@ -649,37 +583,26 @@ async def cleanup_deleted_agents():
 
 @api_router.get("/analytics/calls")
 async def get_call_analytics(days: int = 7):
-    """Get call analytics from Retell"""
-    from datetime import timedelta
+    """Get call analytics from the local call store"""
+    summary = await call_store.summarize_calls(db, start_ms=call_store.period_start_ms(days))
     
-    # Fetch real calls from Retell
-    calls = await fetch_retell_calls(days)
-    
-    total_calls = len(calls)
-    successful_calls = sum(1 for c in calls if c.get("call_status") == "ended")
-    failed_calls = sum(1 for c in calls if c.get("call_status") in ["error", "failed"])
-    total_duration_ms = sum(c.get("duration_ms", 0) or 0 for c in calls)
+    total_calls = summary["total_calls"]
+    successful_calls = summary["successful_calls"]
+    failed_calls = summary["failed_calls"]
+    total_duration_ms = summary["total_duration_ms"]
     
     # Calculate calls today
     today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     today_timestamp = int(today_start.timestamp() * 1000)
-    calls_today = sum(1 for c in calls if (c.get("start_timestamp", 0) or 0) >= today_timestamp)
-    
-    # Calculate total cost
-    total_cost = sum(
-        c.get("call_cost", {}).get("combined_cost", 0) or 0
-        for c in calls if c.get("call_cost")
-    )
+    calls_today = await db.calls.count_documents(call_store.build_call_match(start_ms=today_timestamp))
     
     # Sentiment distribution
     sentiments = {"positive": 0, "neutral": 0, "negative": 0}
-    for call in calls:
-        analysis = call.get("call_analysis", {}) or {}
-        sentiment = (analysis.get("user_sentiment") or "neutral").lower()
+    for sentiment, count in summary["sentiments"].items():
         if sentiment in sentiments:
-            sentiments[sentiment] += 1
+            sentiments[sentiment] += count
         else:
-            sentiments["neutral"] += 1
+            sentiments["neutral"] += count
     
     return {
         "total_calls": total_calls,
@@ -690,58 +613,71 @@ async def get_call_analytics(days: int = 7):
         "total_duration_seconds": total_duration_ms / 1000,
         "calls_today": calls_today,
         "calls_this_week": total_calls,
-        "total_cost": round(total_cost, 2),
+        "total_cost": round(summary["total_cost"], 2),
         "sentiment_distribution": sentiments,
         "period_days": days
     }
 
 
 @api_router.get("/analytics/chart-data")
-async def get_analytics_chart_data(days: int = 7):
-    """Get daily breakdown of calls for charts"""
+async def get_analytics_chart_data(
+    days: int = 7,
+    tz: str = "UTC",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    agent_id: Optional[str] = None,
+    interval: str = "day"
+):
+    """
+    Get daily (or hourly) breakdown of calls for charts.
+    Reads the pre-aggregated call rollups; defaults to the last `days` days in `tz`.
+    """
     from datetime import timedelta
-    from collections import defaultdict
     
-    calls = await fetch_retell_calls(days)
+    if interval not in ("day", "hour"):
+        raise HTTPException(status_code=400, detail="interval must be 'day' or 'hour'")
     
-    # Group calls by day
-    daily_data = defaultdict(lambda: {"calls": 0, "success": 0, "duration": 0})
-    day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    zone = call_rollups.get_zone(tz)
+    end_date = end_date or datetime.now(zone).date()
+    start_date = start_date or end_date - timedelta(days=days - 1)
+    start_date = max(start_date, call_store.CUTOFF_DATE.date())
+    if start_date > end_date:
+        start_date = end_date
     
-    for call in calls:
-        timestamp_ms = call.get("start_timestamp", 0) or call.get("created_timestamp", 0)
-        if timestamp_ms:
-            call_date = datetime.fromtimestamp(timestamp_ms / 1000)
-            day_key = call_date.strftime("%a")  # Mon, Tue, etc.
-            daily_data[day_key]["calls"] += 1
-            if call.get("call_status") == "ended":
-                daily_data[day_key]["success"] += 1
-            daily_data[day_key]["duration"] += (call.get("duration_ms", 0) or 0) / 1000
+    # Accept either a platform agent ID or a Retell agent ID
+    if agent_id:
+        agent = await db.agents.find_one({"id": agent_id}, {"_id": 0, "retell_agent_id": 1})
+        if agent and agent.get("retell_agent_id"):
+            agent_id = agent["retell_agent_id"]
+    
+    buckets = await call_rollups.query_rollups(
+        db, start_date, end_date, tz=tz, agent_id=agent_id, interval=interval
+    )
     
-    # Build chart data for the last 7 days
     calls_chart = []
     duration_chart = []
-    
-    for i in range(6, -1, -1):
-        day = datetime.now() - timedelta(days=i)
-        day_name = day.strftime("%a")
-        data = daily_data.get(day_name, {"calls": 0, "success": 0, "duration": 0})
+    for bucket in buckets:
+        local = datetime.fromisoformat(bucket["start"])
+        name = local.strftime("%a") if interval == "day" else local.strftime("%H:00")
         
         calls_chart.append({
-            "name": day_name,
-            "calls": data["calls"],
-            "success": data["success"]
+            "name": name,
+            "date": bucket["bucket"],
+            "calls": bucket["calls"],
+            "success": bucket["successes"]
         })
-        
-        avg_duration = data["duration"] / data["calls"] if data["calls"] > 0 else 0
         duration_chart.append({
-            "name": day_name,
-            "duration": round(avg_duration, 1)
+            "name": name,
+            "date": bucket["bucket"],
+            "duration": round(bucket["average_duration_seconds"], 1)
         })
     
     return {
         "calls_data": calls_chart,
-        "duration_data": duration_chart
+        "duration_data": duration_chart,
+        "buckets": buckets,
+        "timezone": tz,
+        "interval": interval
     }
 
 
@@ -752,12 +688,12 @@ async def get_agent_analytics(agent_id: str, days: int = 7):
     agent = await db.agents.find_one({"id": agent_id}, {"_id": 0})
     retell_agent_id = agent.get("retell_agent_id") if agent else None
     
-    # Fetch calls for this agent
-    calls = await fetch_retell_calls(days, retell_agent_id)
+    # Aggregate calls for this agent
+    summary = await call_store.summarize_calls(db, start_ms=call_store.period_start_ms(days), agent_id=retell_agent_id)
     
-    total_calls = len(calls)
-    successful_calls = sum(1 for c in calls if c.get("call_status") == "ended")
-    total_duration_ms = sum(c.get("duration_ms", 0) or 0 for c in calls)
+    total_calls = summary["total_calls"]
+    successful_calls = summary["successful_calls"]
+    total_duration_ms = summary["total_duration_ms"]
     
     return {
         "agent_id": agent_id,
@@ -773,14 +709,15 @@ async def get_agent_analytics(agent_id: str, days: int = 7):
 @api_router.get("/analytics/recent-calls")
 async def get_recent_calls(limit: int = 10):
     """Get recent calls with details"""
-    calls = await fetch_retell_calls(days=30)
-    
-    # Sort by timestamp descending and limit
-    sorted_calls = sorted(
-        calls, 
-        key=lambda x: x.get("start_timestamp", 0) or 0, 
-        reverse=True
-    )[:limit]
+    sorted_calls = await call_store.find_calls(
+        db,
+        start_ms=call_store.period_start_ms(30),
+        limit=limit,
+        projection={
+            "call_id": 1, "agent_id": 1, "call_status": 1, "duration_ms": 1,
+            "start_timestamp": 1, "disconnection_reason": 1, "call_analysis": 1
+        }
+    )
     
     # Format for display
     recent = []
@@ -809,16 +746,12 @@ async def create_insight(insight_data: InsightCreate):
         prompt=insight_data.prompt,
     )
     doc = insight.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.insights.insert_one(doc)
     return insight
 
 @api_router.get("/insights", response_model=List[Insight])
 async def list_insights():
     insights = await db.insights.find({}, {"_id": 0}).to_list(100)
-    for i in insights:
-        if isinstance(i.get('created_at'), str):
-            i['created_at'] = datetime.fromisoformat(i['created_at'])
     return insights
 
 # ========== CHAT / LLM ==========
@@ -830,8 +763,6 @@ async def call_retell_llm(
     temperature: float = 0.7
 ) -> str:
     """Call Retell LLM for chat completion"""
-    import httpx
-    
     retell_api_key = os.environ.get('RETELL_API_KEY')
     if not retell_api_key:
         raise HTTPException(status_code=500, detail="RETELL_API_KEY not configured")
@@ -845,10 +776,10 @@ async def call_retell_llm(
         elif msg["role"] in ["assistant", "agent"]:
             formatted_messages.append({"role": "assistant", "content": msg["content"]})
     
-    async with httpx.AsyncClient() as client:
-        # Use Retell's chat completion endpoint
-        response = await client.post(
-            "https://api.retellai.com/v2/create-chat-completion",
+    # Use Retell's chat completion endpoint
+    with track_outbound("retell", "POST", "/v2/create-chat-completion") as call:
+        response = await get_retell_client().post(
+            "/v2/create-chat-completion",
             headers={
                 "Authorization": f"Bearer {retell_api_key}",
                 "Content-Type": "application/json"
@@ -861,14 +792,15 @@ async def call_retell_llm(
             },
             timeout=60.0
         )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("response", data.get("content", ""))
-        
-        # If Retell chat completion doesn't work, fall back to OpenAI via Retell
-        # Try the LLM websocket simulation approach
-        logger.warning(f"Retell chat completion returned {response.status_code}, trying fallback")
+        call["status"] = response.status_code
+    
+    if response.status_code == 200:
+        data = response.json()
+        return data.get("response", data.get("content", ""))
+    
+    # If Retell chat completion doesn't work, fall back to OpenAI via Retell
+    # Try the LLM websocket simulation approach
+    logger.warning(f"Retell chat completion returned {response.status_code}, trying fallback")
     
     # Fallback: Use OpenAI directly if Retell doesn't support chat completion
     return await call_openai_fallback(messages, system_prompt, temperature)
@@ -880,51 +812,29 @@ async def call_openai_fallback(
     temperature: float = 0.7
 ) -> str:
     """Fallback to OpenAI API for chat"""
-    import httpx
-    
     # Try Retell's OpenAI key first, then fall back to direct OpenAI key
     api_key = os.environ.get('OPENAI_API_KEY')
     if not api_key:
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured for chat fallback")
     
-    # Build OpenAI messages
-    openai_messages = [{"role": "system", "content": system_prompt}]
-    for msg in messages:
-        if msg["role"] in ["user", "assistant"]:
-            openai_messages.append({"role": msg["role"], "content": msg["content"]})
+    # Build OpenAI messages, trimmed to the model's budget
+    openai_messages, _ = context_window.fit_messages(
+        system_prompt,
+        [{"role": msg["role"], "content": msg["content"]} for msg in messages if msg["role"] in ["user", "assistant"]],
+        model="gpt-4o"
+    )
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o",
-                "messages": openai_messages,
-                "temperature": temperature
-            },
-            timeout=60.0
+    try:
+        return await complete_text(
+            openai_messages, model="gpt-4o", temperature=temperature,
+            api_key=api_key, purpose="chat_fallback"
         )
-        
-        if response.status_code != 200:
-            error_detail = response.text
-            try:
-                error_json = response.json()
-                error_detail = error_json.get("error", {}).get("message", error_detail)
-            except:
-                pass
-            raise HTTPException(status_code=response.status_code, detail=f"OpenAI API error: {error_detail}")
-        
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+    except LLMError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"OpenAI API error: {e.detail}")
 
 
 async def get_or_create_retell_llm(agent: Dict) -> str:
     """Get existing Retell LLM ID or create a new one for the agent"""
-    import httpx
-    
     retell_api_key = os.environ.get('RETELL_API_KEY')
     if not retell_api_key:
         raise HTTPException(status_code=500, detail="RETELL_API_KEY not configured")
@@ -936,9 +846,9 @@ async def get_or_create_retell_llm(agent: Dict) -> str:
     # Create a new Retell LLM for this agent
     system_prompt = agent.get('system_prompt', 'You are a helpful AI assistant.')
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://api.retellai.com/create-retell-llm",
+    with track_outbound("retell", "POST", "/create-retell-llm") as call:
+        response = await get_retell_client().post(
+            "/create-retell-llm",
             headers={
                 "Authorization": f"Bearer {retell_api_key}",
                 "Content-Type": "application/json"
@@ -951,29 +861,27 @@ async def get_or_create_retell_llm(agent: Dict) -> str:
             },
             timeout=30.0
         )
-        
-        if response.status_code != 200 and response.status_code != 201:
-            logger.error(f"Failed to create Retell LLM: {response.text}")
-            raise HTTPException(status_code=500, detail="Failed to create Voice LLM")
-        
-        data = response.json()
-        llm_id = data.get("llm_id")
-        
-        if llm_id:
-            # Update agent with LLM ID
-            await db.agents.update_one(
-                {"id": agent["id"]},
-                {"$set": {"retell_llm_id": llm_id}}
-            )
-        
-        return llm_id
+        call["status"] = response.status_code
+    
+    if response.status_code != 200 and response.status_code != 201:
+        logger.error(f"Failed to create Retell LLM: {response.text}")
+        raise HTTPException(status_code=500, detail="Failed to create Voice LLM")
+    
+    data = response.json()
+    llm_id = data.get("llm_id")
+    
+    if llm_id:
+        # Update agent with LLM ID
+        await db.agents.update_one(
+            {"id": agent["id"]},
+            {"$set": {"retell_llm_id": llm_id}}
+        )
+    
+    return llm_id
 
 
-@api_router.post("/chat", response_model=ChatResponse)
-async def chat_with_agent(request: ChatRequest):
-    """Chat with an AI agent"""
-    import httpx
-    
+async def prepare_chat(request: ChatRequest) -> Dict[str, Any]:
+    """Agent lookup, chat_config, session history and message list shared by /chat and /chat/stream"""
     # Get agent configuration
     agent = await db.agents.find_one({"id": request.agent_id}, {"_id": 0})
     if not agent:
@@ -992,50 +900,73 @@ async def chat_with_agent(request: ChatRequest):
     if not openai_api_key and not retell_api_key:
         raise HTTPException(status_code=500, detail="No API key configured")
     
-    # Build conversation messages
-    messages = []
-    for msg in request.history:
-        role = "assistant" if msg.role == "assistant" else "user"
-        messages.append({"role": role, "content": msg.content})
-    messages.append({"role": "user", "content": request.message})
-    
-    # Use OpenAI for chat completion
+    # Conversation history is kept server-side per session; a client-sent
+    # history is only used to seed a session the server doesn't know yet
+    session = await chat_sessions.get_session(db, session_id, request.agent_id)
+    if not session["messages"] and request.history:
+        seeded = [
+            {"role": "assistant" if msg.role == "assistant" else "user", "content": msg.content}
+            for msg in request.history
+        ]
+        chat_sessions.append_messages(session_id, request.agent_id, seeded)
+        session["messages"] = seeded
+    
+    # Keep the prompt within the model's budget: system prompt, rolling
+    # summary (if enabled), then as many recent turns as fit
+    model = chat_config.get('llm_model', 'gpt-4o')
+    max_tokens = chat_config.get('max_tokens', 2048)
+    summarize = chat_config.get('summarize_context', context_window.SUMMARY_ENABLED)
+    history = session["messages"][session["summary_count"]:] if summarize else session["messages"]
+    openai_messages, dropped = context_window.fit_messages(
+        system_prompt,
+        history,
+        {"role": "user", "content": request.message},
+        model=model,
+        max_tokens=max_tokens,
+        summary=session["summary"] if summarize else None
+    )
     api_key = openai_api_key or retell_api_key
+    if dropped and summarize:
+        context_window.schedule_summary(session_id, request.agent_id, session, dropped, api_key)
     
-    openai_messages = [{"role": "system", "content": system_prompt}]
-    openai_messages.extend(messages)
+    return {
+        "agent_id": request.agent_id,
+        "session_id": session_id,
+        "user_message": request.message,
+        "messages": openai_messages,
+        "llm_kwargs": {
+            "provider": chat_config.get('llm_provider', LLMProvider.OPENAI.value),
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            # Use OpenAI for chat completion
+            "api_key": api_key,
+        },
+    }
+
+
+def record_chat_turn(chat: Dict[str, Any], response_text: str):
+    """Append the user message and agent reply to the session"""
+    chat_sessions.append_messages(chat["session_id"], chat["agent_id"], [
+        {"role": "user", "content": chat["user_message"]},
+        {"role": "assistant", "content": response_text},
+    ])
+
+
+@api_router.post("/chat", response_model=ChatResponse)
+async def chat_with_agent(request: ChatRequest):
+    """Chat with an AI agent"""
+    chat = await prepare_chat(request)
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": chat_config.get('llm_model', 'gpt-4o'),
-                    "messages": openai_messages,
-                    "temperature": temperature,
-                    "max_tokens": chat_config.get('max_tokens', 2048)
-                },
-                timeout=60.0
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text
-                try:
-                    error_json = response.json()
-                    error_detail = error_json.get("error", {}).get("message", error_detail)
-                except:
-                    pass
-                raise HTTPException(status_code=response.status_code, detail=f"Chat API error: {error_detail}")
-            
-            data = response.json()
-            response_text = data["choices"][0]["message"]["content"]
+        result = await route_completion(chat["messages"], purpose="chat", **chat["llm_kwargs"])
+        response_text = result["content"]
+        record_chat_turn(chat, response_text)
         
-        return ChatResponse(response=response_text, session_id=session_id)
+        return ChatResponse(response=response_text, session_id=chat["session_id"])
         
+    except LLMError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Chat API error: {e.detail}")
     except HTTPException:
         raise
     except Exception as e:
@@ -1043,11 +974,71 @@ async def chat_with_agent(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.post("/chat/stream")
+async def chat_with_agent_stream(request: ChatRequest):
+    """
+    Chat with an AI agent, streaming the reply as Server-Sent Events.
+    Emits `delta` events with content, then `done` with the session id,
+    full response and token usage (or `error`).
+    """
+    chat = await prepare_chat(request)
+    
+    async def events():
+        parts = []
+        usage = None
+        try:
+            async for chunk in stream_route_completion(chat["messages"], purpose="chat_stream", **chat["llm_kwargs"]):
+                if chunk["type"] == "delta":
+                    parts.append(chunk["content"])
+                    yield format_sse({"content": chunk["content"]}, "delta")
+                elif chunk["type"] == "usage":
+                    usage = chunk["usage"]
+        except LLMError as e:
+            yield format_sse({"status_code": e.status_code, "detail": f"Chat API error: {e.detail}"}, "error")
+            return
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}")
+            yield format_sse({"status_code": 500, "detail": str(e)}, "error")
+            return
+        
+        response_text = "".join(parts)
+        record_chat_turn(chat, response_text)
+        yield format_sse({
+            "session_id": chat["session_id"],
+            "response": response_text,
+            "usage": usage
+        }, "done")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@api_router.get("/chat/sessions")
+async def list_chat_sessions(agent_id: Optional[str] = None, limit: int = 50):
+    """Chat sessions, most recently active first (without messages)"""
+    await chat_sessions.flush(db)
+    query = {"agent_id": agent_id} if agent_id else {}
+    return await db.chat_sessions.find(
+        query, {"_id": 0, "messages": 0}
+    ).sort("updated_at", -1).to_list(limit)
+
+
+@api_router.get("/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    """A chat session with its full message history"""
+    await chat_sessions.flush(db)
+    session = await db.chat_sessions.find_one({"session_id": session_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
+
 @api_router.post("/test/chat")
 async def test_chat(message: str, provider: str = "openai", model: str = "gpt-4o"):
     """Test LLM chat directly"""
-    import httpx
-    
     try:
         api_key = os.environ.get('OPENAI_API_KEY') or os.environ.get('RETELL_API_KEY')
         if not api_key:
@@ -1058,34 +1049,11 @@ async def test_chat(message: str, provider: str = "openai", model: str = "gpt-4o
             {"role": "user", "content": message}
         ]
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "temperature": 0.7
-                },
-                timeout=60.0
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text
-                try:
-                    error_json = response.json()
-                    error_detail = error_json.get("error", {}).get("message", error_detail)
-                except:
-                    pass
-                raise HTTPException(status_code=response.status_code, detail=error_detail)
-            
-            data = response.json()
-            response_text = data["choices"][0]["message"]["content"]
+        result = await route_completion(
+            messages, provider=provider, model=model, temperature=0.7, api_key=api_key, purpose="test_chat"
+        )
         
-        return {"response": response_text, "provider": provider, "model": model}
+        return {"response": result["content"], "provider": result["provider"], "model": result["model"]}
         
     except HTTPException:
         raise
@@ -1141,10 +1109,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (JSON lines written from a background thread; see services/log_config.py)
+configure_logging()
 logger = logging.getLogger(__name__)
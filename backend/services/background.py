@@ -0,0 +1,48 @@
+"""
+Background Tasks
+Registry for long-running asyncio tasks started by the app (sync loops, jobs)
+"""
+import asyncio
+import logging
+from typing import Coroutine, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+# Strong references so running tasks are not garbage collected
+_tasks: Set[asyncio.Task] = set()
+
+
+def _on_done(task: asyncio.Task):
+    _tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc:
+        logger.error(f"Background task {task.get_name()} failed: {exc}", exc_info=exc)
+
+
+def spawn(coro: Coroutine, name: str) -> asyncio.Task:
+    """Start a background task and keep track of it until it finishes"""
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+def running_tasks() -> Dict[str, int]:
+    """Count of running background tasks by name prefix"""
+    counts: Dict[str, int] = {}
+    for task in _tasks:
+        prefix = task.get_name().split(":")[0]
+        counts[prefix] = counts.get(prefix, 0) + 1
+    return counts
+
+
+async def cancel_all(timeout: float = 10.0):
+    """Cancel every running background task (called from lifespan shutdown)"""
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+        logger.info(f"Cancelled {len(tasks)} background tasks")
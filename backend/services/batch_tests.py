@@ -0,0 +1,277 @@
+"""
+Local Batch Test Engine
+Runs batch test scenarios as background jobs with a bounded worker pool,
+persisting and publishing each result as it completes
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Set, Tuple
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.background import spawn
+from services.events import publish
+from services.llm_gateway import LLMError, complete_text
+from services.topic_matcher import TopicMatcher, compile_test_case
+from services.conversation_sim import evaluate_conversation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+MAX_CONCURRENCY = int(os.environ.get("BATCH_TEST_MAX_CONCURRENCY", "10"))
+
+
+def clamp_concurrency(concurrency: Optional[int]) -> int:
+    return max(1, min(concurrency or 1, MAX_CONCURRENCY))
+
+
+async def load_agent_prompt(db: AsyncIOMotorDatabase, agent_id: str) -> str:
+    """System prompt for the agent under test (loaded once per job)"""
+    agent = await db.agents.find_one({"retell_agent_id": agent_id}, {"_id": 0, "system_prompt": 1})
+    if not agent:
+        return DEFAULT_SYSTEM_PROMPT
+    return agent.get("system_prompt", DEFAULT_SYSTEM_PROMPT)
+
+
+async def evaluate_scenario(
+    api_key: str,
+    system_prompt: str,
+    test_case: Dict[str, Any],
+    scenario: Dict[str, Any],
+    use_cache: Optional[bool] = None,
+    matcher: Optional[TopicMatcher] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Run one scenario; returns (outcome, result) where outcome is pass/fail/error.
+    The reply is generated at temperature 0, so an unchanged prompt/scenario
+    pair is served from the completion cache; use_cache=False bypasses it.
+    `matcher` is the scenario's compiled topic matcher (built here if omitted).
+    """
+    try:
+        # Simulate agent response using OpenAI (deterministic, so reruns are cached)
+        try:
+            agent_response = await complete_text(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": scenario.get("user_message", "")}
+                ],
+                model="gpt-4o",
+                temperature=0,
+                max_tokens=1024,
+                api_key=api_key,
+                purpose="batch_test",
+                cache=use_cache
+            )
+        except LLMError as e:
+            return "error", {
+                "test_case_id": test_case.get("id"),
+                "scenario_name": scenario.get("name"),
+                "error": f"API error: {e.status_code}",
+                "passed": False,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+
+        # Evaluate response against expected topics
+        if matcher is None:
+            matcher = TopicMatcher(scenario.get("expected_topics") or [], scenario.get("topic_synonyms"))
+        # The matcher's topics are deduplicated with blanks dropped; score against those
+        expected_topics = matcher.topics
+        topic_hits = matcher.match(agent_response)
+        topics_covered = sum(1 for spans in topic_hits.values() if spans)
+
+        # Calculate score
+        if expected_topics:
+            score = topics_covered / len(expected_topics)
+            passed = score >= 0.5
+        else:
+            # No specific expectations, consider passed if response is non-empty
+            passed = len(agent_response) > 10
+            score = 1.0 if passed else 0.0
+
+        return ("pass" if passed else "fail"), {
+            "test_case_id": test_case.get("id"),
+            "scenario_name": scenario.get("name"),
+            "user_message": scenario.get("user_message"),
+            "agent_response": agent_response[:500],
+            "expected_topics": expected_topics,
+            "topics_covered": topics_covered,
+            "topic_hits": {topic: [list(span) for span in spans] for topic, spans in topic_hits.items()},
+            "score": score,
+            "passed": passed,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    except Exception as e:
+        return "error", {
+            "test_case_id": test_case.get("id"),
+            "scenario_name": scenario.get("name", "Unknown"),
+            "error": str(e),
+            "passed": False,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+
+def batch_topic(batch_job_id: str) -> str:
+    return f"batch-test:{batch_job_id}"
+
+
+def scenario_key(test_case: Dict[str, Any], position: int) -> str:
+    """Stable identity of a scenario within a job (used to resume)"""
+    return f"{test_case.get('id')}:{position}"
+
+
+async def record_result(
+    db: AsyncIOMotorDatabase,
+    batch_job_id: str,
+    key: str,
+    outcome: str,
+    result: Dict[str, Any]
+) -> bool:
+    """Append one scenario result and bump its counter atomically (idempotent per scenario)"""
+    update = await db.batch_tests.update_one(
+        {"id": batch_job_id, "results.scenario_key": {"$ne": key}},
+        {
+            "$push": {"results": {**result, "scenario_key": key}},
+            "$inc": {f"{outcome}_count": 1, "completed_count": 1},
+            "$set": {"updated_at": datetime.now(timezone.utc)},
+        }
+    )
+    return update.modified_count == 1
+
+
+async def run_local_batch_test(
+    db: AsyncIOMotorDatabase,
+    batch_job_id: str,
+    test_cases: List[Dict[str, Any]],
+    agent_id: str,
+    concurrency: Optional[int] = 1,
+    completed_keys: Optional[Set[str]] = None,
+    use_cache: Optional[bool] = None,
+    multi_turn: Optional[bool] = False
+):
+    """
+    Run batch test locally (simulated evaluation), `concurrency` scenarios at a time.
+    Each result is persisted as it finishes and published to the job's event
+    topic; scenarios in completed_keys (from a previous run) are skipped.
+    With multi_turn, each scenario is a simulated conversation of up to
+    max_turns exchanges instead of a single reply.
+    """
+    openai_api_key = os.environ.get('OPENAI_API_KEY')
+    retell_api_key = os.environ.get('RETELL_API_KEY')
+    api_key = openai_api_key or retell_api_key
+
+    workers = clamp_concurrency(concurrency)
+    completed_keys = completed_keys or set()
+    pending = []
+    for tc in test_cases:
+        matchers = compile_test_case(tc)
+        pending.extend(
+            (scenario_key(tc, position), tc, scenario, matchers[position])
+            for position, scenario in enumerate(tc.get("scenarios", []))
+            if scenario_key(tc, position) not in completed_keys
+        )
+    total = len(completed_keys) + len(pending)
+    topic = batch_topic(batch_job_id)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+
+    try:
+        system_prompt = await load_agent_prompt(db, agent_id)
+        completed = len(completed_keys)
+
+        async def worker():
+            nonlocal completed
+            while True:
+                try:
+                    key, test_case, scenario, matcher = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                evaluate = evaluate_conversation if multi_turn else evaluate_scenario
+                outcome, result = await evaluate(
+                    api_key, system_prompt, test_case, scenario, use_cache, matcher
+                )
+                if await record_result(db, batch_job_id, key, outcome, result):
+                    completed += 1
+                    publish(topic, {
+                        "type": "result",
+                        "batch_job_id": batch_job_id,
+                        "outcome": outcome,
+                        "completed": completed,
+                        "total": total,
+                        "result": result,
+                    })
+
+        await asyncio.gather(*(worker() for _ in range(min(workers, len(pending)) or 1)))
+
+        # Pass rate from the persisted counters (covers results from before a resume)
+        total_expr = {"$add": ["$pass_count", "$fail_count", "$error_count"]}
+        job = await db.batch_tests.find_one_and_update(
+            {"id": batch_job_id},
+            [{"$set": {
+                "status": "complete",
+                "pass_rate": {"$cond": [
+                    {"$gt": [total_expr, 0]},
+                    {"$multiply": [{"$divide": ["$pass_count", total_expr]}, 100]},
+                    0
+                ]},
+                "updated_at": datetime.now(timezone.utc),
+            }}],
+            projection={"_id": 0, "results": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        publish(topic, {"type": "complete", "batch_job_id": batch_job_id, "job": job})
+        logger.info(f"Batch test {batch_job_id} complete: {completed}/{total} scenarios with {workers} workers")
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Batch test {batch_job_id} failed: {e}")
+        await db.batch_tests.update_one(
+            {"id": batch_job_id},
+            {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.now(timezone.utc)}}
+        )
+        publish(topic, {"type": "failed", "batch_job_id": batch_job_id, "error": str(e)})
+
+
+def start_local_batch_test(
+    db: AsyncIOMotorDatabase,
+    batch_job_id: str,
+    test_cases: List[Dict[str, Any]],
+    agent_id: str,
+    concurrency: Optional[int] = 1,
+    completed_keys: Optional[Set[str]] = None,
+    use_cache: Optional[bool] = None,
+    multi_turn: Optional[bool] = False
+) -> asyncio.Task:
+    """Submit a local batch test as a background job"""
+    return spawn(
+        run_local_batch_test(
+            db, batch_job_id, test_cases, agent_id, concurrency, completed_keys, use_cache, multi_turn
+        ),
+        batch_topic(batch_job_id)
+    )
+
+
+async def resume_local_batch_tests(db: AsyncIOMotorDatabase) -> int:
+    """Restart text-simulation jobs left in progress (e.g. by a restart) from their last completed scenario"""
+    jobs = await db.batch_tests.find(
+        {"status": "in_progress", "test_type": "text_simulation"},
+        {"_id": 0, "id": 1, "agent_id": 1, "test_case_definition_ids": 1, "concurrency": 1, "use_cache": 1,
+         "multi_turn": 1, "results.scenario_key": 1}
+    ).to_list(None)
+
+    for job in jobs:
+        test_cases = await db.test_cases.find(
+            {"id": {"$in": job.get("test_case_definition_ids", [])}}, {"_id": 0}
+        ).to_list(100)
+        completed_keys = {r["scenario_key"] for r in job.get("results", []) if r.get("scenario_key")}
+        logger.info(f"Resuming batch test {job['id']} after {len(completed_keys)} completed scenarios")
+        start_local_batch_test(
+            db, job["id"], test_cases, job.get("agent_id"), job.get("concurrency"), completed_keys,
+            job.get("use_cache"), job.get("multi_turn", False)
+        )
+
+    return len(jobs)
@@ -0,0 +1,225 @@
+"""
+Call Rollups
+Pre-aggregated per-agent quarter-hour, hourly and daily call counters for
+analytics charts
+"""
+import logging
+from datetime import datetime, date, time, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from fastapi import HTTPException
+from pymongo import UpdateOne, ASCENDING
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("calls", "successes", "failures", "duration_ms", "cost")
+SENTIMENTS = ("positive", "neutral", "negative", "unknown")
+# Every real UTC offset is a whole number of quarter hours (e.g. +05:30, +05:45)
+QUARTER_MINUTES = 15
+GRANULARITIES = ("quarter", "hour", "day")
+
+# Fields a call contribution is computed from (used to project existing docs)
+CONTRIBUTION_FIELDS = {
+    "_id": 0,
+    "call_id": 1,
+    "agent_id": 1,
+    "call_status": 1,
+    "duration_ms": 1,
+    "call_cost.combined_cost": 1,
+    "call_analysis.user_sentiment": 1,
+    "call_timestamp": 1,
+    "rollup": 1,
+}
+
+
+def contribution(call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """What a single call adds to its quarter-hour/hourly/daily buckets"""
+    timestamp_ms = call.get("call_timestamp")
+    if not timestamp_ms:
+        return None
+
+    moment = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+    status = call.get("call_status")
+    sentiment = ((call.get("call_analysis") or {}).get("user_sentiment") or "unknown").lower()
+
+    return {
+        "agent_id": call.get("agent_id"),
+        "bucket": moment.replace(
+            minute=moment.minute - moment.minute % QUARTER_MINUTES, second=0, microsecond=0
+        ),
+        "calls": 1,
+        "successes": 1 if status == "ended" else 0,
+        "failures": 1 if status in ("error", "failed") else 0,
+        "duration_ms": call.get("duration_ms", 0) or 0,
+        "cost": (call.get("call_cost") or {}).get("combined_cost", 0) or 0,
+        "sentiment": sentiment if sentiment in SENTIMENTS else "unknown",
+    }
+
+
+def same_contribution(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> bool:
+    """Whether a stored contribution already matches a freshly computed one"""
+    # The client is tz_aware, so stored buckets compare equal to fresh ones
+    return old == new
+
+
+def _increments(contrib: Dict[str, Any], sign: int) -> Dict[str, float]:
+    incs = {name: sign * contrib[name] for name in COUNTERS}
+    incs[f"sentiment.{contrib['sentiment']}"] = sign
+    return incs
+
+
+def diff(
+    old: Optional[Dict[str, Any]],
+    new: Optional[Dict[str, Any]]
+) -> List[Tuple[Optional[str], datetime, Dict[str, float]]]:
+    """Counter changes (agent_id, quarter-hour, increments) to move from old to new"""
+    deltas = []
+    if old:
+        deltas.append((old["agent_id"], old["bucket"], _increments(old, -1)))
+    if new:
+        deltas.append((new["agent_id"], new["bucket"], _increments(new, 1)))
+    return deltas
+
+
+async def apply_deltas(
+    db: AsyncIOMotorDatabase,
+    deltas: List[Tuple[Optional[str], datetime, Dict[str, float]]]
+):
+    """Apply counter changes to the quarter-hour, hourly and daily rollup documents"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for agent_id, quarter, incs in deltas:
+        hour = quarter.replace(minute=0)
+        day = hour.replace(hour=0)
+        for granularity, bucket in (("quarter", quarter), ("hour", hour), ("day", day)):
+            key = f"{granularity}:{agent_id}:{bucket.isoformat()}"
+            entry = merged.setdefault(key, {
+                "granularity": granularity,
+                "agent_id": agent_id,
+                "bucket": bucket,
+                "incs": {},
+            })
+            for name, value in incs.items():
+                entry["incs"][name] = entry["incs"].get(name, 0) + value
+
+    operations = []
+    for key, entry in merged.items():
+        incs = {name: value for name, value in entry["incs"].items() if value}
+        if not incs:
+            continue
+        operations.append(UpdateOne(
+            {"_id": key},
+            {
+                "$inc": incs,
+                "$setOnInsert": {
+                    "granularity": entry["granularity"],
+                    "agent_id": entry["agent_id"],
+                    "bucket": entry["bucket"],
+                },
+            },
+            upsert=True
+        ))
+
+    if operations:
+        await db.call_rollups.bulk_write(operations, ordered=False)
+
+
+async def ensure_rollup_indexes(db: AsyncIOMotorDatabase):
+    """Create indexes for the rollup collection (idempotent)"""
+    await db.call_rollups.create_index([
+        ("granularity", ASCENDING), ("bucket", ASCENDING), ("agent_id", ASCENDING)
+    ])
+
+
+# ========== QUERIES ==========
+
+def get_zone(tz: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+
+
+def source_granularity(zone: ZoneInfo, start: datetime, end: datetime, interval: str = "day") -> str:
+    """
+    Coarsest rollup whose UTC buckets each fall inside one local bucket: daily
+    rollups only for a zero offset, hourly ones while the zone's offset is a
+    whole number of hours (sampled daily, so DST changes are seen), otherwise
+    quarter-hours (e.g. Asia/Kolkata, Asia/Kathmandu)
+    """
+    offsets = set()
+    current = start
+    while current < end:
+        offsets.add(current.astimezone(zone).utcoffset())
+        current += timedelta(days=1)
+    offsets.add(end.astimezone(zone).utcoffset())
+
+    if interval == "day" and offsets == {timedelta(0)}:
+        return "day"
+    if all(offset % timedelta(hours=1) == timedelta(0) for offset in offsets):
+        return "hour"
+    return "quarter"
+
+
+async def query_rollups(
+    db: AsyncIOMotorDatabase,
+    start_date: date,
+    end_date: date,
+    tz: str = "UTC",
+    agent_id: Optional[str] = None,
+    interval: str = "day"
+) -> List[Dict[str, Any]]:
+    """
+    Counters per local day (or hour) between start_date and end_date inclusive,
+    grouped from the coarsest rollups that line up with the zone's offset
+    (see source_granularity), so cost is O(days) either way.
+    """
+    zone = get_zone(tz)
+    start = datetime.combine(start_date, time.min, zone).astimezone(timezone.utc)
+    end = datetime.combine(end_date + timedelta(days=1), time.min, zone).astimezone(timezone.utc)
+
+    granularity = source_granularity(zone, start, end, interval)
+    key_format = "%Y-%m-%d" if interval == "day" else "%Y-%m-%dT%H:00"
+
+    match = {"granularity": granularity, "bucket": {"$gte": start, "$lt": end}}
+    if agent_id:
+        match["agent_id"] = agent_id
+
+    group = {
+        "_id": {"$dateToString": {"format": key_format, "date": "$bucket", "timezone": tz}},
+        **{name: {"$sum": f"${name}"} for name in COUNTERS},
+        **{f"sentiment_{s}": {"$sum": f"$sentiment.{s}"} for s in SENTIMENTS},
+    }
+    rows = await db.call_rollups.aggregate([{"$match": match}, {"$group": group}]).to_list(None)
+    by_key = {row["_id"]: row for row in rows}
+
+    # Every bucket in the range, including empty ones
+    keys = []
+    if interval == "day":
+        current = start_date
+        while current <= end_date:
+            keys.append((current.strftime(key_format), datetime.combine(current, time.min, zone)))
+            current += timedelta(days=1)
+    else:
+        current = start
+        while current < end:
+            local = current.astimezone(zone)
+            keys.append((local.strftime(key_format), local))
+            current += timedelta(hours=1)
+
+    buckets = []
+    for key, local in keys:
+        row = by_key.get(key, {})
+        calls = row.get("calls", 0)
+        buckets.append({
+            "bucket": key,
+            "start": local.isoformat(),
+            "calls": calls,
+            "successes": row.get("successes", 0),
+            "failures": row.get("failures", 0),
+            "duration_ms": row.get("duration_ms", 0),
+            "average_duration_seconds": (row.get("duration_ms", 0) / calls / 1000) if calls else 0,
+            "cost": row.get("cost", 0),
+            "sentiment": {s: row.get(f"sentiment_{s}", 0) for s in SENTIMENTS},
+        })
+    return buckets
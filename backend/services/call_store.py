@@ -0,0 +1,310 @@
+"""
+Call Warehouse
+Local copy of Retell calls in MongoDB, kept current by an incremental sync
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from pymongo import UpdateOne, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.retell_client import get_retell_api_key, iter_retell_call_pages
+from services import call_rollups
+
+logger = logging.getLogger(__name__)
+
+# Cutoff date: December 13, 2025 - only show data from this date onwards
+CUTOFF_DATE = datetime(2025, 12, 13, 0, 0, 0, tzinfo=timezone.utc)
+CUTOFF_TIMESTAMP_MS = int(CUTOFF_DATE.timestamp() * 1000)
+
+SYNC_STATE_ID = "retell_calls"
+PAGE_SIZE = 1000
+
+# Calls can keep changing (ended, analyzed) after they start, so every sync
+# re-reads a window behind the high-water mark
+SYNC_OVERLAP_MS = int(os.environ.get("CALL_SYNC_OVERLAP_MS", str(3 * 60 * 60 * 1000)))
+SYNC_INTERVAL_SECONDS = float(os.environ.get("CALL_SYNC_INTERVAL_SECONDS", "60"))
+
+# In-flight atomic contribution swaps per upsert batch
+ROLLUP_WRITE_CONCURRENCY = int(os.environ.get("ROLLUP_WRITE_CONCURRENCY", "16"))
+
+_sync_lock = asyncio.Lock()
+
+
+def period_start_ms(days: int) -> int:
+    """Start of the last `days` days in ms (the cutoff is applied by the queries below)"""
+    return int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
+
+
+def call_timestamp(call: Dict[str, Any]) -> int:
+    """Timestamp used for ordering/filtering a call (start, else created)"""
+    return call.get("start_timestamp", 0) or call.get("created_timestamp", 0) or 0
+
+
+async def ensure_call_indexes(db: AsyncIOMotorDatabase):
+    """Create indexes for the calls collection (idempotent)"""
+    await db.calls.create_index("call_id", unique=True)
+    await db.calls.create_index([("call_timestamp", DESCENDING)])
+    await db.calls.create_index([("agent_id", ASCENDING), ("call_timestamp", DESCENDING)])
+    await call_rollups.ensure_rollup_indexes(db)
+    # Webhook dedupe records only need to outlive Retell's retry window
+    await db.webhook_events.create_index("received_at", expireAfterSeconds=7 * 24 * 60 * 60)
+
+
+async def _swap_contribution(
+    db: AsyncIOMotorDatabase,
+    query: Dict[str, Any],
+    update: Dict[str, Any],
+    upsert: bool = True
+) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    Atomically write a call and return (found, previous rollup contribution).
+    Mongo serializes these per document, so the contribution each writer
+    replaces is exact even with several workers writing the same call.
+    """
+    for attempt in range(2):
+        try:
+            before = await db.calls.find_one_and_update(
+                query, update, projection={"rollup": 1},
+                upsert=upsert, return_document=ReturnDocument.BEFORE
+            )
+            return before is not None, (before or {}).get("rollup")
+        except DuplicateKeyError:
+            # Another writer inserted the call first; the retry updates it instead
+            if attempt:
+                raise
+
+
+async def _gather_bounded(coros: List[Awaitable[Any]]) -> List[Any]:
+    semaphore = asyncio.Semaphore(ROLLUP_WRITE_CONCURRENCY)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+async def upsert_calls(
+    db: AsyncIOMotorDatabase,
+    calls: List[Dict[str, Any]],
+    insert_only: bool = False
+) -> int:
+    """
+    Insert or update raw Retell call objects in the local store.
+    With insert_only, existing calls are left untouched (used for early
+    snapshots like call_started that must not overwrite later state).
+    Calls whose rollup contribution changes are written one at a time with
+    an atomic swap and the counters move by exactly what was replaced;
+    the rest go out in one bulk write that leaves the contribution alone.
+    """
+    now = datetime.now(timezone.utc)
+    docs = {}
+    for call in calls:
+        if call.get("call_id"):
+            doc = {**call, "call_timestamp": call_timestamp(call), "synced_at": now}
+            doc.pop("_id", None)
+            docs[call["call_id"]] = doc
+
+    if not docs:
+        return 0
+
+    existing = {
+        d["call_id"]: d async for d in db.calls.find(
+            {"call_id": {"$in": list(docs)}}, call_rollups.CONTRIBUTION_FIELDS
+        )
+    }
+
+    operations = []
+    swaps = []
+    for call_id, doc in docs.items():
+        old = existing.get(call_id)
+        if insert_only and old:
+            continue
+
+        new_contribution = call_rollups.contribution({**(old or {}), **doc})
+        if old and call_rollups.same_contribution(old.get("rollup"), new_contribution):
+            operations.append(UpdateOne({"call_id": call_id}, {"$set": doc}, upsert=True))
+            continue
+
+        doc["rollup"] = new_contribution
+        update = {"$setOnInsert": doc} if insert_only else {"$set": doc}
+        swaps.append((new_contribution, _swap_contribution(db, {"call_id": call_id}, update)))
+
+    if operations:
+        await db.calls.bulk_write(operations, ordered=False)
+
+    if swaps:
+        results = await _gather_bounded([coro for _, coro in swaps])
+        deltas = []
+        for (new_contribution, _), (found, previous) in zip(swaps, results):
+            if insert_only and found:
+                # Stored meanwhile by another writer; $setOnInsert changed nothing
+                continue
+            deltas.extend(call_rollups.diff(previous, new_contribution))
+        await call_rollups.apply_deltas(db, deltas)
+
+    return len(operations) + len(swaps)
+
+
+async def backfill_rollups(db: AsyncIOMotorDatabase, batch_size: int = 500) -> int:
+    """Add rollup contributions for stored calls that predate the rollup store"""
+    backfilled = 0
+    while True:
+        calls = await db.calls.find(
+            {"rollup": {"$exists": False}}, call_rollups.CONTRIBUTION_FIELDS
+        ).to_list(batch_size)
+        if not calls:
+            break
+
+        contributions = [call_rollups.contribution(call) for call in calls]
+        results = await _gather_bounded([
+            _swap_contribution(
+                db,
+                {"call_id": call["call_id"], "rollup": {"$exists": False}},
+                {"$set": {"rollup": new_contribution}},
+                upsert=False
+            )
+            for call, new_contribution in zip(calls, contributions)
+        ])
+        deltas = []
+        for new_contribution, (found, _) in zip(contributions, results):
+            # Not found: a concurrent writer already gave the call a contribution
+            if found:
+                deltas.extend(call_rollups.diff(None, new_contribution))
+                backfilled += 1
+        await call_rollups.apply_deltas(db, deltas)
+
+    if backfilled:
+        logger.info(f"Backfilled rollups for {backfilled} calls")
+    return backfilled
+
+
+async def sync_calls(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """
+    Incrementally pull calls from Retell into the local store.
+    Starts from the stored high-water mark (minus an overlap window) and
+    pages through all results.
+    """
+    if not get_retell_api_key():
+        return {"synced": 0, "skipped": "RETELL_API_KEY not configured"}
+
+    async with _sync_lock:
+        state = await db.sync_state.find_one({"_id": SYNC_STATE_ID}) or {}
+        high_water_mark = state.get("high_water_mark", CUTOFF_TIMESTAMP_MS)
+        lower_threshold = max(high_water_mark - SYNC_OVERLAP_MS, CUTOFF_TIMESTAMP_MS)
+
+        synced = 0
+        pages = 0
+        newest = high_water_mark
+
+        # Prefetch overlaps the next Retell request with this page's Mongo writes
+        async for calls in iter_retell_call_pages(
+            filter_criteria={"start_timestamp": {"lower_threshold": lower_threshold}},
+            sort_order="ascending",
+            page_size=PAGE_SIZE,
+            prefetch=True
+        ):
+            pages += 1
+            synced += await upsert_calls(db, calls)
+            for call in calls:
+                newest = max(newest, call.get("start_timestamp", 0) or 0)
+
+        await db.sync_state.update_one(
+            {"_id": SYNC_STATE_ID},
+            {"$set": {
+                "high_water_mark": newest,
+                "last_synced_at": datetime.now(timezone.utc),
+                "last_synced_count": synced,
+            }},
+            upsert=True
+        )
+
+    logger.info(f"Call sync: {synced} calls in {pages} pages (high-water mark {newest})")
+    return {"synced": synced, "pages": pages, "high_water_mark": newest}
+
+
+async def run_call_sync_loop(db: AsyncIOMotorDatabase, interval: float = SYNC_INTERVAL_SECONDS):
+    """Background loop keeping the calls collection current"""
+    while True:
+        try:
+            await sync_calls(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Call sync failed: {e}")
+        await asyncio.sleep(interval)
+
+
+# ========== QUERIES ==========
+
+def build_call_match(
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    agent_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Mongo filter for calls in a time range (never before the cutoff date)"""
+    time_filter = {"$gte": max(start_ms or 0, CUTOFF_TIMESTAMP_MS)}
+    if end_ms:
+        time_filter["$lte"] = end_ms
+    match = {"call_timestamp": time_filter}
+    if agent_id:
+        match["agent_id"] = agent_id
+    return match
+
+
+async def find_calls(
+    db: AsyncIOMotorDatabase,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    agent_id: Optional[str] = None,
+    limit: int = 0,
+    projection: Optional[Dict[str, int]] = None
+) -> List[Dict[str, Any]]:
+    """Calls in a time range, most recent first"""
+    cursor = db.calls.find(
+        build_call_match(start_ms, end_ms, agent_id),
+        {"_id": 0, **(projection or {})}
+    ).sort("call_timestamp", DESCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(None)
+
+
+async def summarize_calls(
+    db: AsyncIOMotorDatabase,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    agent_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Aggregate call counts, duration, cost and raw sentiment counts in Mongo"""
+    pipeline = [
+        {"$match": build_call_match(start_ms, end_ms, agent_id)},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "total_calls": {"$sum": 1},
+                "successful_calls": {"$sum": {"$cond": [{"$eq": ["$call_status", "ended"]}, 1, 0]}},
+                "failed_calls": {"$sum": {"$cond": [{"$in": ["$call_status", ["error", "failed"]]}, 1, 0]}},
+                "total_duration_ms": {"$sum": {"$ifNull": ["$duration_ms", 0]}},
+                "total_cost": {"$sum": {"$ifNull": ["$call_cost.combined_cost", 0]}},
+            }}],
+            "sentiments": [{"$group": {
+                "_id": {"$toLower": {"$ifNull": ["$call_analysis.user_sentiment", ""]}},
+                "count": {"$sum": 1},
+            }}],
+        }},
+    ]
+    result = await db.calls.aggregate(pipeline).to_list(1)
+    facets = result[0] if result else {}
+    totals = (facets.get("totals") or [{}])[0]
+    return {
+        "total_calls": totals.get("total_calls", 0),
+        "successful_calls": totals.get("successful_calls", 0),
+        "failed_calls": totals.get("failed_calls", 0),
+        "total_duration_ms": totals.get("total_duration_ms", 0),
+        "total_cost": totals.get("total_cost", 0),
+        "sentiments": {s["_id"]: s["count"] for s in facets.get("sentiments", [])},
+    }
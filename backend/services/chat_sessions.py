@@ -0,0 +1,187 @@
+"""
+Chat Sessions
+Server-side chat history keyed by session_id: in-memory LRU with TTL in
+front of the chat_sessions collection, written behind in batches. Only the
+most recent CHAT_SESSION_MAX_MESSAGES messages are kept.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_SIZE = int(os.environ.get("CHAT_SESSION_CACHE_SIZE", "1000"))
+SESSION_TTL_SECONDS = float(os.environ.get("CHAT_SESSION_TTL_SECONDS", "3600"))
+SESSION_FLUSH_SECONDS = float(os.environ.get("CHAT_SESSION_FLUSH_SECONDS", "2"))
+# Stored history cap; older turns only survive in the rolling summary
+SESSION_MAX_MESSAGES = int(os.environ.get("CHAT_SESSION_MAX_MESSAGES", "200"))
+
+# session_id -> {"agent_id", "messages", "offset", "summary", "summary_count", "last_access"}
+# offset is the absolute index of messages[0]; summary_count is absolute too
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# session_id -> {"agent_id", "messages", "set"} not yet written to Mongo
+_pending: Dict[str, Dict[str, Any]] = {}
+_flush_lock = asyncio.Lock()
+
+
+def _remember(
+    session_id: str,
+    agent_id: str,
+    messages: List[Dict[str, str]],
+    summary: Optional[str] = None,
+    summary_count: int = 0,
+    offset: int = 0
+) -> Dict[str, Any]:
+    entry = {
+        "agent_id": agent_id,
+        "messages": messages,
+        "offset": offset,
+        "summary": summary,
+        "summary_count": summary_count,
+        "last_access": time.monotonic(),
+    }
+    _trim(entry)
+    _cache[session_id] = entry
+    _cache.move_to_end(session_id)
+    # Evicted sessions are safe to drop: unflushed messages live in _pending
+    while len(_cache) > SESSION_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return entry
+
+
+def _trim(entry: Dict[str, Any]):
+    """Drop the oldest messages beyond the cap, as the $slice in flush() does"""
+    overflow = len(entry["messages"]) - SESSION_MAX_MESSAGES
+    if overflow > 0:
+        del entry["messages"][:overflow]
+        entry["offset"] += overflow
+
+
+async def get_session(db: AsyncIOMotorDatabase, session_id: str, agent_id: str) -> Dict[str, Any]:
+    """
+    Stored state of a session: the kept messages, the absolute index of the
+    first one (offset), the rolling summary and how many of the kept
+    messages it covers (empty for a new session)
+    """
+    entry = _cache.get(session_id)
+    if entry and time.monotonic() - entry["last_access"] > SESSION_TTL_SECONDS:
+        _cache.pop(session_id, None)
+        entry = None
+
+    if entry is None:
+        doc = await db.chat_sessions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "agent_id": 1, "messages": 1, "message_count": 1, "summary": 1, "summary_count": 1}
+        ) or {}
+        messages = doc.get("messages", [])
+        offset = doc.get("message_count", len(messages)) - len(messages)
+        # Changes made since the last flush are not in Mongo yet
+        pending = _pending.get(session_id)
+        if pending:
+            messages = messages + pending["messages"]
+            doc.update(pending["set"])
+        entry = _remember(
+            session_id,
+            doc.get("agent_id") or (pending or {}).get("agent_id", agent_id),
+            messages,
+            doc.get("summary"),
+            doc.get("summary_count", 0),
+            offset
+        )
+    else:
+        entry["last_access"] = time.monotonic()
+        _cache.move_to_end(session_id)
+
+    if entry["agent_id"] != agent_id:
+        raise HTTPException(status_code=400, detail="Session belongs to a different agent")
+    return {
+        "messages": list(entry["messages"]),
+        "offset": entry["offset"],
+        "summary": entry["summary"],
+        "summary_count": max(0, entry["summary_count"] - entry["offset"]),
+    }
+
+
+def append_messages(session_id: str, agent_id: str, messages: List[Dict[str, str]]):
+    """Record new turns in memory and queue them for the next flush"""
+    entry = _cache.get(session_id)
+    if entry is not None:
+        entry["messages"].extend(messages)
+        _trim(entry)
+        entry["last_access"] = time.monotonic()
+        _cache.move_to_end(session_id)
+    # Not cached: the next get_session merges the queued turns with Mongo
+    _pending_for(session_id, agent_id)["messages"].extend(messages)
+
+
+def set_summary(session_id: str, agent_id: str, summary: str, summary_count: int):
+    """Store a rolling summary covering the first summary_count messages (absolute)"""
+    entry = _cache.get(session_id)
+    if entry is not None:
+        # Summaries finish out of band; never move backwards
+        if summary_count < entry["summary_count"]:
+            return
+        entry["summary"] = summary
+        entry["summary_count"] = summary_count
+    _pending_for(session_id, agent_id)["set"].update(
+        {"summary": summary, "summary_count": summary_count}
+    )
+
+
+def _pending_for(session_id: str, agent_id: str) -> Dict[str, Any]:
+    return _pending.setdefault(session_id, {"agent_id": agent_id, "messages": [], "set": {}})
+
+
+async def flush(db: AsyncIOMotorDatabase) -> int:
+    """Write queued messages to Mongo in one bulk write"""
+    async with _flush_lock:
+        if not _pending:
+            return 0
+        batch = dict(_pending)
+        _pending.clear()
+
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {"session_id": session_id},
+                {
+                    "$push": {"messages": {"$each": pending["messages"], "$slice": -SESSION_MAX_MESSAGES}},
+                    "$inc": {"message_count": len(pending["messages"])},
+                    "$set": {**pending["set"], "updated_at": now},
+                    "$setOnInsert": {"agent_id": pending["agent_id"], "created_at": now},
+                },
+                upsert=True
+            )
+            for session_id, pending in batch.items()
+        ]
+        try:
+            await db.chat_sessions.bulk_write(operations, ordered=False)
+        except Exception:
+            # Put the batch back in front of anything queued meanwhile
+            for session_id, pending in batch.items():
+                queued = _pending.pop(session_id, None)
+                if queued:
+                    pending["messages"].extend(queued["messages"])
+                    pending["set"].update(queued["set"])
+                _pending[session_id] = pending
+            raise
+        return len(operations)
+
+
+async def run_flush_loop(db: AsyncIOMotorDatabase, interval: float = SESSION_FLUSH_SECONDS):
+    """Background write-behind loop"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Chat session flush failed: {e}")
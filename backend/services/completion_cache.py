@@ -0,0 +1,120 @@
+"""
+Completion Cache
+Content-addressed cache of chat completions: in-memory LRU in front of the
+llm_cache collection (expired by a TTL index)
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from pymongo.errors import PyMongoError
+from services.database import get_database
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "2000"))
+CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+# key -> (expires_at monotonic, response JSON)
+_memory: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+
+def cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: Optional[float],
+    max_tokens: Optional[int]
+) -> str:
+    """SHA-256 of everything that determines the completion (system prompt is messages[0])"""
+    material = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _count(stat: str):
+    with _lock:
+        _stats[stat] += 1
+
+
+def _remember(key: str, data: Dict[str, Any], ttl: float):
+    with _lock:
+        _memory[key] = (time.monotonic() + ttl, data)
+        _memory.move_to_end(key)
+        while len(_memory) > CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+async def get(key: str) -> Optional[Dict[str, Any]]:
+    """Cached response JSON for a key, checking memory then Mongo"""
+    with _lock:
+        entry = _memory.get(key)
+        if entry and entry[0] > time.monotonic():
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+            return entry[1]
+        if entry:
+            _memory.pop(key, None)
+
+    try:
+        doc = await get_database().llm_cache.find_one(
+            {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 0, "response": 1, "expires_at": 1}
+        )
+    except PyMongoError as e:
+        logger.warning(f"LLM cache lookup failed: {e}")
+        doc = None
+
+    if not doc:
+        _count("misses")
+        return None
+
+    remaining = (doc["expires_at"] - datetime.now(timezone.utc)).total_seconds()
+    _remember(key, doc["response"], max(remaining, 0))
+    _count("db_hits")
+    return doc["response"]
+
+
+async def put(key: str, model: str, data: Dict[str, Any]):
+    """Store a successful response in both tiers"""
+    _remember(key, data, CACHE_TTL_SECONDS)
+    _count("stores")
+    now = datetime.now(timezone.utc)
+    try:
+        await get_database().llm_cache.update_one(
+            {"key": key},
+            {"$set": {
+                "model": model,
+                "response": data,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=CACHE_TTL_SECONDS),
+            }},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.warning(f"LLM cache store failed: {e}")
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        lookups = _stats["memory_hits"] + _stats["db_hits"] + _stats["misses"]
+        hits = _stats["memory_hits"] + _stats["db_hits"]
+        return {
+            "enabled": CACHE_ENABLED,
+            "size": len(_memory),
+            "max_size": CACHE_SIZE,
+            "ttl_seconds": CACHE_TTL_SECONDS,
+            **_stats,
+            "hit_rate": hits / lookups if lookups else 0,
+        }
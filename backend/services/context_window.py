@@ -0,0 +1,176 @@
+"""
+Chat Context Window
+Token-aware trimming of chat history to a per-model budget, with an
+optional rolling summary of turns that no longer fit
+"""
+import os
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+from services import chat_sessions
+from services.background import spawn
+from services.llm_gateway import complete_text
+
+logger = logging.getLogger(__name__)
+
+# Exact counts need the optional 'tiktoken' package; otherwise estimate
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_DEFAULT_TOKENS", "8192"))
+
+# Prompt cap well below the model limit, so per-turn latency and cost stay flat
+MAX_PROMPT_TOKENS = int(os.environ.get("CHAT_CONTEXT_MAX_PROMPT_TOKENS", "12000"))
+SUMMARY_ENABLED = os.environ.get("CHAT_CONTEXT_SUMMARY", "false").lower() in ("1", "true", "yes")
+SUMMARY_MAX_TOKENS = int(os.environ.get("CHAT_CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+SUMMARY_BATCH_MESSAGES = int(os.environ.get("CHAT_CONTEXT_SUMMARY_BATCH", "10"))
+
+# Per-message framing overhead in the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+# Sessions with a summary currently being generated
+_summarizing: Set[str] = set()
+
+
+@lru_cache(maxsize=32)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+@lru_cache(maxsize=8192)
+def _count_text(model: str, text: str) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        # Roughly 4 characters per token for English text
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(message: Dict[str, str], model: str = "gpt-4o") -> int:
+    """Tokens a single chat message occupies (cached per model and content)"""
+    return MESSAGE_OVERHEAD_TOKENS + _count_text(model, message.get("content") or "")
+
+
+def context_limit(model: str) -> int:
+    if model in MODEL_CONTEXT_TOKENS:
+        return MODEL_CONTEXT_TOKENS[model]
+    # Dated snapshots like gpt-4o-2024-08-06 share their family's window
+    for name in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_TOKENS[name]
+    return DEFAULT_CONTEXT_TOKENS
+
+
+def prompt_budget(model: str, max_tokens: Optional[int]) -> int:
+    """Tokens available for the prompt once the completion (max_tokens) is reserved"""
+    available = context_limit(model) - (max_tokens or 0) - REPLY_PRIMING_TOKENS
+    return max(0, min(available, MAX_PROMPT_TOKENS))
+
+
+def fit_messages(
+    system_prompt: str,
+    history: List[Dict[str, str]],
+    new_message: Optional[Dict[str, str]] = None,
+    model: str = "gpt-4o",
+    max_tokens: Optional[int] = None,
+    summary: Optional[str] = None
+) -> Tuple[List[Dict[str, str]], int]:
+    """
+    System prompt, optional summary, and the most recent history that fits the
+    budget, followed by the new message. Returns (messages, dropped) where
+    dropped is how many leading history messages were left out.
+    """
+    head = [{"role": "system", "content": system_prompt}]
+    if summary:
+        head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    tail = [new_message] if new_message else []
+
+    budget = prompt_budget(model, max_tokens)
+    used = sum(count_message_tokens(m, model) for m in head + tail)
+
+    kept = 0
+    for message in reversed(history):
+        cost = count_message_tokens(message, model)
+        if used + cost > budget:
+            break
+        used += cost
+        kept += 1
+
+    window = history[len(history) - kept:] if kept else []
+    return head + window + tail, len(history) - kept
+
+
+async def summarize_turns(
+    previous_summary: Optional[str],
+    messages: List[Dict[str, str]],
+    api_key: Optional[str] = None
+) -> str:
+    """Fold older turns into the rolling summary"""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = (
+        f"Existing summary:\n{previous_summary or '(none)'}\n\n"
+        f"New conversation turns:\n{transcript}\n\n"
+        "Update the summary so it captures facts, user goals, decisions and open questions. "
+        "Be concise."
+    )
+    return await complete_text(
+        [
+            {"role": "system", "content": "You maintain running summaries of conversations."},
+            {"role": "user", "content": prompt},
+        ],
+        model="gpt-4o-mini",
+        temperature=0,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        api_key=api_key,
+        purpose="context_summary"
+    )
+
+
+def schedule_summary(
+    session_id: str,
+    agent_id: str,
+    session: Dict[str, Any],
+    dropped: int,
+    api_key: Optional[str] = None
+):
+    """
+    Fold the turns that fell out of the window (plus a batch of the oldest
+    kept ones, so this doesn't run every turn) into the session summary.
+    Runs in the background; the current turn uses the existing summary.
+    """
+    if session_id in _summarizing:
+        return
+    start = session["summary_count"]
+    end = min(len(session["messages"]), start + dropped + SUMMARY_BATCH_MESSAGES)
+    turns = session["messages"][start:end]
+    if not turns:
+        return
+
+    async def run():
+        try:
+            summary = await summarize_turns(session["summary"], turns, api_key)
+            chat_sessions.set_summary(session_id, agent_id, summary, session["offset"] + end)
+        except Exception as e:
+            logger.warning(f"Could not summarize chat session {session_id}: {e}")
+        finally:
+            _summarizing.discard(session_id)
+
+    _summarizing.add(session_id)
+    spawn(run(), f"context-summary:{session_id}")
@@ -0,0 +1,269 @@
+"""
+Conversation Simulator
+Local multi-turn evaluation: an LLM caller persona talks to the agent's
+system prompt for up to max_turns exchanges, then the transcript is scored
+against the scenario's expected topics, expected actions and success criteria
+"""
+import os
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from services.llm_gateway import LLMError, complete_text
+from services.topic_matcher import TopicMatcher
+
+SIM_AGENT_MODEL = os.environ.get("SIM_AGENT_MODEL", "gpt-4o")
+SIM_CALLER_MODEL = os.environ.get("SIM_CALLER_MODEL", "gpt-4o-mini")
+SIM_JUDGE_MODEL = os.environ.get("SIM_JUDGE_MODEL", "gpt-4o-mini")
+# Upper bound on a scenario's max_turns (one turn = caller message + agent reply)
+SIM_MAX_TURNS = int(os.environ.get("SIM_MAX_TURNS", "20"))
+# Per-message cap on stored transcripts, to keep batch_tests documents small
+SIM_TRANSCRIPT_MAX_CHARS = int(os.environ.get("SIM_TRANSCRIPT_MAX_CHARS", "1000"))
+
+END_MARKER = "[END_CALL]"
+
+CALLER_PROMPT = """You are role-playing a caller in a test of a customer service agent.
+
+Scenario: {name}
+{description}
+
+You opened the conversation with: "{user_message}"
+
+Stay in character and pursue the goal behind that opening message. Reply the way
+a real person on a phone call would: short (one to three sentences), natural,
+with follow-up questions where they make sense. Never mention that this is a test.
+When your goal is met, or it's clear the agent can't help, say goodbye and end
+your message with {end_marker}"""
+
+JUDGE_PROMPT = """You grade conversations between a customer service agent and a caller.
+Judge only what the agent actually said or did in the transcript.
+
+Return only valid JSON in this format:
+{{"actions": {{"<action>": true or false, ...}}, "success_criteria_met": true or false or null, "reason": "one sentence"}}
+
+Use every expected action below as a key in "actions". Use null for
+success_criteria_met when no success criteria are given."""
+
+
+def clamp_turns(max_turns: Optional[int]) -> int:
+    return max(1, min(max_turns or 1, SIM_MAX_TURNS))
+
+
+def caller_prompt(scenario: Dict[str, Any]) -> str:
+    return CALLER_PROMPT.format(
+        name=scenario.get("name", "Customer call"),
+        description=scenario.get("description") or "",
+        user_message=scenario.get("user_message", ""),
+        end_marker=END_MARKER
+    )
+
+
+async def simulate_conversation(
+    api_key: str,
+    system_prompt: str,
+    scenario: Dict[str, Any],
+    use_cache: Optional[bool] = None
+) -> List[Dict[str, str]]:
+    """
+    Alternate agent and caller turns, starting from the scenario's user
+    message, until the caller hangs up or max_turns agent replies are in.
+    Both sides' message lists only ever grow at the end, so every request
+    shares its predecessor's prefix (which the provider's prompt cache picks
+    up). Turns are sampled, so they bypass the completion cache unless
+    use_cache=True asks for an identical conversation to be replayed.
+    """
+    opening = scenario.get("user_message", "")
+    agent_messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": opening}
+    ]
+    # The caller model sees the same conversation with the roles swapped
+    caller_messages = [
+        {"role": "system", "content": caller_prompt(scenario)},
+        {"role": "assistant", "content": opening}
+    ]
+    transcript = [{"role": "caller", "content": opening}]
+
+    turns = clamp_turns(scenario.get("max_turns"))
+    for turn in range(turns):
+        reply = await complete_text(
+            agent_messages,
+            model=SIM_AGENT_MODEL,
+            temperature=0.7,
+            max_tokens=512,
+            api_key=api_key,
+            purpose="sim_agent",
+            cache=use_cache
+        )
+        transcript.append({"role": "agent", "content": reply})
+        agent_messages.append({"role": "assistant", "content": reply})
+        caller_messages.append({"role": "user", "content": reply})
+        if turn == turns - 1:
+            break
+
+        caller_reply = await complete_text(
+            caller_messages,
+            model=SIM_CALLER_MODEL,
+            temperature=0.7,
+            max_tokens=200,
+            api_key=api_key,
+            purpose="sim_caller",
+            cache=use_cache
+        )
+        hung_up = END_MARKER in caller_reply
+        caller_reply = caller_reply.replace(END_MARKER, "").strip()
+        if caller_reply:
+            transcript.append({"role": "caller", "content": caller_reply})
+            agent_messages.append({"role": "user", "content": caller_reply})
+            caller_messages.append({"role": "assistant", "content": caller_reply})
+        if hung_up or not caller_reply:
+            break
+
+    return transcript
+
+
+def _parse_json(content: str) -> Dict[str, Any]:
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return json.loads(content.strip())
+
+
+def format_transcript(transcript: List[Dict[str, str]]) -> str:
+    return "\n".join(f"{t['role'].capitalize()}: {t['content']}" for t in transcript)
+
+
+async def judge_transcript(
+    api_key: str,
+    scenario: Dict[str, Any],
+    transcript: List[Dict[str, str]]
+) -> Dict[str, Any]:
+    """LLM verdict on expected_actions and success_criteria (temperature 0, so cached)"""
+    actions = scenario.get("expected_actions") or []
+    criteria = scenario.get("success_criteria")
+    task = "Expected actions:\n" + ("\n".join(f"- {a}" for a in actions) or "(none)")
+    task += f"\n\nSuccess criteria:\n{criteria or '(none)'}"
+    task += f"\n\nTranscript:\n{format_transcript(transcript)}"
+
+    content = await complete_text(
+        [
+            {"role": "system", "content": JUDGE_PROMPT},
+            {"role": "user", "content": task}
+        ],
+        model=SIM_JUDGE_MODEL,
+        temperature=0,
+        max_tokens=400,
+        api_key=api_key,
+        purpose="sim_judge"
+    )
+    verdict = _parse_json(content)
+    judged = verdict.get("actions") or {}
+    return {
+        "actions": {action: bool(judged.get(action)) for action in actions},
+        "success_criteria_met": verdict.get("success_criteria_met") if criteria else None,
+        "reason": verdict.get("reason"),
+    }
+
+
+async def evaluate_conversation(
+    api_key: str,
+    system_prompt: str,
+    test_case: Dict[str, Any],
+    scenario: Dict[str, Any],
+    use_cache: Optional[bool] = None,
+    matcher: Optional[TopicMatcher] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Multi-turn counterpart of batch_tests.evaluate_scenario; returns
+    (outcome, result). The score averages topic coverage over the agent's
+    turns, the share of expected actions taken and the success criteria.
+    """
+    try:
+        try:
+            transcript = await simulate_conversation(api_key, system_prompt, scenario, use_cache)
+        except LLMError as e:
+            return "error", {
+                "test_case_id": test_case.get("id"),
+                "scenario_name": scenario.get("name"),
+                "error": f"API error: {e.status_code}",
+                "passed": False,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+
+        agent_turns = [(i, t["content"]) for i, t in enumerate(transcript) if t["role"] == "agent"]
+
+        # Topics, anywhere in the agent's turns: spans are [turn index, start, end]
+        # (deduplicated, blanks dropped, so a repeated topic can't cap the score)
+        if matcher is None:
+            matcher = TopicMatcher(scenario.get("expected_topics") or [], scenario.get("topic_synonyms"))
+        expected_topics = matcher.topics
+        topic_hits: Dict[str, List[List[int]]] = {topic: [] for topic in expected_topics}
+        for index, content in agent_turns:
+            for topic, spans in matcher.match(content).items():
+                topic_hits[topic].extend([index, start, end] for start, end in spans)
+        topics_covered = sum(1 for spans in topic_hits.values() if spans)
+
+        expected_actions = scenario.get("expected_actions") or []
+        verdict: Dict[str, Any] = {"actions": {}, "success_criteria_met": None, "reason": None}
+        if expected_actions or scenario.get("success_criteria"):
+            try:
+                verdict = await judge_transcript(api_key, scenario, transcript)
+            except LLMError as e:
+                return "error", {
+                    "test_case_id": test_case.get("id"),
+                    "scenario_name": scenario.get("name"),
+                    "error": f"Judge API error: {e.status_code}",
+                    "passed": False,
+                    "timestamp": datetime.now(timezone.utc).isoformat()
+                }
+        actions_taken = sum(1 for done in verdict["actions"].values() if done)
+
+        components = []
+        if expected_topics:
+            components.append(topics_covered / len(expected_topics))
+        if expected_actions:
+            components.append(actions_taken / len(expected_actions))
+        if verdict["success_criteria_met"] is not None:
+            components.append(1.0 if verdict["success_criteria_met"] else 0.0)
+
+        if components:
+            score = sum(components) / len(components)
+            passed = score >= 0.5
+        else:
+            # No specific expectations, consider passed if the agent said something
+            passed = any(len(content) > 10 for _, content in agent_turns)
+            score = 1.0 if passed else 0.0
+
+        return ("pass" if passed else "fail"), {
+            "test_case_id": test_case.get("id"),
+            "scenario_name": scenario.get("name"),
+            "user_message": scenario.get("user_message"),
+            "agent_response": agent_turns[-1][1][:500] if agent_turns else "",
+            "transcript": [
+                {"role": t["role"], "content": t["content"][:SIM_TRANSCRIPT_MAX_CHARS]} for t in transcript
+            ],
+            "turns": len(agent_turns),
+            "expected_topics": expected_topics,
+            "topics_covered": topics_covered,
+            "topic_hits": topic_hits,
+            "expected_actions": expected_actions,
+            "actions": verdict["actions"],
+            "actions_taken": actions_taken,
+            "success_criteria_met": verdict["success_criteria_met"],
+            "judge_reason": verdict["reason"],
+            "score": score,
+            "passed": passed,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    except Exception as e:
+        return "error", {
+            "test_case_id": test_case.get("id"),
+            "scenario_name": scenario.get("name", "Unknown"),
+            "error": str(e),
+            "passed": False,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
@@ -0,0 +1,146 @@
+"""
+MongoDB Connection
+Single process-wide Motor client shared by every route, with pool monitoring
+"""
+import os
+import logging
+import threading
+from collections import defaultdict
+from typing import Optional, Dict, Any
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from services.metrics import record_outbound
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool counters per server address"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checked_out": 0,
+            "checkouts_total": 0,
+            "checkout_failures": 0,
+            "pool_cleared": 0,
+        })
+
+    def _inc(self, address, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[f"{address[0]}:{address[1]}"][key] += amount
+
+    def pool_created(self, event):
+        self._inc(event.address, "connections_created", 0)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._inc(event.address, "pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._inc(event.address, "connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._inc(event.address, "connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._inc(event.address, "checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._inc(event.address, "checked_out")
+        self._inc(event.address, "checkouts_total")
+
+    def connection_checked_in(self, event):
+        self._inc(event.address, "checked_out", -1)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            result = {}
+            for address, stats in self._stats.items():
+                result[address] = {
+                    **stats,
+                    "open_connections": stats["connections_created"] - stats["connections_closed"],
+                }
+            return result
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Feeds per-command latency into the outbound request histogram"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_outbound("mongo", "command", event.command_name, "ok", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record_outbound("mongo", "command", event.command_name, "error", event.duration_micros / 1e6)
+
+
+_client: Optional[AsyncIOMotorClient] = None
+_pool_listener = PoolStatsListener()
+_command_listener = CommandTimingListener()
+
+
+def get_pool_settings() -> Dict[str, Any]:
+    """Connection pool settings from environment"""
+    settings = {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000")),
+    }
+    if os.environ.get("MONGO_MAX_IDLE_TIME_MS"):
+        settings["maxIdleTimeMS"] = int(os.environ["MONGO_MAX_IDLE_TIME_MS"])
+    if os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS"):
+        settings["waitQueueTimeoutMS"] = int(os.environ["MONGO_WAIT_QUEUE_TIMEOUT_MS"])
+    return settings
+
+
+def get_client() -> AsyncIOMotorClient:
+    """Get the shared Motor client, creating it on first use"""
+    global _client
+    if _client is None:
+        mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+        _client = AsyncIOMotorClient(
+            mongo_url,
+            tz_aware=True,  # dates come back as aware UTC datetimes
+            event_listeners=[_pool_listener, _command_listener],
+            **get_pool_settings()
+        )
+        logger.info(f"MongoDB client created with pool settings: {get_pool_settings()}")
+    return _client
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    """FastAPI dependency returning the shared database handle"""
+    return get_client()[os.environ.get("DB_NAME", "intelliax")]
+
+
+def close_client():
+    """Close the shared Motor client (called from lifespan shutdown)"""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+        logger.info("MongoDB connection closed")
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Current pool settings and per-server connection counters"""
+    return {
+        "settings": get_pool_settings(),
+        "servers": _pool_listener.snapshot(),
+    }
@@ -0,0 +1,132 @@
+"""
+Database Bootstrap
+Idempotent startup step: indexes for the core collections and migration of
+ISO-string timestamps to native BSON dates
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple, Any
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# (collection, keys, index options)
+UNIQUE = {"unique": True}
+INDEXES: List[Tuple[str, List[Tuple[str, int]], Dict[str, Any]]] = [
+    ("agents", [("id", ASCENDING)], UNIQUE),
+    ("agents", [("retell_agent_id", ASCENDING)], {}),
+    ("agents", [("created_at", DESCENDING)], {}),
+    ("flows", [("id", ASCENDING)], UNIQUE),
+    ("flows", [("agent_id", ASCENDING), ("id", ASCENDING)], {}),
+    ("tools", [("id", ASCENDING)], UNIQUE),
+    ("knowledge_bases", [("id", ASCENDING)], UNIQUE),
+    ("knowledge", [("retell_kb_id", ASCENDING)], {}),
+    ("insights", [("id", ASCENDING)], UNIQUE),
+    ("test_cases", [("id", ASCENDING)], UNIQUE),
+    ("test_cases", [("agent_id", ASCENDING)], {}),
+    ("batch_tests", [("id", ASCENDING)], UNIQUE),
+    ("batch_tests", [("agent_id", ASCENDING), ("created_at", DESCENDING)], {}),
+    ("batch_tests", [("created_at", DESCENDING)], {}),
+    ("voice_tests", [("id", ASCENDING)], {}),
+    ("voice_tests", [("agent_id", ASCENDING), ("created_at", DESCENDING)], {}),
+    ("voice_tests", [("created_at", DESCENDING)], {}),
+    ("conversation_flows", [("id", ASCENDING)], {}),
+    ("conversation_flows", [("retell_flow_id", ASCENDING)], {}),
+    ("generated_prompts", [("id", ASCENDING)], UNIQUE),
+    ("generated_prompts", [("created_at", DESCENDING)], {}),
+    ("chat_sessions", [("session_id", ASCENDING)], UNIQUE),
+    ("chat_sessions", [("agent_id", ASCENDING), ("updated_at", DESCENDING)], {}),
+    ("chat_sessions", [("updated_at", DESCENDING)], {}),
+    ("llm_cache", [("key", ASCENDING)], UNIQUE),
+    # Entries carry their own expiry, so the TTL can change without a rebuild
+    ("llm_cache", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ("user_subscriptions", [("user_id", ASCENDING)], UNIQUE),
+    # Pending payments may be stored before the provider returns an ID
+    ("payments", [("payment_id", ASCENDING)], {
+        "unique": True, "partialFilterExpression": {"payment_id": {"$type": "string"}}
+    }),
+]
+
+# Top-level timestamp fields historically written as ISO strings
+DATE_FIELDS: Dict[str, List[str]] = {
+    "agents": ["created_at", "updated_at"],
+    "flows": ["created_at", "updated_at"],
+    "tools": ["created_at"],
+    "knowledge_bases": ["created_at"],
+    "knowledge": ["created_at", "updated_at"],
+    "insights": ["created_at"],
+    "test_cases": ["created_at", "updated_at"],
+    "batch_tests": ["created_at", "updated_at"],
+    "voice_tests": ["created_at"],
+    "conversation_flows": ["created_at", "updated_at"],
+    "generated_prompts": ["created_at"],
+    "user_subscriptions": ["purchased_at", "updated_at"],
+    "payments": ["created_at", "completed_at", "failed_at"],
+}
+
+MIGRATION_BATCH_SIZE = 500
+
+
+def parse_timestamp(value: str) -> Any:
+    """Parse an ISO timestamp string as an aware UTC datetime (None if unparseable)"""
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create indexes for the core collections (idempotent)"""
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            if not options.get("unique"):
+                raise
+            # Existing duplicates block a unique index; keep lookups fast anyway
+            logger.warning(f"Unique index on {collection} {keys} not created ({e}), using non-unique")
+            await db[collection].create_index(keys)
+
+
+async def migrate_string_dates(db: AsyncIOMotorDatabase) -> int:
+    """Convert ISO-string timestamps to native dates; only touches string values"""
+    migrated = 0
+    for collection, fields in DATE_FIELDS.items():
+        for field in fields:
+            # Unparseable values are left as-is, so skip past them instead of looping
+            last_id = None
+            while True:
+                query: Dict[str, Any] = {field: {"$type": "string"}}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                docs = await db[collection].find(query, {field: 1}).sort("_id", ASCENDING).to_list(MIGRATION_BATCH_SIZE)
+                if not docs:
+                    break
+                last_id = docs[-1]["_id"]
+
+                operations = []
+                for doc in docs:
+                    parsed = parse_timestamp(doc[field])
+                    if parsed is not None:
+                        operations.append(UpdateOne(
+                            {"_id": doc["_id"], field: doc[field]},
+                            {"$set": {field: parsed}}
+                        ))
+                if operations:
+                    result = await db[collection].bulk_write(operations, ordered=False)
+                    migrated += result.modified_count
+
+    if migrated:
+        logger.info(f"Migrated {migrated} string timestamps to native dates")
+    return migrated
+
+
+async def bootstrap_database(db: AsyncIOMotorDatabase):
+    """Indexes and data migrations run once at startup"""
+    await ensure_indexes(db)
+    await migrate_string_dates(db)
@@ -0,0 +1,62 @@
+"""
+Rate-Aware Dispatcher
+Runs one coroutine per item under a concurrency bound and a token-bucket
+rate limit, capturing each item's result or error
+"""
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """`rate` tokens per second, bursting up to `capacity`; shared by every caller of an API"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                # Holding the lock keeps waiters in FIFO order
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def dispatch(
+    items: Sequence[T],
+    fn: Callable[[int, T], Awaitable[Any]],
+    concurrency: int,
+    bucket: Optional[TokenBucket] = None
+) -> List[Tuple[Any, Optional[Exception]]]:
+    """
+    Call fn(index, item) for every item, at most `concurrency` at a time and
+    no faster than the bucket allows. Returns (result, error) per item, in
+    input order; one item failing doesn't affect the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index: int, item: T) -> Tuple[Any, Optional[Exception]]:
+        async with semaphore:
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                return await fn(index, item), None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return None, e
+
+    return await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
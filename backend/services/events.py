@@ -0,0 +1,76 @@
+"""
+Event Broker
+In-process publish/subscribe for live progress streams (SSE)
+"""
+import json
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Per-subscriber buffer; a subscriber that falls this far behind loses events
+# (the stream starts with a snapshot, so clients can always resync)
+SUBSCRIBER_QUEUE_SIZE = 1000
+HEARTBEAT_SECONDS = 15.0
+
+_subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+
+def publish(topic: str, event: Dict[str, Any]):
+    """Deliver an event to every current subscriber of a topic (never blocks)"""
+    for queue in list(_subscribers.get(topic, ())):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(f"Dropping event for slow subscriber on {topic}")
+
+
+def subscribe(topic: str) -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    _subscribers.setdefault(topic, set()).add(queue)
+    return queue
+
+
+def unsubscribe(topic: str, queue: asyncio.Queue):
+    queues = _subscribers.get(topic)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            _subscribers.pop(topic, None)
+
+
+def format_sse(event: Dict[str, Any], event_type: Optional[str] = None) -> str:
+    """Encode an event as a Server-Sent Events frame"""
+    frame = f"event: {event_type or event.get('type', 'message')}\n"
+    return frame + f"data: {json.dumps(event, default=str)}\n\n"
+
+
+async def sse_stream(
+    queue: asyncio.Queue,
+    topic: str,
+    snapshot: Dict[str, Any],
+    final_types: Set[str],
+    finished: bool = False
+) -> AsyncIterator[str]:
+    """
+    SSE body: a snapshot event, then published events until one of
+    final_types arrives (or right away if already finished). Sends
+    heartbeat comments to keep proxies from timing out.
+    Subscribe before reading the snapshot so no event falls in between.
+    """
+    try:
+        yield format_sse(snapshot, "snapshot")
+        if finished:
+            return
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            yield format_sse(event)
+            if event.get("type") in final_types:
+                return
+    finally:
+        unsubscribe(topic, queue)
@@ -0,0 +1,332 @@
+"""
+LLM Gateway
+Single pooled client for OpenAI chat completions with a global concurrency
+limit, jittered retries, per-purpose latency/token metrics and an optional
+completion cache
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, AsyncIterator
+import httpx
+from fastapi import HTTPException
+from services import completion_cache
+from services.metrics import track_outbound
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1")
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.environ.get("LLM_RETRY_MAX_SECONDS", "8"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Shared client - created in lifespan startup, closed on shutdown
+_client: Optional[httpx.AsyncClient] = None
+_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+class LLMError(HTTPException):
+    """Chat completion failed; detail is the provider's error message"""
+
+
+class LLMStats:
+    """Call, retry, latency and token counters per purpose"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "latency_ms_total": 0.0,
+            "latency_ms_max": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        })
+
+    def record(self, purpose: str, latency_ms: float, usage: Optional[Dict[str, Any]], retries: int, error: bool):
+        with self._lock:
+            stats = self._stats[purpose]
+            stats["calls"] += 1
+            stats["errors"] += 1 if error else 0
+            stats["retries"] += retries
+            stats["latency_ms_total"] += latency_ms
+            stats["latency_ms_max"] = max(stats["latency_ms_max"], latency_ms)
+            if usage:
+                stats["prompt_tokens"] += usage.get("prompt_tokens", 0) or 0
+                stats["completion_tokens"] += usage.get("completion_tokens", 0) or 0
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                purpose: {
+                    **stats,
+                    "latency_ms_avg": stats["latency_ms_total"] / stats["calls"] if stats["calls"] else 0,
+                }
+                for purpose, stats in self._stats.items()
+            }
+
+
+_stats = LLMStats()
+
+
+def get_openai_api_key() -> Optional[str]:
+    """Get OpenAI API key from environment (dynamic lookup)"""
+    return os.environ.get("OPENAI_API_KEY")
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Build the pooled keep-alive client from environment settings"""
+    limits = httpx.Limits(
+        max_connections=int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", str(LLM_MAX_CONCURRENCY))),
+        max_keepalive_connections=int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+    timeout = httpx.Timeout(
+        float(os.environ.get("LLM_HTTP_TIMEOUT", "60")),
+        connect=float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", "10")),
+    )
+    return httpx.AsyncClient(base_url=OPENAI_API_BASE, limits=limits, timeout=timeout)
+
+
+async def start_llm_client():
+    """Create the shared LLM client (called from lifespan startup)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logger.info(f"LLM HTTP client started (base: {OPENAI_API_BASE}, concurrency: {LLM_MAX_CONCURRENCY})")
+
+
+async def close_llm_client():
+    """Close the shared LLM client (called from lifespan shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("LLM HTTP client closed")
+
+
+def get_llm_client() -> httpx.AsyncClient:
+    """Get the shared LLM client, creating it lazily outside the lifespan"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Gateway settings and per-purpose counters"""
+    return {
+        "settings": {
+            "base_url": OPENAI_API_BASE,
+            "max_concurrency": LLM_MAX_CONCURRENCY,
+            "max_retries": LLM_MAX_RETRIES,
+        },
+        "in_flight": LLM_MAX_CONCURRENCY - _semaphore._value,
+        "purposes": _stats.snapshot(),
+        "cache": completion_cache.get_cache_stats(),
+    }
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        error_json = response.json()
+        return error_json.get("error", {}).get("message", response.text)
+    except Exception:
+        return response.text
+
+
+def _backoff_seconds(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Full-jitter exponential backoff, honouring Retry-After when given"""
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_RETRY_MAX_SECONDS)
+            except ValueError:
+                pass
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+async def chat_completion(
+    messages: List[Dict[str, str]],
+    model: str = "gpt-4o",
+    temperature: Optional[float] = 0.7,
+    max_tokens: Optional[int] = None,
+    api_key: Optional[str] = None,
+    timeout: Optional[float] = None,
+    purpose: str = "chat",
+    cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Call /chat/completions and return the raw response JSON.
+    Raises LLMError with the provider's status code and message.
+    cache=None serves identical temperature-0 requests from the completion
+    cache; pass True to cache sampled requests too, or False to bypass it.
+    """
+    api_key = api_key or get_openai_api_key()
+    if not api_key:
+        raise LLMError(status_code=500, detail="OPENAI_API_KEY not configured")
+
+    use_cache = completion_cache.CACHE_ENABLED and (cache if cache is not None else temperature == 0)
+    if use_cache:
+        key = completion_cache.cache_key(model, messages, temperature, max_tokens)
+        cached = await completion_cache.get(key)
+        if cached is not None:
+            return cached
+
+    payload: Dict[str, Any] = {"model": model, "messages": messages}
+    if temperature is not None:
+        payload["temperature"] = temperature
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+
+    client = get_llm_client()
+    started = time.perf_counter()
+    retries = 0
+    usage = None
+    error = True
+    try:
+        async with _semaphore:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                try:
+                    with track_outbound("openai", "POST", "/chat/completions") as call:
+                        response = await client.post(
+                            "/chat/completions", headers=headers, json=payload, timeout=request_timeout
+                        )
+                        call["status"] = response.status_code
+                except httpx.TransportError as e:
+                    if attempt < LLM_MAX_RETRIES:
+                        retries += 1
+                        await asyncio.sleep(_backoff_seconds(attempt))
+                        continue
+                    logger.error(f"LLM connection error ({purpose}): {str(e)}")
+                    raise LLMError(status_code=500, detail=f"Failed to connect to LLM API: {str(e)}")
+
+                if response.status_code in RETRYABLE_STATUS and attempt < LLM_MAX_RETRIES:
+                    retries += 1
+                    delay = _backoff_seconds(attempt, response)
+                    logger.warning(f"LLM {purpose} got {response.status_code}, retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                if response.status_code != 200:
+                    raise LLMError(status_code=response.status_code, detail=_error_detail(response))
+
+                data = response.json()
+                usage = data.get("usage")
+                error = False
+                break
+    finally:
+        latency_ms = (time.perf_counter() - started) * 1000
+        _stats.record(purpose, latency_ms, usage, retries, error)
+
+    if use_cache:
+        await completion_cache.put(key, model, data)
+    return data
+
+
+async def complete_text(messages: List[Dict[str, str]], **kwargs) -> str:
+    """chat_completion returning just the first choice's message content"""
+    data = await chat_completion(messages, **kwargs)
+    return data["choices"][0]["message"]["content"]
+
+
+async def stream_chat_completion(
+    messages: List[Dict[str, str]],
+    model: str = "gpt-4o",
+    temperature: Optional[float] = 0.7,
+    max_tokens: Optional[int] = None,
+    api_key: Optional[str] = None,
+    timeout: Optional[float] = None,
+    purpose: str = "chat_stream"
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream /chat/completions. Yields {"type": "delta", "content": ...} for each
+    token delta, then {"type": "usage", "usage": ...} when the provider reports it.
+    Retries only happen before the first delta; raises LLMError like chat_completion.
+    """
+    api_key = api_key or get_openai_api_key()
+    if not api_key:
+        raise LLMError(status_code=500, detail="OPENAI_API_KEY not configured")
+
+    payload: Dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    if temperature is not None:
+        payload["temperature"] = temperature
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+
+    client = get_llm_client()
+    started = time.perf_counter()
+    retries = 0
+    usage = None
+    error = True
+    streamed = False
+    try:
+        async with _semaphore:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                try:
+                    with track_outbound("openai", "POST", "/chat/completions") as call:
+                        async with client.stream(
+                            "POST", "/chat/completions", headers=headers, json=payload, timeout=request_timeout
+                        ) as response:
+                            call["status"] = response.status_code
+                            if response.status_code in RETRYABLE_STATUS and attempt < LLM_MAX_RETRIES:
+                                retries += 1
+                                delay = _backoff_seconds(attempt, response)
+                                logger.warning(f"LLM {purpose} got {response.status_code}, retrying in {delay:.2f}s")
+                                await asyncio.sleep(delay)
+                                continue
+
+                            if response.status_code != 200:
+                                await response.aread()
+                                raise LLMError(status_code=response.status_code, detail=_error_detail(response))
+
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    break
+                                chunk = json.loads(data)
+                                if chunk.get("usage"):
+                                    usage = chunk["usage"]
+                                    yield {"type": "usage", "usage": usage}
+                                for choice in chunk.get("choices") or []:
+                                    content = (choice.get("delta") or {}).get("content")
+                                    if content:
+                                        streamed = True
+                                        yield {"type": "delta", "content": content}
+                            error = False
+                            return
+                except httpx.TransportError as e:
+                    # Once deltas were relayed a retry would duplicate them
+                    if attempt < LLM_MAX_RETRIES and not streamed:
+                        retries += 1
+                        await asyncio.sleep(_backoff_seconds(attempt))
+                        continue
+                    logger.error(f"LLM connection error ({purpose}): {str(e)}")
+                    raise LLMError(status_code=500, detail=f"Failed to connect to LLM API: {str(e)}")
+    finally:
+        latency_ms = (time.perf_counter() - started) * 1000
+        _stats.record(purpose, latency_ms, usage, retries, error)
@@ -0,0 +1,464 @@
+"""
+LLM Router
+Provider adapters (OpenAI, Anthropic, Gemini) behind one completion call,
+with per-provider health tracking, automatic failover and optional hedging
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+from services.metrics import track_outbound
+from services.llm_gateway import (
+    LLMError,
+    chat_completion,
+    stream_chat_completion,
+    get_openai_api_key,
+)
+
+logger = logging.getLogger(__name__)
+
+ANTHROPIC_API_BASE = os.environ.get("ANTHROPIC_API_BASE", "https://api.anthropic.com")
+ANTHROPIC_VERSION = os.environ.get("ANTHROPIC_VERSION", "2023-06-01")
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+
+# Providers tried after the requested one, in this order
+FAILOVER_ORDER = [
+    p.strip() for p in os.environ.get("LLM_FAILOVER_ORDER", "openai,anthropic,gemini").split(",") if p.strip()
+]
+# Start the next provider if the current one hasn't answered in this long (0 = off)
+HEDGE_AFTER_MS = float(os.environ.get("LLM_HEDGE_AFTER_MS", "0"))
+
+# Rolling health window per provider
+HEALTH_WINDOW = int(os.environ.get("LLM_PROVIDER_HEALTH_WINDOW", "50"))
+HEALTH_MIN_SAMPLES = int(os.environ.get("LLM_PROVIDER_HEALTH_MIN_SAMPLES", "5"))
+HEALTH_MAX_ERROR_RATE = float(os.environ.get("LLM_PROVIDER_MAX_ERROR_RATE", "0.5"))
+HEALTH_COOLDOWN_SECONDS = float(os.environ.get("LLM_PROVIDER_COOLDOWN_SECONDS", "30"))
+
+
+class ProviderAdapter(ABC):
+    """Translates OpenAI-style messages to one provider's API and back"""
+
+    name = ""
+    api_key_env = ""
+    default_model = ""
+    model_prefixes: Tuple[str, ...] = ()
+
+    def api_key(self) -> Optional[str]:
+        return os.environ.get(self.api_key_env)
+
+    def require_api_key(self) -> str:
+        key = self.api_key()
+        if not key:
+            raise LLMError(status_code=500, detail=f"{self.api_key_env} not configured")
+        return key
+
+    def owns_model(self, model: str) -> bool:
+        return model.startswith(self.model_prefixes)
+
+    @abstractmethod
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        api_key: Optional[str],
+        purpose: str
+    ) -> Dict[str, Any]:
+        """Returns {"content", "usage"} with OpenAI-style usage keys"""
+
+
+class OpenAIAdapter(ProviderAdapter):
+    """Goes through the LLM gateway (shared client, concurrency limit, retries, cache)"""
+
+    name = "openai"
+    api_key_env = "OPENAI_API_KEY"
+    default_model = os.environ.get("LLM_FALLBACK_MODEL_OPENAI", "gpt-4o")
+    model_prefixes = ("gpt-", "o1", "o3", "o4", "chatgpt-")
+
+    async def complete(self, messages, model, temperature, max_tokens, api_key, purpose):
+        data = await chat_completion(
+            messages,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            api_key=api_key or get_openai_api_key(),
+            purpose=purpose
+        )
+        return {"content": data["choices"][0]["message"]["content"], "usage": data.get("usage")}
+
+
+class HTTPProviderAdapter(ProviderAdapter):
+    """Base for adapters with their own pooled client"""
+
+    base_url = ""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(float(os.environ.get("LLM_HTTP_TIMEOUT", "60")), connect=10.0),
+                limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=30.0),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def post(self, path: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            with track_outbound(self.name, "POST", path) as call:
+                response = await self.client().post(path, headers=headers, json=payload)
+                call["status"] = response.status_code
+        except httpx.TransportError as e:
+            raise LLMError(status_code=503, detail=f"Failed to connect to {self.name}: {str(e)}")
+        if response.status_code != 200:
+            try:
+                detail = response.json().get("error", {}).get("message", response.text)
+            except Exception:
+                detail = response.text
+            raise LLMError(status_code=response.status_code, detail=detail)
+        return response.json()
+
+
+def split_system(messages: List[Dict[str, str]]) -> Tuple[str, List[Dict[str, str]]]:
+    """Providers other than OpenAI take system instructions separately from the turns"""
+    system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+    turns = [m for m in messages if m["role"] in ("user", "assistant")]
+    return system, turns
+
+
+class AnthropicAdapter(HTTPProviderAdapter):
+    name = "anthropic"
+    base_url = ANTHROPIC_API_BASE
+    default_model = os.environ.get("LLM_FALLBACK_MODEL_ANTHROPIC", "claude-3-5-haiku-20241022")
+    api_key_env = "ANTHROPIC_API_KEY"
+    model_prefixes = ("claude",)
+
+    async def complete(self, messages, model, temperature, max_tokens, api_key, purpose):
+        system, turns = split_system(messages)
+        payload: Dict[str, Any] = {"model": model, "messages": turns, "max_tokens": max_tokens or 1024}
+        if system:
+            payload["system"] = system
+        if temperature is not None:
+            payload["temperature"] = min(temperature, 1.0)
+        data = await self.post(
+            "/v1/messages",
+            {"x-api-key": self.require_api_key(), "anthropic-version": ANTHROPIC_VERSION},
+            payload
+        )
+        usage = data.get("usage") or {}
+        return {
+            "content": "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text"),
+            "usage": {
+                "prompt_tokens": usage.get("input_tokens", 0),
+                "completion_tokens": usage.get("output_tokens", 0),
+            },
+        }
+
+
+class GeminiAdapter(HTTPProviderAdapter):
+    name = "gemini"
+    base_url = GEMINI_API_BASE
+    default_model = os.environ.get("LLM_FALLBACK_MODEL_GEMINI", "gemini-2.5-flash")
+    api_key_env = "GEMINI_API_KEY"
+    model_prefixes = ("gemini",)
+
+    async def complete(self, messages, model, temperature, max_tokens, api_key, purpose):
+        system, turns = split_system(messages)
+        payload: Dict[str, Any] = {
+            "contents": [
+                {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                for m in turns
+            ],
+            "generationConfig": {},
+        }
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+        if temperature is not None:
+            payload["generationConfig"]["temperature"] = temperature
+        if max_tokens is not None:
+            payload["generationConfig"]["maxOutputTokens"] = max_tokens
+        data = await self.post(
+            f"/v1beta/models/{model}:generateContent",
+            {"x-goog-api-key": self.require_api_key()},
+            payload
+        )
+        candidates = data.get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        usage = data.get("usageMetadata") or {}
+        return {
+            "content": "".join(part.get("text", "") for part in parts),
+            "usage": {
+                "prompt_tokens": usage.get("promptTokenCount", 0),
+                "completion_tokens": usage.get("candidatesTokenCount", 0),
+            },
+        }
+
+
+ADAPTERS: Dict[str, ProviderAdapter] = {
+    adapter.name: adapter for adapter in (OpenAIAdapter(), AnthropicAdapter(), GeminiAdapter())
+}
+
+
+def known_providers(names: List[str]) -> List[str]:
+    """Drop (and warn about) names without an adapter, e.g. a "claude" typo in LLM_FAILOVER_ORDER"""
+    unknown = [name for name in names if name not in ADAPTERS]
+    if unknown:
+        logger.warning(
+            f"Ignoring unknown providers in LLM_FAILOVER_ORDER: {', '.join(unknown)} "
+            f"(known: {', '.join(ADAPTERS)})"
+        )
+    return [name for name in names if name in ADAPTERS]
+
+
+FAILOVER_ORDER = known_providers(FAILOVER_ORDER)
+
+
+class ProviderHealth:
+    """Rolling latency/error window per provider with a simple circuit breaker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._open_until: Dict[str, float] = {}
+        self._totals: Dict[str, Dict[str, int]] = {}
+
+    def record(self, provider: str, latency_ms: float, error: bool):
+        with self._lock:
+            samples = self._samples.setdefault(provider, deque(maxlen=HEALTH_WINDOW))
+            samples.append((latency_ms, error))
+            totals = self._totals.setdefault(provider, {"calls": 0, "errors": 0, "hedged": 0, "failovers": 0})
+            totals["calls"] += 1
+            totals["errors"] += 1 if error else 0
+            if len(samples) >= HEALTH_MIN_SAMPLES and self._error_rate(samples) > HEALTH_MAX_ERROR_RATE:
+                if self._open_until.get(provider, 0) < time.monotonic():
+                    logger.warning(f"LLM provider {provider} degraded, skipping for {HEALTH_COOLDOWN_SECONDS}s")
+                self._open_until[provider] = time.monotonic() + HEALTH_COOLDOWN_SECONDS
+                samples.clear()
+
+    def count(self, provider: str, key: str):
+        with self._lock:
+            totals = self._totals.setdefault(provider, {"calls": 0, "errors": 0, "hedged": 0, "failovers": 0})
+            totals[key] += 1
+
+    @staticmethod
+    def _error_rate(samples) -> float:
+        return sum(1 for _, error in samples if error) / len(samples) if samples else 0.0
+
+    def available(self, provider: str) -> bool:
+        return self._open_until.get(provider, 0) <= time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for provider, totals in self._totals.items():
+                samples = self._samples.get(provider) or deque()
+                latencies = sorted(latency for latency, _ in samples)
+                result[provider] = {
+                    **totals,
+                    "available": self.available(provider),
+                    "window_error_rate": self._error_rate(samples),
+                    "window_p50_ms": latencies[len(latencies) // 2] if latencies else None,
+                    "window_p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None,
+                }
+            return result
+
+
+_health = ProviderHealth()
+
+
+def provider_for_model(model: str) -> Optional[str]:
+    for adapter in ADAPTERS.values():
+        if adapter.owns_model(model):
+            return adapter.name
+    return None
+
+
+def plan_route(provider: Optional[str], model: str) -> List[Tuple[ProviderAdapter, str]]:
+    """
+    Ordered (adapter, model) candidates: the requested provider/model first
+    (unless its circuit is open), then configured providers with their
+    fallback models
+    """
+    provider = provider or provider_for_model(model) or "openai"
+    primary = ADAPTERS.get(provider) or ADAPTERS["openai"]
+    if not primary.owns_model(model):
+        model = primary.default_model
+
+    candidates = [(primary, model)]
+    for name in FAILOVER_ORDER:
+        adapter = ADAPTERS.get(name)
+        if adapter and adapter is not primary and adapter.api_key():
+            candidates.append((adapter, adapter.default_model))
+
+    # Degraded providers go last rather than disappearing, so a full outage still gets tried
+    return sorted(candidates, key=lambda c: not _health.available(c[0].name))
+
+
+async def _attempt(
+    adapter: ProviderAdapter,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    api_key: Optional[str],
+    purpose: str
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    # The caller's key is OpenAI's; other providers use their own
+    key = api_key if adapter.name == "openai" else None
+    try:
+        result = await adapter.complete(messages, model, temperature, max_tokens, key, purpose)
+    except asyncio.CancelledError:
+        # A cancelled hedge says nothing about the provider's health
+        raise
+    except Exception:
+        _health.record(adapter.name, (time.perf_counter() - started) * 1000, True)
+        raise
+    _health.record(adapter.name, (time.perf_counter() - started) * 1000, False)
+    return {**result, "provider": adapter.name, "model": model}
+
+
+def _failover_worthy(e: LLMError) -> bool:
+    # A malformed request fails the same way everywhere; anything else may be provider-specific
+    return e.status_code not in (400, 422)
+
+
+async def route_completion(
+    messages: List[Dict[str, str]],
+    provider: Optional[str] = None,
+    model: str = "gpt-4o",
+    temperature: Optional[float] = 0.7,
+    max_tokens: Optional[int] = None,
+    api_key: Optional[str] = None,
+    purpose: str = "chat",
+    hedge_after_ms: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Complete with the requested provider, failing over to the next candidate
+    on provider errors. With hedging, the next candidate also starts if the
+    current one is slower than hedge_after_ms; the first success wins.
+    Returns {"content", "usage", "provider", "model"}.
+    """
+    candidates = plan_route(provider, model)
+    hedge_after = (hedge_after_ms if hedge_after_ms is not None else HEDGE_AFTER_MS) / 1000
+    pending: Dict[asyncio.Task, str] = {}
+    last_error: Optional[LLMError] = None
+    next_index = 0
+
+    def launch():
+        nonlocal next_index
+        adapter, candidate_model = candidates[next_index]
+        next_index += 1
+        task = asyncio.create_task(
+            _attempt(adapter, candidate_model, messages, temperature, max_tokens, api_key, purpose)
+        )
+        pending[task] = adapter.name
+        return adapter.name
+
+    launch()
+    try:
+        while pending:
+            can_hedge = hedge_after > 0 and next_index < len(candidates)
+            done, _ = await asyncio.wait(
+                pending, timeout=hedge_after if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                _health.count(launch(), "hedged")
+                continue
+
+            for task in done:
+                name = pending.pop(task)
+                try:
+                    return task.result()
+                except LLMError as e:
+                    last_error = e
+                    if not _failover_worthy(e):
+                        raise
+                    logger.warning(f"LLM provider {name} failed ({e.status_code}): {e.detail}")
+
+            if not pending and next_index < len(candidates):
+                _health.count(launch(), "failovers")
+    finally:
+        for task in pending:
+            task.cancel()
+
+    raise last_error or LLMError(status_code=503, detail="No LLM provider available")
+
+
+async def stream_route_completion(
+    messages: List[Dict[str, str]],
+    provider: Optional[str] = None,
+    model: str = "gpt-4o",
+    temperature: Optional[float] = 0.7,
+    max_tokens: Optional[int] = None,
+    api_key: Optional[str] = None,
+    purpose: str = "chat_stream"
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream like stream_chat_completion. OpenAI streams token deltas; other
+    providers (and failover after an OpenAI error before the first delta)
+    arrive as a single delta.
+    """
+    adapter, routed_model = plan_route(provider, model)[0]
+    if adapter.name == "openai":
+        streamed = False
+        started = time.perf_counter()
+        try:
+            async for chunk in stream_chat_completion(
+                messages, model=routed_model, temperature=temperature, max_tokens=max_tokens,
+                api_key=api_key, purpose=purpose
+            ):
+                streamed = streamed or chunk["type"] == "delta"
+                yield chunk
+            _health.record("openai", (time.perf_counter() - started) * 1000, False)
+            return
+        except LLMError as e:
+            _health.record("openai", (time.perf_counter() - started) * 1000, True)
+            if streamed or not _failover_worthy(e):
+                raise
+            logger.warning(f"LLM stream via openai failed ({e.status_code}), failing over")
+            _health.count("openai", "failovers")
+        # Only reached after a failed stream: continue with the next provider
+        fallback = next(
+            (name for name in FAILOVER_ORDER if name != "openai" and name in ADAPTERS and ADAPTERS[name].api_key()),
+            None
+        )
+        if fallback is None:
+            raise LLMError(status_code=503, detail="No fallback LLM provider configured")
+        adapter = ADAPTERS[fallback]
+        routed_model = adapter.default_model
+
+    result = await route_completion(
+        messages, adapter.name, routed_model, temperature, max_tokens, api_key, purpose
+    )
+    yield {"type": "delta", "content": result["content"]}
+    if result.get("usage"):
+        yield {"type": "usage", "usage": result["usage"]}
+
+
+async def close_provider_clients():
+    """Close adapter clients (called from lifespan shutdown)"""
+    for adapter in ADAPTERS.values():
+        if isinstance(adapter, HTTPProviderAdapter):
+            await adapter.close()
+
+
+def get_router_stats() -> Dict[str, Any]:
+    return {
+        "failover_order": FAILOVER_ORDER,
+        "hedge_after_ms": HEDGE_AFTER_MS,
+        "configured": [name for name, adapter in ADAPTERS.items() if adapter.api_key()],
+        "providers": _health.snapshot(),
+    }
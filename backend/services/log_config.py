@@ -0,0 +1,147 @@
+"""
+Logging Setup
+Queue-based, non-blocking logging: records are handed to a background thread
+that formats (JSON by default) and writes them. Request/response payloads go
+through log_payload, which is DEBUG-gated or sampled, redacted and size-capped.
+"""
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()  # json | text
+# Fraction of payloads logged at INFO when DEBUG is off (0 = only under DEBUG)
+PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+SENSITIVE_KEYS = {
+    "authorization", "api_key", "apikey", "x_api_key", "token", "access_token",
+    "refresh_token", "secret", "client_secret", "password",
+}
+SENSITIVE_SUFFIXES = ("_api_key", "_secret", "_password", "_token")
+# Credential-looking strings: keep a short prefix so keys can still be told apart
+SECRET_PREFIXES = ("Bearer ", "sk-", "key_", "sk_", "pk_", "whsec_")
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including fields passed via `extra`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue the record as-is; the stock QueueHandler formats the message in
+    the calling thread, which is exactly the work we want off the request path.
+    Record args are read later on the logging thread, so mutable ones must be
+    snapshotted by the caller (log_payload does this for payloads).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging():
+    """Route all logging through a queue drained by a background thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the background thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _is_sensitive(key: Any) -> bool:
+    name = str(key).lower().replace("-", "_")
+    return name in SENSITIVE_KEYS or name.endswith(SENSITIVE_SUFFIXES)
+
+
+def _mask(value: str) -> str:
+    for prefix in SECRET_PREFIXES:
+        if value.startswith(prefix):
+            return value[:len(prefix) + 4] + "...[REDACTED]"
+    return value
+
+
+def redact(value: Any) -> Any:
+    """Copy of a payload with credentials masked"""
+    if isinstance(value, dict):
+        return {
+            k: "[REDACTED]" if _is_sensitive(k) else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return _mask(value)
+    return value
+
+
+def format_payload(payload: Any) -> str:
+    """Redacted, size-capped text of a payload"""
+    if isinstance(payload, (str, bytes)):
+        text = _mask(payload.decode("utf-8", "replace") if isinstance(payload, bytes) else payload)
+    else:
+        text = json.dumps(redact(payload), default=str, ensure_ascii=False)
+    if len(text) > PAYLOAD_MAX_CHARS:
+        return f"{text[:PAYLOAD_MAX_CHARS]}... [{len(text) - PAYLOAD_MAX_CHARS} more chars]"
+    return text
+
+
+def log_payload(logger: logging.Logger, label: str, payload: Any, **fields):
+    """
+    Log a request/response payload: always under DEBUG, otherwise for a
+    LOG_PAYLOAD_SAMPLE_RATE fraction of calls. Costs nothing when skipped;
+    when logged, the payload is serialized here, before the caller can
+    mutate it while the record waits in the queue.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        level = logging.DEBUG
+    elif PAYLOAD_SAMPLE_RATE > 0 and random.random() < PAYLOAD_SAMPLE_RATE:
+        level = logging.INFO
+    else:
+        return
+    logger.log(level, "%s: %s", label, format_payload(payload), extra=redact(fields))
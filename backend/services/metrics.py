@@ -0,0 +1,185 @@
+"""
+Metrics
+In-process counters, gauges and histograms rendered in Prometheus text
+format, plus ASGI middleware timing every API request
+"""
+import re
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., sum, count]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for i, bound in enumerate(self.buckets):
+                    cumulative += state[i]
+                    le = _labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {state[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+_registry: List[Metric] = []
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "API request latency by route template",
+    ("method", "route", "status")
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "API requests currently being handled")
+outbound_request_duration = Histogram(
+    "outbound_request_duration_seconds", "Latency of calls to external services by endpoint",
+    ("service", "method", "endpoint", "status")
+)
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Path segments that are identifiers rather than part of the endpoint
+_ID_SEGMENT = re.compile(
+    r"^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"  # uuid
+    r"|[a-z]+_[A-Za-z0-9]{6,}"  # prefixed ids: agent_..., call_..., llm_...
+    r"|(?=[^/]*\d)[A-Za-z0-9_-]{16,}"  # long opaque tokens
+    r"|\d+)$"
+)
+
+
+def normalize_endpoint(path: str) -> str:
+    """Replace ID segments so labels stay low-cardinality: /get-agent/agent_x1 -> /get-agent/{id}"""
+    path = path.split("?", 1)[0]
+    return "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/"))
+
+
+def record_outbound(service: str, method: str, endpoint: str, status, seconds: float):
+    outbound_request_duration.observe(
+        seconds, service=service, method=method, endpoint=normalize_endpoint(endpoint), status=status
+    )
+
+
+@contextmanager
+def track_outbound(service: str, method: str, endpoint: str) -> Iterator[Dict[str, object]]:
+    """
+    Time an outbound call. Set call["status"] inside the block; anything that
+    raises before then is recorded as status="error".
+    """
+    call: Dict[str, object] = {"status": "error"}
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        record_outbound(service, method, endpoint, call["status"], time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Records latency and status per route template (ASGI, so streaming responses are timed to the end)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: Optional[int] = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # Routing stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status or 500
+            )
@@ -0,0 +1,73 @@
+"""
+Retell Agent ID Cache
+Stale-while-revalidate set of agent IDs that still exist in Retell, used to
+hide locally stored agents that were deleted upstream
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+from services.retell_client import get_retell_api_key, make_retell_request
+from services.background import spawn
+
+logger = logging.getLogger(__name__)
+
+# Served as-is while younger than the TTL; older values are still served
+# while a single background refresh runs
+AGENT_IDS_TTL_SECONDS = float(os.environ.get("RETELL_AGENT_IDS_TTL_SECONDS", "60"))
+
+_valid_ids: Optional[Set[str]] = None
+_fetched_at: float = 0.0
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def set_agents(agents: List[Dict[str, Any]]):
+    """Replace the cached IDs from a full /list-agents response"""
+    global _valid_ids, _fetched_at
+    _valid_ids = {a.get("agent_id") for a in agents if a.get("agent_id")}
+    _fetched_at = time.monotonic()
+
+
+async def refresh_agent_ids() -> Set[str]:
+    """Fetch the current agent list from Retell and update the cache"""
+    agents = await make_retell_request("GET", "/list-agents", timeout=10.0)
+    set_agents(agents if isinstance(agents, list) else [])
+    return set(_valid_ids)
+
+
+async def _refresh_quietly():
+    try:
+        await refresh_agent_ids()
+    except Exception as e:
+        logger.warning(f"Could not refresh Retell agent IDs: {e}")
+
+
+def _schedule_refresh():
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = spawn(_refresh_quietly(), "retell-agent-ids")
+
+
+def get_valid_agent_ids() -> Optional[Set[str]]:
+    """
+    Cached set of valid Retell agent IDs, or None if not known yet.
+    Never blocks on Retell: a stale or missing value schedules a background refresh.
+    """
+    if not get_retell_api_key():
+        return None
+    if _valid_ids is None or time.monotonic() - _fetched_at > AGENT_IDS_TTL_SECONDS:
+        _schedule_refresh()
+    return _valid_ids
+
+
+def add_agent_id(agent_id: str):
+    """Record an agent created through this API"""
+    if _valid_ids is not None and agent_id:
+        _valid_ids.add(agent_id)
+
+
+def discard_agent_id(agent_id: str):
+    """Forget an agent deleted through this API"""
+    if _valid_ids is not None:
+        _valid_ids.discard(agent_id)
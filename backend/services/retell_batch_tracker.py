@@ -0,0 +1,125 @@
+"""
+Retell Batch Test Tracker
+One background poller per Retell-run batch test: polls get-batch-test with
+adaptive backoff, persists progress into batch_tests and publishes changes
+to the job's event topic
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.background import spawn
+from services.batch_tests import batch_topic
+from services.events import publish
+from services.retell_client import make_retell_request
+
+logger = logging.getLogger(__name__)
+
+POLL_INITIAL_SECONDS = float(os.environ.get("RETELL_BATCH_POLL_INITIAL_SECONDS", "2"))
+POLL_MAX_SECONDS = float(os.environ.get("RETELL_BATCH_POLL_MAX_SECONDS", "60"))
+POLL_BACKOFF = float(os.environ.get("RETELL_BATCH_POLL_BACKOFF", "1.5"))
+# Give up on jobs Retell never finishes
+POLL_TIMEOUT_SECONDS = float(os.environ.get("RETELL_BATCH_POLL_TIMEOUT_SECONDS", str(6 * 60 * 60)))
+
+COMPLETE_STATUSES = {"complete", "completed", "done", "finished"}
+FAILED_STATUSES = {"failed", "error", "cancelled", "canceled"}
+COUNT_FIELDS = ("pass_count", "fail_count", "error_count", "total_count")
+
+# Local batch job IDs with a poller running in this process
+_tracking: Set[str] = set()
+
+
+def summarize_retell_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Status and counters from a get-batch-test response, in batch_tests terms"""
+    retell_status = str(job.get("status", "in_progress")).lower()
+    if retell_status in COMPLETE_STATUSES:
+        status = "complete"
+    elif retell_status in FAILED_STATUSES:
+        status = "failed"
+    else:
+        status = "in_progress"
+
+    summary: Dict[str, Any] = {"status": status, "retell_status": retell_status}
+    for field in COUNT_FIELDS:
+        if job.get(field) is not None:
+            summary[field] = job[field]
+    finished = sum(summary.get(f, 0) or 0 for f in ("pass_count", "fail_count", "error_count"))
+    if status != "in_progress" and finished:
+        summary["pass_rate"] = (summary.get("pass_count", 0) or 0) / finished * 100
+    return summary
+
+
+async def poll_retell_batch(db: AsyncIOMotorDatabase, batch_job_id: str, retell_batch_id: str):
+    """Poll until the job reaches a final state, persisting and publishing each change"""
+    topic = batch_topic(batch_job_id)
+    delay = POLL_INITIAL_SECONDS
+    deadline = time.monotonic() + POLL_TIMEOUT_SECONDS
+    last: Optional[Dict[str, Any]] = None
+
+    try:
+        while True:
+            try:
+                job = await make_retell_request("GET", f"/get-batch-test/{retell_batch_id}")
+            except HTTPException as e:
+                # Transient upstream errors just slow the next poll; a vanished job is final
+                if e.status_code == 404:
+                    job = {"status": "failed", "error": "Batch test not found in Retell"}
+                else:
+                    logger.warning(f"Polling Retell batch {retell_batch_id} failed: {e.detail}")
+                    job = None
+
+            if job is not None:
+                summary = summarize_retell_job(job)
+                if summary != last:
+                    last = summary
+                    update = {**summary, "updated_at": datetime.now(timezone.utc)}
+                    if summary["status"] != "in_progress":
+                        update["retell_result"] = job
+                    await db.batch_tests.update_one({"id": batch_job_id}, {"$set": update})
+
+                    if summary["status"] == "in_progress":
+                        publish(topic, {"type": "progress", "batch_job_id": batch_job_id, **summary})
+                        # Progress tends to come in runs, so look again soon
+                        delay = POLL_INITIAL_SECONDS
+                    else:
+                        event_type = "complete" if summary["status"] == "complete" else "failed"
+                        publish(topic, {"type": event_type, "batch_job_id": batch_job_id, "job": summary})
+                        logger.info(f"Retell batch {retell_batch_id} finished: {summary['retell_status']}")
+                        return
+
+            if time.monotonic() >= deadline:
+                error = f"No final status from Retell after {POLL_TIMEOUT_SECONDS:.0f}s"
+                await db.batch_tests.update_one(
+                    {"id": batch_job_id},
+                    {"$set": {"status": "failed", "error": error, "updated_at": datetime.now(timezone.utc)}}
+                )
+                publish(topic, {"type": "failed", "batch_job_id": batch_job_id, "error": error})
+                return
+
+            await asyncio.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_SECONDS)
+    finally:
+        _tracking.discard(batch_job_id)
+
+
+def track_retell_batch(db: AsyncIOMotorDatabase, batch_job_id: str, retell_batch_id: Optional[str] = None):
+    """Start polling a Retell-run job unless this process already is"""
+    if batch_job_id in _tracking:
+        return
+    _tracking.add(batch_job_id)
+    spawn(poll_retell_batch(db, batch_job_id, retell_batch_id or batch_job_id), f"retell-batch:{batch_job_id}")
+
+
+async def resume_retell_batch_trackers(db: AsyncIOMotorDatabase) -> int:
+    """Restart pollers for Retell-run jobs still in progress (e.g. after a restart)"""
+    jobs = await db.batch_tests.find(
+        {"status": "in_progress", "test_type": {"$in": ["voice_call", "simulation"]}},
+        {"_id": 0, "id": 1, "retell_batch_id": 1}
+    ).to_list(None)
+    for job in jobs:
+        track_retell_batch(db, job["id"], job.get("retell_batch_id"))
+    return len(jobs)
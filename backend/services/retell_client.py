@@ -0,0 +1,306 @@
+"""
+Retell API Client
+Shared, pooled HTTP client for all Retell traffic (owned by the FastAPI lifespan)
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, AsyncIterator
+import httpx
+from fastapi import HTTPException
+from services.metrics import track_outbound
+from services.log_config import log_payload
+from services.dispatch import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Retell API Configuration
+RETELL_API_BASE = os.environ.get("RETELL_API_BASE", "https://api.retellai.com")
+
+# Fan-out of create-* calls (test cases, web calls) stays under Retell's rate limit
+RETELL_DISPATCH_CONCURRENCY = int(os.environ.get("RETELL_DISPATCH_CONCURRENCY", "8"))
+retell_rate_limiter = TokenBucket(
+    float(os.environ.get("RETELL_RATE_LIMIT_PER_SECOND", "10")),
+    float(os.environ.get("RETELL_RATE_LIMIT_BURST", "10"))
+)
+
+# Shared client - created in lifespan startup, closed on shutdown
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_retell_api_key():
+    """Get Retell API key from environment (dynamic lookup)"""
+    return os.environ.get("RETELL_API_KEY")
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Build the pooled keep-alive client from environment settings"""
+    limits = httpx.Limits(
+        max_connections=int(os.environ.get("RETELL_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.environ.get("RETELL_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.environ.get("RETELL_HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+    timeout = httpx.Timeout(
+        float(os.environ.get("RETELL_HTTP_TIMEOUT", "30")),
+        connect=float(os.environ.get("RETELL_HTTP_CONNECT_TIMEOUT", "10")),
+    )
+
+    # HTTP/2 needs the optional 'h2' package
+    http2 = os.environ.get("RETELL_HTTP2", "false").lower() in ("1", "true", "yes")
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("RETELL_HTTP2 enabled but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        base_url=RETELL_API_BASE,
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+    )
+
+
+async def start_retell_client():
+    """Create the shared Retell client (called from lifespan startup)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logger.info(f"Retell HTTP client started (base: {RETELL_API_BASE})")
+
+
+async def close_retell_client():
+    """Close the shared Retell client (called from lifespan shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Retell HTTP client closed")
+
+
+def get_retell_client() -> httpx.AsyncClient:
+    """Get the shared Retell client, creating it lazily outside the lifespan"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+# ========== REQUEST HELPERS ==========
+
+async def make_retell_request(
+    method: str,
+    endpoint: str,
+    data: dict = None,
+    timeout: float = 30.0
+) -> dict:
+    """Make authenticated request to Retell API"""
+    api_key = get_retell_api_key()
+    if not api_key:
+        raise HTTPException(
+            status_code=500,
+            detail="RETELL_API_KEY not configured. Add it to your .env file."
+        )
+
+    method = method.upper()
+    if method not in ("GET", "POST", "PATCH", "PUT", "DELETE"):
+        raise HTTPException(status_code=400, detail=f"Unsupported method: {method}")
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    logger.info(f"Retell API: {method} {endpoint}")
+    if data:
+        log_payload(logger, "Retell API request data", data, endpoint=endpoint)
+
+    client = get_retell_client()
+    try:
+        with track_outbound("retell", method, endpoint) as call:
+            response = await client.request(
+                method,
+                endpoint,
+                headers=headers,
+                json=data if method in ("POST", "PATCH", "PUT") else None,
+                timeout=timeout
+            )
+            call["status"] = response.status_code
+
+        logger.info(f"Retell API response: {response.status_code}")
+
+        if response.status_code >= 400:
+            error_detail = response.text
+            log_payload(logger, "Retell API error response", error_detail, endpoint=endpoint)
+            try:
+                error_json = response.json()
+                error_detail = error_json.get("error", error_json.get("detail", error_json.get("message", error_detail)))
+            except:
+                pass
+
+            logger.error(f"Retell API error: {response.status_code} - {error_detail}")
+
+            if response.status_code == 401:
+                raise HTTPException(status_code=401, detail="Invalid Voice Platform API key")
+            elif response.status_code == 404:
+                raise HTTPException(status_code=404, detail=f"Resource not found: {endpoint}")
+            else:
+                raise HTTPException(status_code=response.status_code, detail=error_detail)
+
+        # Handle DELETE with no content
+        if method == "DELETE" and response.status_code == 204:
+            return {"success": True}
+
+        return response.json() if response.text else {"success": True}
+
+    except httpx.RequestError as e:
+        logger.error(f"Retell API connection error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to connect to Voice Platform API: {str(e)}")
+
+
+async def make_retell_multipart_request(
+    endpoint: str,
+    form_data: dict,
+    timeout: float = 60.0
+) -> dict:
+    """Make multipart/form-data request to Retell API (for knowledge base creation)"""
+    api_key = get_retell_api_key()
+    if not api_key:
+        raise HTTPException(
+            status_code=500,
+            detail="RETELL_API_KEY not configured. Add it to your .env file."
+        )
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    logger.info(f"Retell API (multipart): POST {endpoint}")
+    logger.info(f"Form data keys: {list(form_data.keys())}")
+
+    # Build the multipart files dict - httpx needs this format for multipart
+    files = {}
+
+    # knowledge_base_name is a simple form field
+    if "knowledge_base_name" in form_data:
+        files["knowledge_base_name"] = (None, form_data["knowledge_base_name"])
+
+    # knowledge_base_texts needs to be sent as individual items or JSON
+    if "knowledge_base_texts" in form_data and form_data["knowledge_base_texts"]:
+        texts = form_data["knowledge_base_texts"]
+        files["knowledge_base_texts"] = (None, json.dumps(texts), "application/json")
+
+    # knowledge_base_urls needs to be sent as JSON array
+    if "knowledge_base_urls" in form_data and form_data["knowledge_base_urls"]:
+        urls = form_data["knowledge_base_urls"]
+        files["knowledge_base_urls"] = (None, json.dumps(urls), "application/json")
+
+    # enable_auto_refresh
+    if "enable_auto_refresh" in form_data:
+        files["enable_auto_refresh"] = (None, str(form_data["enable_auto_refresh"]).lower())
+
+    logger.info(f"Sending multipart files: {list(files.keys())}")
+
+    client = get_retell_client()
+    try:
+        with track_outbound("retell", "POST", endpoint) as call:
+            response = await client.post(endpoint, headers=headers, files=files, timeout=timeout)
+            call["status"] = response.status_code
+
+        logger.info(f"Retell API response: {response.status_code}")
+        log_payload(logger, "Retell API response body", response.text or "empty", endpoint=endpoint)
+
+        if response.status_code >= 400:
+            error_detail = response.text
+            log_payload(logger, "Retell API error response", error_detail, endpoint=endpoint)
+            try:
+                error_json = response.json()
+                error_detail = error_json.get("message", error_detail)
+            except:
+                pass
+            raise HTTPException(status_code=response.status_code, detail=error_detail)
+
+        return response.json() if response.text else {"success": True}
+
+    except httpx.RequestError as e:
+        logger.error(f"Retell API connection error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to connect to Voice Platform API: {str(e)}")
+
+
+# ========== PAGINATION ==========
+
+LIST_CALLS_PAGE_SIZE = 1000
+
+
+async def iter_retell_call_pages(
+    filter_criteria: Optional[Dict[str, Any]] = None,
+    sort_order: str = "descending",
+    page_size: int = LIST_CALLS_PAGE_SIZE,
+    prefetch: bool = False
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Page through /v2/list-calls following the pagination key.
+    Only one page (two with prefetch) is held in memory at a time; with
+    prefetch the next page is requested while the caller processes the current one.
+    Stop iterating early to stop fetching.
+    """
+    page_size = max(1, min(page_size, LIST_CALLS_PAGE_SIZE))
+
+    async def fetch(pagination_key: Optional[str]) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"limit": page_size, "sort_order": sort_order}
+        if filter_criteria:
+            params["filter_criteria"] = filter_criteria
+        if pagination_key:
+            params["pagination_key"] = pagination_key
+        response = await make_retell_request("POST", "/v2/list-calls", params)
+        return response if isinstance(response, list) else response.get("calls", [])
+
+    next_page: Optional[asyncio.Task] = None
+    try:
+        page = await fetch(None)
+        while page:
+            last_id = page[-1].get("call_id")
+            has_more = len(page) >= page_size and bool(last_id)
+            if has_more and prefetch:
+                next_page = asyncio.create_task(fetch(last_id))
+
+            yield page
+
+            if not has_more:
+                break
+            if next_page is not None:
+                page, next_page = await next_page, None
+            else:
+                page = await fetch(last_id)
+    finally:
+        # Early termination: don't leave a prefetch running
+        if next_page is not None:
+            next_page.cancel()
+
+
+async def iter_retell_calls(
+    filter_criteria: Optional[Dict[str, Any]] = None,
+    sort_order: str = "descending",
+    max_calls: Optional[int] = None,
+    page_size: int = LIST_CALLS_PAGE_SIZE,
+    prefetch: bool = False
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream individual calls from /v2/list-calls, stopping after max_calls"""
+    if max_calls is not None:
+        page_size = min(page_size, max_calls)
+        if max_calls <= 0:
+            return
+
+    seen = 0
+    pages = iter_retell_call_pages(filter_criteria, sort_order, page_size, prefetch)
+    try:
+        async for page in pages:
+            for call in page:
+                yield call
+                seen += 1
+                if max_calls is not None and seen >= max_calls:
+                    return
+    finally:
+        await pages.aclose()
@@ -0,0 +1,170 @@
+"""
+Topic Matcher
+Matches a set of expected topics (plus optional synonyms) against a response
+in one pass, tolerant of case, accents, punctuation and simple inflections
+("price" matches "Pricing", "refund policies" matches "refund policy")
+"""
+import re
+import json
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+WORD_RE = re.compile(r"\w+(?:['\u2019]\w+)*")
+
+# Suffixes whose removal would break the word ("status", "analysis", "glass")
+_KEEP_S_AFTER = ("ss", "us", "is")
+_NO_UNDOUBLE = set("lsz")
+_VOWELS = set("aeiouy")
+
+
+def normalize(word: str) -> str:
+    """Casefold and strip accents"""
+    decomposed = unicodedata.normalize("NFKD", word)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _measure(word: str) -> int:
+    """Number of vowel-consonant sequences (Porter's m): "use" 1, "cancel" 2"""
+    m = 0
+    previous_vowel = False
+    for c in word:
+        vowel = c in _VOWELS
+        if previous_vowel and not vowel:
+            m += 1
+        previous_vowel = vowel
+    return m
+
+
+def _needs_e(stem: str) -> bool:
+    """
+    Whether a stem lost a silent "e" ("mak" from "making", "us" from "using"):
+    one syllable ending consonant-vowel-consonant, the word start counting as
+    a consonant. The same test decides whether a final "e" is kept, so both
+    forms of a word end up with the same key.
+    """
+    if _measure(stem) != 1 or len(stem) < 2 or stem[-1] in _VOWELS or stem[-1] in "wx":
+        return False
+    return stem[-2] in _VOWELS and (len(stem) == 2 or stem[-3] not in _VOWELS)
+
+
+def _restore(stem: str) -> str:
+    """Undo spelling changes made when -ing/-ed was added"""
+    if len(stem) > 3 and stem[-1] == stem[-2] and stem[-1] not in _NO_UNDOUBLE | _VOWELS:
+        return stem[:-1]
+    if _needs_e(stem):
+        return stem + "e"
+    return stem
+
+
+def stem(word: str) -> str:
+    """
+    Light inflectional stemmer: strips one plural/-ed/-ing suffix, then
+    settles a final "e" and "ll". Only needs to map a topic and its variants
+    to the same key ("cancel"/"cancelled", "use"/"using", "analysis"/"analyses"),
+    not to produce real roots.
+    """
+    if len(word) <= 2 or not word.isalpha():
+        return word
+
+    if word.endswith("sis") and len(word) >= 7:
+        # analysis/analyses -> analys (short ones like "thesis" would hit "these")
+        word = word[:-2]
+    elif word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith(("xes", "ches", "shes", "zes")):
+        word = word[:-2]
+    elif word.endswith("s") and len(word) > 3 and not word.endswith(_KEEP_S_AFTER):
+        word = word[:-1]
+    elif word.endswith("eed"):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    elif word.endswith("ing") and len(word) > 4 and _VOWELS & set(word[:-3]):
+        word = _restore(word[:-3])
+    elif word.endswith("ed") and _VOWELS & set(word[:-2]):
+        word = _restore(word[:-2])
+
+    if word.endswith("e") and not word.endswith("ee") and not _needs_e(word[:-1]):
+        word = word[:-1]
+    if word.endswith("ll") and _measure(word) > 1:
+        word = word[:-1]
+    return word
+
+
+def _key(word: str) -> str:
+    word = normalize(word).replace("\u2019", "'")
+    if word.endswith("'s"):
+        word = word[:-2]
+    return stem(word.replace("'", ""))
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """(stem, start, end) for every word, with offsets into the original text"""
+    return [(_key(m.group()), m.start(), m.end()) for m in WORD_RE.finditer(text)]
+
+
+class TopicMatcher:
+    """
+    Compiled once per scenario: every topic and synonym becomes a path in a
+    trie keyed by word stems, so scanning a response costs one walk per word,
+    bounded by the longest phrase, no matter how many topics there are.
+    """
+
+    def __init__(self, topics: Sequence[str], synonyms: Optional[Dict[str, Sequence[str]]] = None):
+        self.topics: List[str] = list(dict.fromkeys(t for t in topics if t and t.strip()))
+        self._trie: Dict = {}
+        self._max_len = 0
+        synonyms = synonyms or {}
+        for topic in self.topics:
+            for phrase in [topic, *(synonyms.get(topic) or [])]:
+                self._add(phrase, topic)
+
+    def _add(self, phrase: str, topic: str):
+        stems = [s for s, _, _ in tokenize(phrase)]
+        if not stems:
+            return
+        node = self._trie
+        for s in stems:
+            node = node.setdefault(s, {})
+        node.setdefault(None, set()).add(topic)
+        self._max_len = max(self._max_len, len(stems))
+
+    def scan(self, text: str) -> Dict[str, List[Tuple[int, int]]]:
+        """(start, end) character spans of every topic occurrence, per matched topic"""
+        hits: Dict[str, List[Tuple[int, int]]] = {}
+        if not self._trie or not text:
+            return hits
+        tokens = tokenize(text)
+        for i, (_, start, _) in enumerate(tokens):
+            node = self._trie
+            for word, _, end in tokens[i:i + self._max_len]:
+                node = node.get(word)
+                if node is None:
+                    break
+                for topic in node.get(None, ()):
+                    hits.setdefault(topic, []).append((start, end))
+        return hits
+
+    def match(self, text: str, topics: Optional[Sequence[str]] = None) -> Dict[str, List[Tuple[int, int]]]:
+        """scan(), limited to `topics` (default: all), with an empty list for each miss"""
+        hits = self.scan(text)
+        return {topic: hits.get(topic, []) for topic in (self.topics if topics is None else topics)}
+
+
+def compile_test_case(test_case: Dict) -> List[TopicMatcher]:
+    """
+    One matcher per scenario, in scenario order. Synonyms only apply to the
+    scenario that declares them; scenarios with the same topics and synonyms
+    share a matcher.
+    """
+    compiled: Dict[str, TopicMatcher] = {}
+    matchers: List[TopicMatcher] = []
+    for scenario in test_case.get("scenarios", []):
+        topics = scenario.get("expected_topics") or []
+        synonyms = scenario.get("topic_synonyms") or {}
+        key = json.dumps([topics, synonyms], sort_keys=True)
+        if key not in compiled:
+            compiled[key] = TopicMatcher(topics, synonyms)
+        matchers.append(compiled[key])
+    return matchers
@@ -11,6 +11,7 @@ import { Textarea } from "../components/ui/textarea";
 import { Card, CardContent, CardHeader, CardTitle } from "../components/ui/card";
 import { Badge } from "../components/ui/badge";
 import { Label } from "../components/ui/label";
+import { Switch } from "../components/ui/switch";
 import {
   Select,
   SelectContent,
@@ -62,6 +63,8 @@ export default function AgentEval() {
   const [loading, setLoading] = useState(false);
   const [showCreateModal, setShowCreateModal] = useState(false);
   const [showRunModal, setShowRunModal] = useState(false);
+  const [multiTurn, setMultiTurn] = useState(false);
+  const [reuseCached, setReuseCached] = useState(true);
   const [showResultsModal, setShowResultsModal] = useState(false);
   const [selectedBatchTest, setSelectedBatchTest] = useState(null);
   const [generatingScenarios, setGeneratingScenarios] = useState(false);
@@ -164,25 +167,8 @@ export default function AgentEval() {
       if (response.data.batch_job_id) {
         toast.success(`Started simulation test! AI caller will test ${response.data.test_case_count} scenarios.`);
         
-        // Poll for results
-        const pollResults = async (jobId, attempts = 0) => {
-          if (attempts > 30) return; // Max 5 minutes polling
-          
-          try {
-            const resultResponse = await axios.get(`${API}/retell/simulation-test/${jobId}`);
-            if (resultResponse.data.status === "complete") {
-              toast.success(`Simulation complete! ✓ ${resultResponse.data.pass_count} passed, ✗ ${resultResponse.data.fail_count} failed`);
-              fetchBatchTests();
-              return;
-            }
-          } catch (e) {
-            console.log("Polling...");
-          }
-          
-          setTimeout(() => pollResults(jobId, attempts + 1), 10000);
-        };
-        
-        pollResults(response.data.batch_job_id);
+        // Live progress from the server-side Retell poller
+        pollBatchTestResults(response.data.batch_job_id);
       } else {
         toast.success(`Started ${scenarios.length} automated voice tests!`);
       }
@@ -391,7 +377,10 @@ export default function AgentEval() {
       const response = await axios.post(`${API}/retell/batch-tests`, {
         test_case_definition_ids: selectedTestCases,
         agent_id: selectedAgent,
-        concurrency: 1
+        concurrency: 1,
+        multi_turn: multiTurn,
+        // Unchanged scenarios reuse cached agent replies unless turned off
+        use_cache: reuseCached ? null : false
       });
       
       toast.success(`Batch test started with ${response.data.total_count} scenarios!`);
@@ -408,6 +397,55 @@ export default function AgentEval() {
   };
 
   const pollBatchTestResults = async (batchJobId) => {
+    // Live progress over SSE; fall back to polling if the stream can't be opened
+    if (typeof EventSource !== "undefined") {
+      const source = new EventSource(`${API}/retell/batch-tests/${batchJobId}/events`);
+      let opened = false;
+      source.addEventListener("snapshot", (e) => {
+        opened = true;
+        const { job } = JSON.parse(e.data);
+        if (job.status !== "in_progress") {
+          source.close();
+          fetchBatchTests();
+        }
+      });
+      // Refresh the list at most every 2s while results stream in
+      let refreshPending = false;
+      const scheduleRefresh = () => {
+        if (refreshPending) return;
+        refreshPending = true;
+        setTimeout(() => {
+          refreshPending = false;
+          fetchBatchTests();
+        }, 2000);
+      };
+      source.addEventListener("result", scheduleRefresh);
+      source.addEventListener("progress", scheduleRefresh);
+      source.addEventListener("complete", (e) => {
+        source.close();
+        const { job } = JSON.parse(e.data);
+        if (job && job.pass_count !== undefined) {
+          toast.success(`Batch test completed! ✓ ${job.pass_count} passed, ✗ ${job.fail_count || 0} failed`);
+        } else {
+          toast.success("Batch test completed!");
+        }
+        fetchBatchTests();
+      });
+      source.addEventListener("failed", () => {
+        source.close();
+        toast.error("Batch test failed");
+        fetchBatchTests();
+      });
+      source.onerror = () => {
+        source.close();
+        if (!opened) pollBatchTestResultsLegacy(batchJobId);
+      };
+      return;
+    }
+    pollBatchTestResultsLegacy(batchJobId);
+  };
+
+  const pollBatchTestResultsLegacy = async (batchJobId) => {
     const maxAttempts = 30;
     let attempts = 0;
     
@@ -1155,6 +1193,22 @@ export default function AgentEval() {
             <p className="text-sm text-gray-500">
               {selectedTestCases.length} test case(s) selected
             </p>
+
+            <div className="flex items-center justify-between p-3 rounded-lg bg-gray-50 border border-gray-100">
+              <div>
+                <p className="font-medium text-gray-900">Multi-turn conversations</p>
+                <p className="text-sm text-gray-500">Simulate a caller for up to each scenario's max turns (runs locally, no voice minutes)</p>
+              </div>
+              <Switch checked={multiTurn} onCheckedChange={setMultiTurn} />
+            </div>
+
+            <div className="flex items-center justify-between p-3 rounded-lg bg-gray-50 border border-gray-100">
+              <div>
+                <p className="font-medium text-gray-900">Reuse cached replies</p>
+                <p className="text-sm text-gray-500">Scenarios unchanged since the last run return instantly; turn off to ask the agent again</p>
+              </div>
+              <Switch checked={reuseCached} onCheckedChange={setReuseCached} />
+            </div>
           </div>
 
           <DialogFooter>
@@ -1274,7 +1328,25 @@ export default function AgentEval() {
                             </p>
                           </div>
                           
-                          {result.agent_response && (
+                          {result.transcript?.length > 0 && (
+                            <div>
+                              <p className="text-xs font-medium text-gray-500 mb-1">
+                                CONVERSATION ({result.turns} turns)
+                              </p>
+                              <div className="space-y-1 bg-gray-50 p-2 rounded max-h-64 overflow-y-auto">
+                                {result.transcript.map((turn, i) => (
+                                  <p key={i} className="text-sm text-gray-700">
+                                    <span className="font-medium">{turn.role === "agent" ? "Agent" : "Caller"}:</span> {turn.content}
+                                  </p>
+                                ))}
+                              </div>
+                              {result.judge_reason && (
+                                <p className="text-xs text-gray-500 mt-1">{result.judge_reason}</p>
+                              )}
+                            </div>
+                          )}
+
+                          {!result.transcript && result.agent_response && (
                             <div>
                               <p className="text-xs font-medium text-gray-500 mb-1">AGENT RESPONSE</p>
                               <p className="text-sm text-gray-700 bg-gray-50 p-2 rounded">
@@ -1288,7 +1360,11 @@ export default function AgentEval() {
                               <p className="text-xs font-medium text-gray-500 mb-1">EXPECTED TOPICS</p>
                               <div className="flex flex-wrap gap-1">
                                 {result.expected_topics.map((topic, i) => (
-                                  <Badge key={i} variant="outline" className="text-xs">
+                                  <Badge
+                                    key={i}
+                                    variant="outline"
+                                    className={`text-xs ${result.topic_hits?.[topic]?.length ? "bg-green-50 text-green-700 border-green-200" : ""}`}
+                                  >
                                     {topic}
                                   </Badge>
                                 ))}
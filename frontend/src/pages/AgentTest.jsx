@@ -25,6 +25,7 @@ export default function AgentTest() {
   const [messages, setMessages] = useState([]);
   const [inputValue, setInputValue] = useState("");
   const [loading, setLoading] = useState(false);
+  const [streaming, setStreaming] = useState(false);
   const [sessionId, setSessionId] = useState(null);
   const [isMuted, setIsMuted] = useState(false);
   const scrollRef = useRef(null);
@@ -126,21 +127,8 @@ export default function AgentTest() {
     setLoading(true);
 
     try {
-      const response = await axios.post(`${API}/chat`, {
-        agent_id: agentId,
-        message: inputValue,
-        session_id: sessionId,
-        history: messages.map((m) => ({ role: m.role === "agent" ? "assistant" : m.role, content: m.content })),
-      });
-
-      const agentMessage = {
-        role: "agent",
-        content: response.data.response,
-        timestamp: new Date(),
-      };
-
-      setMessages((prev) => [...prev, agentMessage]);
-      setSessionId(response.data.session_id);
+      // History lives server-side in the chat session; only the new message is sent
+      await streamChat(inputValue);
     } catch (error) {
       const errorMessage = {
         role: "agent",
@@ -148,12 +136,66 @@ export default function AgentTest() {
         timestamp: new Date(),
         isError: true,
       };
-      setMessages((prev) => [...prev, errorMessage]);
+      setMessages((prev) => [...prev.filter((m) => !m.streaming), errorMessage]);
     }
 
+    setStreaming(false);
     setLoading(false);
   };
 
+  // Relay token deltas from /chat/stream (SSE over fetch) into the last agent message
+  const streamChat = async (message) => {
+    const response = await fetch(`${API}/chat/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ agent_id: agentId, message, session_id: sessionId }),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Chat stream failed: ${response.status}`);
+    }
+
+    const appendToAgentMessage = (content) => {
+      setMessages((prev) => {
+        const last = prev[prev.length - 1];
+        if (last && last.streaming) {
+          return [...prev.slice(0, -1), { ...last, content: last.content + content }];
+        }
+        return [...prev, { role: "agent", content, timestamp: new Date(), streaming: true }];
+      });
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = frame.match(/^event: (.*)$/m)?.[1];
+        const data = frame.match(/^data: (.*)$/m)?.[1];
+        if (!event || !data) continue;
+        const payload = JSON.parse(data);
+
+        if (event === "delta") {
+          setStreaming(true);
+          appendToAgentMessage(payload.content);
+        } else if (event === "done") {
+          setSessionId(payload.session_id);
+          setMessages((prev) => prev.map((m) => (m.streaming ? { ...m, streaming: false } : m)));
+          return;
+        } else if (event === "error") {
+          throw new Error(payload.detail);
+        }
+      }
+    }
+    throw new Error("Chat stream ended unexpectedly");
+  };
+
   const handleKeyPress = (e) => {
     if (e.key === "Enter" && !e.shiftKey) {
       e.preventDefault();
@@ -559,7 +601,7 @@ export default function AgentTest() {
                       </div>
                     </div>
                   ))}
-                  {loading && (
+                  {loading && !streaming && (
                     <div className="flex gap-3">
                       <div className="w-8 h-8 rounded-full bg-gray-200 flex items-center justify-center">
                         <Bot className="w-4 h-4 text-gray-600" />
@@ -10,6 +10,7 @@ import { Input } from "../components/ui/input";
 import { Textarea } from "../components/ui/textarea";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "../components/ui/card";
 import { Label } from "../components/ui/label";
+import { Switch } from "../components/ui/switch";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "../components/ui/tabs";
 import {
   Select,
@@ -51,6 +52,7 @@ export default function PromptLab() {
   const [generatingQuestions, setGeneratingQuestions] = useState(false);
   const [testResults, setTestResults] = useState([]);
   const [testing, setTesting] = useState(false);
+  const [reuseCached, setReuseCached] = useState(true);
   const [expandedResults, setExpandedResults] = useState({});
 
   const handleExtractWebsite = async () => {
@@ -186,7 +188,9 @@ export default function PromptLab() {
     try {
       const response = await axios.post(`${API}/prompt-lab/test-prompt`, {
         system_prompt: generatedPrompt,
-        test_questions: testQuestions.map(q => q.question)
+        test_questions: testQuestions.map(q => q.question),
+        // Unchanged questions reuse cached answers unless turned off
+        use_cache: reuseCached ? null : false
       });
       
       setTestResults(response.data.test_results);
@@ -560,6 +564,11 @@ export default function PromptLab() {
                       </div>
                     </div>
 
+                    <div className="flex items-center justify-between">
+                      <Label htmlFor="reuse-cached" className="text-sm text-gray-700">Reuse cached answers</Label>
+                      <Switch id="reuse-cached" checked={reuseCached} onCheckedChange={setReuseCached} />
+                    </div>
+
                     <Button
                       onClick={handleTestPrompt}
                       disabled={testing}
@@ -0,0 +1,22 @@
+"""
+Shared fixtures: backend modules on the import path, an in-memory Mongo
+and asyncio-only async tests (via anyio's pytest plugin)
+"""
+import os
+import sys
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    # Same as the app's client: datetimes come back timezone-aware (UTC)
+    return AsyncMongoMockClient(tz_aware=True)["test"]
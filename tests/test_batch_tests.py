@@ -0,0 +1,186 @@
+from collections import OrderedDict
+
+import httpx
+import pytest
+
+from services import batch_tests, completion_cache, llm_gateway
+
+pytestmark = pytest.mark.anyio
+
+TEST_CASE = {
+    "id": "tc_1",
+    "scenarios": [{"name": "refund", "user_message": "I want a refund", "expected_topics": ["refund", "receipt"]}],
+}
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """Replace the simulated agent; returns the kwargs of each completion call"""
+    calls = []
+
+    def install(reply="Sure, I can process a refund for you today."):
+        async def fake_complete_text(messages, **kwargs):
+            calls.append(kwargs)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+        monkeypatch.setattr(batch_tests, "complete_text", fake_complete_text)
+        return calls
+
+    return install
+
+
+async def test_agent_reply_is_deterministic_so_the_gateway_caches_it(agent):
+    calls = agent()
+    await batch_tests.evaluate_scenario("sk", "prompt", TEST_CASE, TEST_CASE["scenarios"][0])
+    assert calls[0]["temperature"] == 0
+    assert calls[0]["cache"] is None
+
+
+async def test_use_cache_is_passed_through(agent):
+    calls = agent()
+    await batch_tests.evaluate_scenario("sk", "prompt", TEST_CASE, TEST_CASE["scenarios"][0], use_cache=True)
+    assert calls[0]["cache"] is True
+
+
+@pytest.mark.parametrize("topics", [["refund", "refund"], ["refund", ""], ["refund", "  "]])
+async def test_duplicate_and_blank_topics_do_not_cap_the_score(agent, topics):
+    agent()
+    scenario = {"user_message": "I want a refund", "expected_topics": topics}
+    outcome, result = await batch_tests.evaluate_scenario("sk", "prompt", TEST_CASE, scenario)
+    assert (outcome, result["score"]) == ("pass", 1.0)
+    assert result["expected_topics"] == ["refund"]
+    assert list(result["topic_hits"]) == ["refund"]
+
+
+async def test_resumed_job_without_use_cache_keeps_the_default(db, monkeypatch):
+    started = []
+    monkeypatch.setattr(batch_tests, "start_local_batch_test", lambda *args: started.append(args))
+    await db.test_cases.insert_one(dict(TEST_CASE))
+    await db.batch_tests.insert_one({
+        "id": "job_1", "status": "in_progress", "test_type": "text_simulation",
+        "agent_id": "agent_1", "test_case_definition_ids": ["tc_1"], "results": [],
+    })
+
+    assert await batch_tests.resume_local_batch_tests(db) == 1
+    use_cache, multi_turn = started[0][-2:]
+    assert use_cache is None
+    assert multi_turn is False
+
+
+def job_doc(**fields):
+    return {
+        "id": "job_1", "status": "in_progress", "test_type": "text_simulation", "agent_id": "agent_1",
+        "results": [], "pass_count": 0, "fail_count": 0, "error_count": 0, "completed_count": 0, **fields,
+    }
+
+
+@pytest.fixture
+def events(monkeypatch):
+    published = []
+    monkeypatch.setattr(batch_tests, "publish", lambda topic, event: published.append(event))
+    return published
+
+
+async def test_run_records_every_scenario_and_completes(db, agent, events):
+    agent()
+    await db.batch_tests.insert_one(job_doc())
+    scenarios = [
+        {"name": "hit", "user_message": "refund?", "expected_topics": ["refund"]},
+        {"name": "miss", "user_message": "warranty?", "expected_topics": ["warranty"]},
+        {"name": "open", "user_message": "hello"},
+    ]
+    await batch_tests.run_local_batch_test(db, "job_1", [{"id": "tc_1", "scenarios": scenarios}], "agent_1", concurrency=3)
+
+    job = await db.batch_tests.find_one({"id": "job_1"})
+    assert (job["pass_count"], job["fail_count"], job["completed_count"]) == (2, 1, 3)
+    assert job["status"] == "complete"
+    assert job["pass_rate"] == pytest.approx(200 / 3)
+    assert sorted(r["scenario_key"] for r in job["results"]) == ["tc_1:0", "tc_1:1", "tc_1:2"]
+    assert [e["type"] for e in events] == ["result"] * 3 + ["complete"]
+    assert [e["completed"] for e in events[:3]] == [1, 2, 3]
+
+
+async def test_result_is_recorded_once_per_scenario(db):
+    await db.batch_tests.insert_one(job_doc())
+    result = {"passed": True}
+    assert await batch_tests.record_result(db, "job_1", "tc_1:0", "pass", result)
+    assert not await batch_tests.record_result(db, "job_1", "tc_1:0", "pass", result)
+    job = await db.batch_tests.find_one({"id": "job_1"})
+    assert (job["pass_count"], len(job["results"])) == (1, 1)
+
+
+async def test_resume_skips_completed_scenarios(db, agent, events):
+    calls = agent()
+    await db.batch_tests.insert_one(job_doc(
+        results=[{"scenario_key": "tc_1:0", "passed": True}], pass_count=1, completed_count=1
+    ))
+    scenarios = [{"user_message": "first", "expected_topics": ["refund"]}, {"user_message": "second", "expected_topics": ["refund"]}]
+    await batch_tests.run_local_batch_test(
+        db, "job_1", [{"id": "tc_1", "scenarios": scenarios}], "agent_1", completed_keys={"tc_1:0"}
+    )
+
+    assert len(calls) == 1
+    job = await db.batch_tests.find_one({"id": "job_1"})
+    assert (job["pass_count"], job["completed_count"], job["pass_rate"]) == (2, 2, 100)
+    assert events[0]["completed"] == 2 and events[0]["total"] == 2
+
+
+async def test_synonyms_only_apply_to_their_own_scenario(db, agent, events):
+    agent("You'll get your money back.")
+    await db.batch_tests.insert_one(job_doc())
+    scenarios = [
+        {"user_message": "a", "expected_topics": ["refund"], "topic_synonyms": {"refund": ["money back"]}},
+        {"user_message": "b", "expected_topics": ["refund"]},
+    ]
+    await batch_tests.run_local_batch_test(db, "job_1", [{"id": "tc_1", "scenarios": scenarios}], "agent_1")
+
+    job = await db.batch_tests.find_one({"id": "job_1"})
+    passed = {r["scenario_key"]: r["passed"] for r in job["results"]}
+    assert passed == {"tc_1:0": True, "tc_1:1": False}
+
+
+async def test_agent_error_is_recorded_as_error(db, agent, events):
+    agent(batch_tests.LLMError(status_code=429, detail="slow down"))
+    await db.batch_tests.insert_one(job_doc())
+    await batch_tests.run_local_batch_test(db, "job_1", [TEST_CASE], "agent_1")
+
+    job = await db.batch_tests.find_one({"id": "job_1"})
+    assert job["error_count"] == 1
+    assert job["results"][0]["error"] == "API error: 429"
+    assert job["pass_rate"] == 0
+
+
+async def test_unchanged_rerun_makes_no_upstream_calls(db, events, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(completion_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(completion_cache, "_memory", OrderedDict())
+    monkeypatch.setattr(completion_cache, "get_database", lambda: db)
+    upstream = []
+
+    def handler(request):
+        upstream.append(request)
+        reply = {"role": "assistant", "content": "Sure, I can process a refund for you today."}
+        return httpx.Response(200, json={"choices": [{"message": reply}], "usage": {}})
+
+    monkeypatch.setattr(llm_gateway, "_client", httpx.AsyncClient(
+        base_url="https://llm.test/v1", transport=httpx.MockTransport(handler)
+    ))
+
+    for job_id in ("job_1", "job_2"):
+        await db.batch_tests.insert_one(job_doc(id=job_id))
+        await batch_tests.run_local_batch_test(db, job_id, [TEST_CASE], "agent_1")
+    assert len(upstream) == 1
+
+    # Even with the memory tier gone, Mongo serves the rerun
+    completion_cache._memory.clear()
+    await db.batch_tests.insert_one(job_doc(id="job_3"))
+    await batch_tests.run_local_batch_test(db, "job_3", [TEST_CASE], "agent_1")
+    assert len(upstream) == 1
+    job = await db.batch_tests.find_one({"id": "job_3"})
+    assert job["pass_count"] == 1
+
+    # Opting out asks the model again
+    await db.batch_tests.insert_one(job_doc(id="job_4"))
+    await batch_tests.run_local_batch_test(db, "job_4", [TEST_CASE], "agent_1", use_cache=False)
+    assert len(upstream) == 2
@@ -0,0 +1,129 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from services import call_rollups, call_store
+from services.call_rollups import source_granularity, get_zone
+
+pytestmark = pytest.mark.anyio
+
+# 2026-01-05 10:47 UTC, i.e. 16:17 in Asia/Kolkata
+STARTED_MS = int(datetime(2026, 1, 5, 10, 47, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def make_call(call_id="call_1", status="ended", sentiment="Positive", duration_ms=60000, cost=10, started=STARTED_MS):
+    return {
+        "call_id": call_id,
+        "agent_id": "agent_1",
+        "call_status": status,
+        "start_timestamp": started,
+        "duration_ms": duration_ms,
+        "call_cost": {"combined_cost": cost},
+        "call_analysis": {"user_sentiment": sentiment},
+    }
+
+
+async def rollup(db, granularity):
+    docs = await db.call_rollups.find({"granularity": granularity}).to_list(None)
+    assert len(docs) <= 1
+    return docs[0] if docs else None
+
+
+def test_contribution_uses_quarter_hour_buckets():
+    contrib = call_rollups.contribution({**make_call(), "call_timestamp": STARTED_MS})
+    assert contrib["bucket"] == datetime(2026, 1, 5, 10, 45, tzinfo=timezone.utc)
+    assert contrib["sentiment"] == "positive"
+    assert contrib["successes"] == 1
+
+
+@pytest.mark.parametrize("tz, interval, expected", [
+    ("UTC", "day", "day"),
+    ("UTC", "hour", "hour"),
+    ("America/New_York", "day", "hour"),
+    ("Asia/Kolkata", "day", "quarter"),
+    ("Asia/Kolkata", "hour", "quarter"),
+    ("Asia/Kathmandu", "day", "quarter"),
+])
+def test_source_granularity_follows_zone_offset(tz, interval, expected):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    end = datetime(2026, 1, 31, tzinfo=timezone.utc)
+    assert source_granularity(get_zone(tz), start, end, interval) == expected
+
+
+def test_source_granularity_sees_half_hour_dst_shift():
+    # Lord Howe Island is +10:30 in winter and +11:00 in summer
+    zone = get_zone("Australia/Lord_Howe")
+    summer = (datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 1, 31, tzinfo=timezone.utc))
+    across = (datetime(2026, 3, 20, tzinfo=timezone.utc), datetime(2026, 4, 20, tzinfo=timezone.utc))
+    assert source_granularity(zone, *summer) == "hour"
+    assert source_granularity(zone, *across) == "quarter"
+
+
+async def test_upsert_writes_quarter_hour_and_day_buckets(db):
+    await call_store.upsert_calls(db, [make_call()])
+
+    for granularity, bucket in (
+        ("quarter", datetime(2026, 1, 5, 10, 45, tzinfo=timezone.utc)),
+        ("hour", datetime(2026, 1, 5, 10, 0, tzinfo=timezone.utc)),
+        ("day", datetime(2026, 1, 5, tzinfo=timezone.utc)),
+    ):
+        doc = await rollup(db, granularity)
+        assert doc["bucket"] == bucket
+        assert doc["calls"] == 1
+        assert doc["duration_ms"] == 60000
+        assert doc["sentiment"]["positive"] == 1
+
+
+async def test_update_moves_counters_by_the_difference(db):
+    await call_store.upsert_calls(db, [make_call(status="ongoing", sentiment=None, cost=0)])
+    await call_store.upsert_calls(db, [make_call(status="ended", sentiment="Negative", cost=25)])
+
+    day = await rollup(db, "day")
+    assert day["calls"] == 1
+    assert day["successes"] == 1
+    assert day["cost"] == 25
+    assert day["sentiment"] == {"unknown": 0, "negative": 1}
+
+
+async def test_unchanged_resync_leaves_counters_alone(db):
+    await call_store.upsert_calls(db, [make_call()])
+    await call_store.upsert_calls(db, [make_call()])
+    assert (await rollup(db, "day"))["calls"] == 1
+
+
+async def test_concurrent_writers_of_one_call_do_not_drift(db):
+    # Both writers read "no existing call" before either writes
+    await asyncio.gather(
+        call_store.upsert_calls(db, [make_call(status="ongoing", cost=0)]),
+        call_store.upsert_calls(db, [make_call(status="ended", cost=40)]),
+    )
+    call = await db.calls.find_one({"call_id": "call_1"})
+    day = await rollup(db, "day")
+    assert day["calls"] == 1
+    assert day["cost"] == call["rollup"]["cost"]
+    assert day["successes"] == call["rollup"]["successes"]
+
+
+async def test_insert_only_does_not_overwrite(db):
+    await call_store.upsert_calls(db, [make_call(status="ended", cost=30)])
+    await call_store.upsert_calls(db, [make_call(status="ongoing", cost=0)], insert_only=True)
+
+    assert (await db.calls.find_one({"call_id": "call_1"}))["call_status"] == "ended"
+    day = await rollup(db, "day")
+    assert day["calls"] == 1
+    assert day["cost"] == 30
+
+
+async def test_backfill_counts_each_legacy_call_once(db):
+    await db.calls.insert_many([
+        {**make_call("call_1"), "call_timestamp": STARTED_MS},
+        {**make_call("call_2", status="error"), "call_timestamp": STARTED_MS},
+    ])
+    assert await call_store.backfill_rollups(db) == 2
+    assert await call_store.backfill_rollups(db) == 0
+
+    day = await rollup(db, "day")
+    assert day["calls"] == 2
+    assert day["successes"] == 1
+    assert day["failures"] == 1
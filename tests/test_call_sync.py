@@ -0,0 +1,100 @@
+import pytest
+
+from services import call_store, retell_client
+
+pytestmark = pytest.mark.anyio
+
+# 2026-01-05 10:47 UTC
+STARTED_MS = 1767610020000
+MINUTE_MS = 60 * 1000
+
+
+def make_call(index):
+    return {"call_id": f"call_{index:02d}", "agent_id": "agent_1", "call_status": "ended", "start_timestamp": STARTED_MS + index * MINUTE_MS}
+
+
+class FakeListCalls:
+    """Serves /v2/list-calls ascending from `lower_threshold`, recording each request"""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.requests = []
+        self.fail_on_request = None
+
+    async def __call__(self, method, endpoint, data=None):
+        assert (method, endpoint) == ("POST", "/v2/list-calls")
+        self.requests.append(dict(data))
+        if len(self.requests) == self.fail_on_request:
+            raise RuntimeError("Retell API error: 503")
+        lower = data["filter_criteria"]["start_timestamp"]["lower_threshold"]
+        matching = sorted((c for c in self.calls if c["start_timestamp"] >= lower), key=lambda c: c["start_timestamp"])
+        start = 0
+        if data.get("pagination_key"):
+            start = [c["call_id"] for c in matching].index(data["pagination_key"]) + 1
+        return matching[start:start + data["limit"]]
+
+    def thresholds(self):
+        return [r["filter_criteria"]["start_timestamp"]["lower_threshold"] for r in self.requests]
+
+
+@pytest.fixture
+def retell(monkeypatch):
+    monkeypatch.setattr(call_store, "get_retell_api_key", lambda: "key_test")
+    monkeypatch.setattr(call_store, "PAGE_SIZE", 2)
+    monkeypatch.setattr(call_store, "SYNC_OVERLAP_MS", 0)
+    server = FakeListCalls([make_call(i) for i in range(3)])
+    monkeypatch.setattr(retell_client, "make_retell_request", server)
+    return server
+
+
+async def high_water_mark(db):
+    state = await db.sync_state.find_one({"_id": call_store.SYNC_STATE_ID})
+    return state["high_water_mark"] if state else None
+
+
+async def test_second_sync_only_fetches_calls_after_the_mark(db, retell):
+    first = await call_store.sync_calls(db)
+    assert (first["synced"], first["pages"]) == (3, 2)
+    assert retell.thresholds() == [call_store.CUTOFF_TIMESTAMP_MS] * 2
+    assert await high_water_mark(db) == make_call(2)["start_timestamp"]
+
+    retell.requests.clear()
+    retell.calls += [make_call(3), make_call(4)]
+    second = await call_store.sync_calls(db)
+
+    # Only the last stored call (at the mark itself) is re-read, plus the new ones
+    assert retell.thresholds()[0] == make_call(2)["start_timestamp"]
+    assert second["synced"] == 3
+    assert await high_water_mark(db) == make_call(4)["start_timestamp"]
+    assert await db.calls.count_documents({}) == 5
+
+
+async def test_overlap_window_is_subtracted_from_the_mark(db, retell, monkeypatch):
+    await call_store.sync_calls(db)
+    monkeypatch.setattr(call_store, "SYNC_OVERLAP_MS", 2 * MINUTE_MS)
+    retell.requests.clear()
+
+    await call_store.sync_calls(db)
+    assert retell.thresholds()[0] == make_call(0)["start_timestamp"]
+
+
+async def test_failed_page_leaves_the_mark_unchanged(db, retell):
+    await call_store.sync_calls(db)
+    mark = await high_water_mark(db)
+
+    retell.requests.clear()
+    retell.calls += [make_call(3), make_call(4), make_call(5)]
+    retell.fail_on_request = 2
+    with pytest.raises(RuntimeError):
+        await call_store.sync_calls(db)
+
+    assert await high_water_mark(db) == mark
+    # The page that did arrive is stored; the next sync re-reads from the old mark
+    assert await db.calls.count_documents({}) == 4
+
+    retell.requests.clear()
+    retell.fail_on_request = None
+    result = await call_store.sync_calls(db)
+    assert retell.thresholds()[0] == mark
+    assert result["high_water_mark"] == make_call(5)["start_timestamp"]
+    assert await db.calls.count_documents({}) == 6
@@ -0,0 +1,90 @@
+import pytest
+from fastapi import HTTPException
+
+from services import chat_sessions
+
+pytestmark = pytest.mark.anyio
+
+
+def turns(start, count):
+    return [{"role": "user", "content": f"m{i}"} for i in range(start, start + count)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(chat_sessions, "_cache", type(chat_sessions._cache)())
+    monkeypatch.setattr(chat_sessions, "_pending", {})
+    monkeypatch.setattr(chat_sessions, "SESSION_MAX_MESSAGES", 4)
+
+
+async def test_new_session_is_empty(db):
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session == {"messages": [], "offset": 0, "summary": None, "summary_count": 0}
+
+
+async def test_appended_turns_are_flushed_and_reloaded(db):
+    await chat_sessions.get_session(db, "s1", "agent_1")
+    chat_sessions.append_messages("s1", "agent_1", turns(0, 2))
+    assert await chat_sessions.flush(db) == 1
+    assert await chat_sessions.flush(db) == 0
+
+    chat_sessions._cache.clear()
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session["messages"] == turns(0, 2)
+
+
+async def test_stored_history_is_capped(db):
+    await chat_sessions.get_session(db, "s1", "agent_1")
+    for start in range(0, 10, 2):
+        chat_sessions.append_messages("s1", "agent_1", turns(start, 2))
+        await chat_sessions.flush(db)
+
+    doc = await db.chat_sessions.find_one({"session_id": "s1"})
+    assert doc["messages"] == turns(6, 4)
+    assert doc["message_count"] == 10
+
+    cached = await chat_sessions.get_session(db, "s1", "agent_1")
+    chat_sessions._cache.clear()
+    loaded = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert cached == loaded
+    assert loaded["messages"] == turns(6, 4)
+    assert loaded["offset"] == 6
+
+
+async def test_summary_count_stays_aligned_with_trimmed_history(db):
+    await chat_sessions.get_session(db, "s1", "agent_1")
+    chat_sessions.append_messages("s1", "agent_1", turns(0, 4))
+    # The summary covers m0..m2 in absolute terms
+    chat_sessions.set_summary("s1", "agent_1", "summary", 3)
+    chat_sessions.append_messages("s1", "agent_1", turns(4, 2))
+
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session["messages"] == turns(2, 4)
+    assert session["summary_count"] == 1
+    assert session["messages"][session["summary_count"]:] == turns(3, 3)
+
+    await chat_sessions.flush(db)
+    chat_sessions._cache.clear()
+    assert await chat_sessions.get_session(db, "s1", "agent_1") == session
+
+
+async def test_summary_never_moves_backwards(db):
+    await chat_sessions.get_session(db, "s1", "agent_1")
+    chat_sessions.append_messages("s1", "agent_1", turns(0, 4))
+    chat_sessions.set_summary("s1", "agent_1", "newer", 3)
+    chat_sessions.set_summary("s1", "agent_1", "older", 2)
+    assert (await chat_sessions.get_session(db, "s1", "agent_1"))["summary"] == "newer"
+
+
+async def test_unflushed_turns_survive_eviction(db):
+    chat_sessions.append_messages("s1", "agent_1", turns(0, 2))
+    assert "s1" not in chat_sessions._cache
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session["messages"] == turns(0, 2)
+
+
+async def test_other_agent_cannot_read_session(db):
+    await chat_sessions.get_session(db, "s1", "agent_1")
+    with pytest.raises(HTTPException) as error:
+        await chat_sessions.get_session(db, "s1", "agent_2")
+    assert error.value.status_code == 400
@@ -0,0 +1,130 @@
+import json
+
+import httpx
+import pytest
+
+import server
+from services import chat_sessions
+from services.llm_gateway import LLMError
+
+pytestmark = pytest.mark.anyio
+
+USAGE = {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15}
+
+
+@pytest.fixture(autouse=True)
+def fresh_sessions(monkeypatch):
+    monkeypatch.setattr(chat_sessions, "_cache", type(chat_sessions._cache)())
+    monkeypatch.setattr(chat_sessions, "_pending", {})
+
+
+@pytest.fixture
+async def client(db, monkeypatch):
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    await db.agents.insert_one({
+        "id": "agent_1",
+        "system_prompt": "You are helpful.",
+        "chat_config": {"llm_model": "gpt-4o", "summarize_context": False},
+    })
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Replace the streaming router with scripted chunks; an exception in the script is raised mid-stream"""
+    calls = []
+
+    def install(*chunks):
+        async def fake_stream(messages, **kwargs):
+            calls.append({"messages": messages, **kwargs})
+            for chunk in chunks:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        monkeypatch.setattr(server, "stream_route_completion", fake_stream)
+        return calls
+
+    return install
+
+
+def parse_sse(body: str):
+    """(event, data) per frame; every frame is 'event:' then 'data:' and a blank line"""
+    frames = []
+    assert body.endswith("\n\n")
+    for frame in body[:-2].split("\n\n"):
+        event_line, data_line = frame.split("\n")
+        assert event_line.startswith("event: ") and data_line.startswith("data: ")
+        frames.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return frames
+
+
+async def post_stream(client, **body):
+    response = await client.post("/api/chat/stream", json={"agent_id": "agent_1", "message": "Hi", **body})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    return parse_sse(response.text)
+
+
+async def test_deltas_then_done_with_session_and_usage(client, llm):
+    calls = llm(
+        {"type": "delta", "content": "Hello"},
+        {"type": "delta", "content": " there"},
+        {"type": "usage", "usage": USAGE},
+    )
+
+    frames = await post_stream(client, session_id="s1")
+
+    assert frames == [
+        ("delta", {"content": "Hello"}),
+        ("delta", {"content": " there"}),
+        ("done", {"session_id": "s1", "response": "Hello there", "usage": USAGE}),
+    ]
+    assert calls[0]["purpose"] == "chat_stream"
+    assert calls[0]["messages"][-1] == {"role": "user", "content": "Hi"}
+
+
+async def test_new_session_id_is_returned(client, llm):
+    llm({"type": "delta", "content": "Hello"})
+    event, data = (await post_stream(client))[-1]
+    assert event == "done"
+    assert data["session_id"] and data["usage"] is None
+
+
+async def test_turn_is_appended_to_the_session_after_the_stream(client, llm, db):
+    llm({"type": "delta", "content": "Hello"}, {"type": "delta", "content": "!"})
+    await post_stream(client, session_id="s1")
+
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session["messages"] == [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello!"},
+    ]
+
+    # The next turn is sent with that history
+    calls = llm({"type": "delta", "content": "Sure"})
+    await post_stream(client, session_id="s1", message="And then?")
+    assert [m["content"] for m in calls[-1]["messages"][1:]] == ["Hi", "Hello!", "And then?"]
+
+
+@pytest.mark.parametrize("error, expected", [
+    (LLMError(status_code=429, detail="rate limited"), {"status_code": 429, "detail": "Chat API error: rate limited"}),
+    (RuntimeError("connection reset"), {"status_code": 500, "detail": "connection reset"}),
+])
+async def test_mid_stream_error_ends_with_error_and_keeps_session_unchanged(client, llm, db, error, expected):
+    llm({"type": "delta", "content": "Hel"}, error)
+
+    frames = await post_stream(client, session_id="s1")
+
+    assert frames == [("delta", {"content": "Hel"}), ("error", expected)]
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session["messages"] == []
+    assert chat_sessions._pending == {}
+
+
+async def test_unknown_agent_is_404_before_streaming(client, llm):
+    llm({"type": "delta", "content": "Hello"})
+    response = await client.post("/api/chat/stream", json={"agent_id": "missing", "message": "Hi"})
+    assert response.status_code == 404
@@ -0,0 +1,117 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from services import completion_cache, llm_gateway
+from services.completion_cache import cache_key
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+RESPONSE = {"choices": [{"message": {"role": "assistant", "content": "Hello!"}}], "usage": {}}
+
+
+@pytest.fixture
+def cache(db, monkeypatch):
+    """Empty memory tier in front of the test database"""
+    monkeypatch.setattr(completion_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(completion_cache, "_memory", OrderedDict())
+    monkeypatch.setattr(completion_cache, "_stats", dict.fromkeys(completion_cache._stats, 0))
+    monkeypatch.setattr(completion_cache, "get_database", lambda: db)
+    return completion_cache
+
+
+@pytest.fixture
+def openai(cache, monkeypatch):
+    """Gateway pointed at a handler that always answers; returns the requests it saw"""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json=RESPONSE)
+
+    monkeypatch.setattr(llm_gateway, "_client", httpx.AsyncClient(
+        base_url="https://llm.test/v1", transport=httpx.MockTransport(handler)
+    ))
+    return seen
+
+
+def test_key_is_stable_and_covers_every_input():
+    key = cache_key("gpt-4o", MESSAGES, 0, 100)
+    assert key == cache_key("gpt-4o", [dict(reversed(list(m.items()))) for m in MESSAGES], 0, 100)
+    assert len({
+        key,
+        cache_key("gpt-4o-mini", MESSAGES, 0, 100),
+        cache_key("gpt-4o", MESSAGES[1:], 0, 100),
+        cache_key("gpt-4o", MESSAGES, 0.7, 100),
+        cache_key("gpt-4o", MESSAGES, 0, 200),
+    }) == 5
+
+
+async def test_put_then_get_hits_memory(cache):
+    await cache.put("k", "gpt-4o", RESPONSE)
+    assert await cache.get("k") == RESPONSE
+    assert await cache.get("missing") is None
+    stats = cache.get_cache_stats()
+    assert (stats["memory_hits"], stats["misses"], stats["stores"]) == (1, 1, 1)
+
+
+async def test_memory_tier_is_lru_bounded(cache, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_SIZE", 2)
+    for key in ("a", "b"):
+        cache._remember(key, {"key": key}, 60)
+    await cache.get("a")
+    cache._remember("c", {"key": "c"}, 60)
+    assert list(cache._memory) == ["a", "c"]
+
+
+async def test_expired_memory_entry_falls_through(cache):
+    cache._remember("k", RESPONSE, 60)
+    cache._memory["k"] = (time.monotonic() - 1, RESPONSE)
+    assert await cache.get("k") is None
+    assert "k" not in cache._memory
+
+
+async def test_mongo_tier_survives_a_cold_memory_tier(cache, db):
+    await cache.put("k", "gpt-4o", RESPONSE)
+    cache._memory.clear()
+
+    assert await cache.get("k") == RESPONSE
+    assert cache.get_cache_stats()["db_hits"] == 1
+    # Promoted back into memory
+    assert "k" in cache._memory
+
+    await db.llm_cache.update_one({"key": "k"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+    cache._memory.clear()
+    assert await cache.get("k") is None
+
+
+async def test_gateway_caches_temperature_zero_by_default(openai):
+    for _ in range(2):
+        await llm_gateway.chat_completion(MESSAGES, temperature=0)
+    assert len(openai) == 1
+
+
+async def test_gateway_does_not_cache_sampled_calls_by_default(openai):
+    for _ in range(2):
+        await llm_gateway.chat_completion(MESSAGES, temperature=0.7)
+    assert len(openai) == 2
+
+
+async def test_gateway_cache_flag_overrides_the_default(openai):
+    for _ in range(2):
+        await llm_gateway.chat_completion(MESSAGES, temperature=0.7, cache=True)
+    for _ in range(2):
+        await llm_gateway.chat_completion(MESSAGES, temperature=0, cache=False)
+    assert len(openai) == 3
+
+
+async def test_gateway_skips_cache_when_disabled(openai, cache, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ENABLED", False)
+    for _ in range(2):
+        await llm_gateway.chat_completion(MESSAGES, temperature=0)
+    assert len(openai) == 2
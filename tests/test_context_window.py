@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from services import chat_sessions, context_window
+from services.context_window import count_message_tokens, fit_messages
+
+pytestmark = pytest.mark.anyio
+
+SYSTEM = "You are a helpful agent."
+
+
+def turns(count, size=40):
+    return [{"role": "user", "content": f"{i:02d}" + "x" * size} for i in range(count)]
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """Cap the prompt so only a known number of turns fit"""
+    def install(tokens):
+        monkeypatch.setattr(context_window, "MAX_PROMPT_TOKENS", tokens)
+    return install
+
+
+@pytest.mark.parametrize("model, expected", [
+    ("gpt-4o", 128000),
+    ("gpt-4o-2024-08-06", 128000),
+    ("gpt-4.1-mini-2025-04-14", 1047576),
+    ("gpt-4-0613", 8192),
+    ("some-other-model", context_window.DEFAULT_CONTEXT_TOKENS),
+])
+def test_context_limit_matches_model_family(model, expected):
+    assert context_window.context_limit(model) == expected
+
+
+def test_prompt_budget_reserves_completion_and_respects_cap(budget):
+    budget(100000)
+    assert context_window.prompt_budget("gpt-4", 2000) == 8192 - 2000 - context_window.REPLY_PRIMING_TOKENS
+    assert context_window.prompt_budget("gpt-4", 10000) == 0
+    budget(500)
+    assert context_window.prompt_budget("gpt-4o", 2000) == 500
+
+
+def test_everything_fits_when_under_budget():
+    history = turns(5)
+    new = {"role": "user", "content": "next"}
+    messages, dropped = fit_messages(SYSTEM, history, new)
+    assert messages == [{"role": "system", "content": SYSTEM}, *history, new]
+    assert dropped == 0
+
+
+def test_oldest_turns_are_dropped_first(budget):
+    history = turns(10)
+    per_turn = count_message_tokens(history[0])
+    fixed = count_message_tokens({"content": SYSTEM}) + count_message_tokens({"content": "next"})
+    budget(fixed + 3 * per_turn + context_window.REPLY_PRIMING_TOKENS)
+
+    messages, dropped = fit_messages(SYSTEM, history, {"role": "user", "content": "next"})
+    assert dropped == 7
+    assert messages[1:-1] == history[7:]
+
+
+def test_summary_is_sent_after_the_system_prompt():
+    messages, _ = fit_messages(SYSTEM, turns(1), summary="They want a refund.")
+    assert messages[1]["role"] == "system"
+    assert "They want a refund." in messages[1]["content"]
+
+
+async def test_schedule_summary_records_absolute_boundary(db, monkeypatch):
+    monkeypatch.setattr(chat_sessions, "_cache", type(chat_sessions._cache)())
+    monkeypatch.setattr(chat_sessions, "_pending", {})
+    monkeypatch.setattr(chat_sessions, "SESSION_MAX_MESSAGES", 6)
+    monkeypatch.setattr(context_window, "SUMMARY_BATCH_MESSAGES", 1)
+    seen = []
+
+    async def fake_complete_text(messages, **kwargs):
+        seen.append(messages[-1]["content"])
+        return "summary"
+
+    monkeypatch.setattr(context_window, "complete_text", fake_complete_text)
+
+    await chat_sessions.get_session(db, "s1", "agent_1")
+    chat_sessions.append_messages("s1", "agent_1", turns(8, size=0))
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session["offset"] == 2
+
+    context_window.schedule_summary("s1", "agent_1", session, dropped=2)
+    # A second request while the first summary runs is ignored
+    context_window.schedule_summary("s1", "agent_1", session, dropped=2)
+    while context_window._summarizing:
+        await asyncio.sleep(0)
+
+    assert len(seen) == 1
+    assert "user: 02" in seen[0] and "user: 04" in seen[0] and "user: 05" not in seen[0]
+    session = await chat_sessions.get_session(db, "s1", "agent_1")
+    assert session["summary"] == "summary"
+    assert session["summary_count"] == 3
+    assert chat_sessions._pending["s1"]["set"]["summary_count"] == 5
@@ -0,0 +1,178 @@
+import json
+
+import pytest
+
+from services import conversation_sim
+from services.conversation_sim import END_MARKER, clamp_turns, evaluate_conversation, simulate_conversation
+from services.llm_gateway import LLMError
+
+pytestmark = pytest.mark.anyio
+
+SCENARIO = {"name": "Refund", "user_message": "I want a refund for my order.", "max_turns": 5}
+
+
+class FakeLLM:
+    """Scripted replies per purpose (sim_agent, sim_caller, sim_judge); records every call"""
+
+    def __init__(self, agent=None, caller=None, judge=None):
+        self.replies = {"sim_agent": agent or [], "sim_caller": caller or [], "sim_judge": judge or []}
+        self.calls = []
+
+    async def __call__(self, messages, **kwargs):
+        self.calls.append({"messages": [dict(m) for m in messages], **kwargs})
+        replies = self.replies[kwargs["purpose"]]
+        reply = replies.pop(0) if len(replies) > 1 else replies[0]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def purposes(self):
+        return [call["purpose"] for call in self.calls]
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    def install(**replies):
+        fake = FakeLLM(**replies)
+        monkeypatch.setattr(conversation_sim, "complete_text", fake)
+        return fake
+    return install
+
+
+def judge(actions=None, criteria=None, reason="ok"):
+    return json.dumps({"actions": actions or {}, "success_criteria_met": criteria, "reason": reason})
+
+
+@pytest.mark.parametrize("max_turns, expected", [(None, 1), (0, 1), (3, 3), (1000, conversation_sim.SIM_MAX_TURNS)])
+def test_clamp_turns(max_turns, expected):
+    assert clamp_turns(max_turns) == expected
+
+
+async def test_caller_hang_up_ends_the_conversation(llm):
+    fake = llm(
+        agent=["Sure, what's the order number?", "Done, refund issued."],
+        caller=["It's 1234.", f"Great, thanks! {END_MARKER}"],
+    )
+    transcript = await simulate_conversation("sk", "prompt", SCENARIO)
+
+    assert transcript == [
+        {"role": "caller", "content": "I want a refund for my order."},
+        {"role": "agent", "content": "Sure, what's the order number?"},
+        {"role": "caller", "content": "It's 1234."},
+        {"role": "agent", "content": "Done, refund issued."},
+        {"role": "caller", "content": "Great, thanks!"},
+    ]
+    assert fake.purposes() == ["sim_agent", "sim_caller", "sim_agent", "sim_caller"]
+
+
+async def test_bare_end_marker_is_not_kept_as_a_turn(llm):
+    llm(agent=["Anything else?"], caller=[END_MARKER])
+    transcript = await simulate_conversation("sk", "prompt", SCENARIO)
+    assert [t["role"] for t in transcript] == ["caller", "agent"]
+
+
+async def test_turns_are_clamped_and_the_agent_speaks_last(llm, monkeypatch):
+    monkeypatch.setattr(conversation_sim, "SIM_MAX_TURNS", 3)
+    fake = llm(agent=["Agent reply."], caller=["Another question?"])
+    transcript = await simulate_conversation("sk", "prompt", {**SCENARIO, "max_turns": 50})
+
+    assert fake.purposes().count("sim_agent") == 3
+    assert fake.purposes().count("sim_caller") == 2
+    assert transcript[-1]["role"] == "agent"
+
+
+async def test_caller_sees_the_conversation_with_roles_swapped(llm):
+    fake = llm(agent=["How can I help?"], caller=[f"Bye {END_MARKER}"])
+    await simulate_conversation("sk", "prompt", SCENARIO)
+    caller_call = fake.calls[1]
+    assert [m["role"] for m in caller_call["messages"]] == ["system", "assistant", "user"]
+    assert caller_call["messages"][-1]["content"] == "How can I help?"
+
+
+async def test_sampled_turns_bypass_the_cache_by_default(llm):
+    fake = llm(agent=["Hi"], caller=[f"Bye {END_MARKER}"])
+    await simulate_conversation("sk", "prompt", SCENARIO)
+    assert {call["cache"] for call in fake.calls} == {None}
+
+    fake = llm(agent=["Hi"], caller=[f"Bye {END_MARKER}"])
+    await simulate_conversation("sk", "prompt", SCENARIO, use_cache=True)
+    assert {call["cache"] for call in fake.calls} == {True}
+
+
+async def test_score_averages_topics_actions_and_criteria(llm):
+    llm(
+        agent=["I can process a refund once I verify the order."],
+        caller=[f"Thanks {END_MARKER}"],
+        judge=[judge({"verify order": True, "issue refund": False}, criteria=True)],
+    )
+    scenario = {
+        **SCENARIO,
+        "expected_topics": ["refund", "warranty"],
+        "expected_actions": ["verify order", "issue refund"],
+        "success_criteria": "Caller knows next steps",
+    }
+    outcome, result = await evaluate_conversation("sk", "prompt", {"id": "tc_1"}, scenario)
+
+    # topics 1/2, actions 1/2, criteria 1
+    assert result["score"] == pytest.approx(2 / 3)
+    assert outcome == "pass"
+    assert result["topics_covered"] == 1
+    assert result["topic_hits"]["refund"] == [[1, 16, 22]]
+    assert result["actions"] == {"verify order": True, "issue refund": False}
+    assert result["success_criteria_met"] is True
+    assert result["turns"] == 1
+
+
+async def test_duplicate_and_blank_topics_do_not_cap_the_score(llm):
+    llm(agent=["I can process a refund today."], caller=[f"Thanks {END_MARKER}"])
+    scenario = {**SCENARIO, "expected_topics": ["refund", "refund", ""]}
+    outcome, result = await evaluate_conversation("sk", "prompt", {"id": "tc_1"}, scenario)
+    assert (outcome, result["score"]) == ("pass", 1.0)
+    assert result["expected_topics"] == ["refund"]
+    assert result["topics_covered"] == 1
+
+
+async def test_failed_criteria_can_fail_the_scenario(llm):
+    llm(agent=["I'm not sure."], caller=[f"Bye {END_MARKER}"], judge=[judge(criteria=False)])
+    scenario = {**SCENARIO, "expected_topics": ["refund"], "success_criteria": "Refund issued"}
+    outcome, result = await evaluate_conversation("sk", "prompt", {"id": "tc_1"}, scenario)
+    assert (outcome, result["score"]) == ("fail", 0.0)
+
+
+async def test_judge_is_skipped_without_actions_or_criteria(llm):
+    fake = llm(agent=["Here is how refunds work."], caller=[f"Bye {END_MARKER}"])
+    outcome, result = await evaluate_conversation("sk", "prompt", {"id": "tc_1"}, SCENARIO)
+    assert "sim_judge" not in fake.purposes()
+    assert (outcome, result["score"]) == ("pass", 1.0)
+
+
+async def test_judge_api_error_is_an_error_outcome(llm):
+    llm(agent=["Hi"], caller=[f"Bye {END_MARKER}"], judge=[LLMError(status_code=503, detail="down")])
+    outcome, result = await evaluate_conversation(
+        "sk", "prompt", {"id": "tc_1"}, {**SCENARIO, "expected_actions": ["greet"]}
+    )
+    assert outcome == "error"
+    assert result["error"] == "Judge API error: 503"
+
+
+async def test_unparseable_verdict_is_an_error_outcome(llm):
+    llm(agent=["Hi"], caller=[f"Bye {END_MARKER}"], judge=["not json"])
+    outcome, result = await evaluate_conversation(
+        "sk", "prompt", {"id": "tc_1"}, {**SCENARIO, "expected_actions": ["greet"]}
+    )
+    assert outcome == "error"
+    assert result["passed"] is False
+
+
+async def test_fenced_verdict_is_parsed(llm):
+    llm(agent=["Hi"], caller=[f"Bye {END_MARKER}"], judge=["```json\n" + judge({"greet": True}) + "\n```"])
+    outcome, result = await evaluate_conversation(
+        "sk", "prompt", {"id": "tc_1"}, {**SCENARIO, "expected_actions": ["greet"]}
+    )
+    assert (outcome, result["actions"]) == ("pass", {"greet": True})
+
+
+async def test_agent_api_error_is_an_error_outcome(llm):
+    llm(agent=[LLMError(status_code=429, detail="slow down")], caller=["unused"])
+    outcome, result = await evaluate_conversation("sk", "prompt", {"id": "tc_1"}, SCENARIO)
+    assert (outcome, result["error"]) == ("error", "API error: 429")
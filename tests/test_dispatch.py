@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from services import dispatch as dispatch_module
+from services.dispatch import TokenBucket, dispatch
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    """Virtual time for the bucket: sleeping advances the clock instead of waiting"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(seconds, *args, **kwargs):
+        clock.now += seconds
+        await real_sleep(0)
+
+    monkeypatch.setattr(dispatch_module, "time", clock)
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return clock
+
+
+async def acquire_times(bucket, clock, count):
+    times = []
+    for _ in range(count):
+        await bucket.acquire()
+        times.append(round(clock.now, 6))
+    return times
+
+
+async def test_bucket_bursts_to_capacity_then_paces_at_rate(clock):
+    bucket = TokenBucket(rate=10, capacity=3)
+    assert await acquire_times(bucket, clock, 6) == [0, 0, 0, 0.1, 0.2, 0.3]
+
+
+async def test_bucket_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    await acquire_times(bucket, clock, 2)
+    clock.now += 60
+    assert await acquire_times(bucket, clock, 3) == [60, 60, 60.1]
+
+
+async def test_default_capacity_allows_one_second_of_burst(clock):
+    assert TokenBucket(rate=5).capacity == 5
+    assert TokenBucket(rate=0.5).capacity == 1
+
+
+async def test_zero_rate_disables_limiting(clock):
+    bucket = TokenBucket(rate=0)
+    assert await acquire_times(bucket, clock, 100) == [0] * 100
+
+
+async def test_concurrent_waiters_are_served_in_order(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    order = []
+
+    async def take(name):
+        await bucket.acquire()
+        order.append((name, clock.now))
+
+    await asyncio.gather(*(take(name) for name in "abcd"))
+    assert order == [("a", 0), ("b", 1), ("c", 2), ("d", 3)]
+
+
+async def test_dispatch_keeps_input_order_and_isolates_errors():
+    async def fn(index, item):
+        await asyncio.sleep(0.001 * (5 - index))
+        if item == "bad":
+            raise ValueError(item)
+        return item.upper()
+
+    results = await dispatch(["a", "b", "bad", "d"], fn, concurrency=4)
+
+    assert [result for result, _ in results] == ["A", "B", None, "D"]
+    errors = [error for _, error in results]
+    assert isinstance(errors[2], ValueError)
+    assert errors[:2] == [None, None] and errors[3] is None
+
+
+async def test_dispatch_respects_concurrency():
+    in_flight = peak = 0
+
+    async def fn(index, item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return index
+
+    results = await dispatch(range(20), fn, concurrency=3)
+    assert [result for result, _ in results] == list(range(20))
+    assert peak == 3
+
+
+async def test_dispatch_draws_one_token_per_item(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    started = []
+
+    async def fn(index, item):
+        started.append(round(clock.now, 6))
+
+    await dispatch(range(5), fn, concurrency=5, bucket=bucket)
+    assert sorted(started) == [0, 0, 0.1, 0.2, 0.3]
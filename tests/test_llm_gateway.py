@@ -0,0 +1,158 @@
+import json
+
+import httpx
+import pytest
+
+from services import completion_cache, llm_gateway
+from services.llm_gateway import LLMError
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+
+
+def completion(content="Hello!", usage=None):
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        "usage": usage or {"prompt_tokens": 5, "completion_tokens": 2},
+    }
+
+
+def sse(*chunks):
+    body = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+    return httpx.Response(200, content=body.encode(), headers={"content-type": "text/event-stream"})
+
+
+@pytest.fixture
+def openai(monkeypatch):
+    """Point the shared client at a handler; returns the list of requests it saw"""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(llm_gateway, "_backoff_seconds", lambda attempt, response=None: 0)
+    monkeypatch.setattr(completion_cache, "CACHE_ENABLED", False)
+    seen = []
+
+    def install(*responses):
+        queue = list(responses)
+
+        def handler(request: httpx.Request):
+            seen.append(request)
+            response = queue.pop(0) if len(queue) > 1 else queue[0]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        monkeypatch.setattr(llm_gateway, "_client", httpx.AsyncClient(
+            base_url="https://llm.test/v1", transport=httpx.MockTransport(handler)
+        ))
+        return seen
+
+    return install
+
+
+async def test_returns_response_and_sends_payload(openai):
+    seen = openai(httpx.Response(200, json=completion()))
+    data = await llm_gateway.chat_completion(MESSAGES, model="gpt-4o-mini", temperature=0.2, max_tokens=50)
+
+    assert data["choices"][0]["message"]["content"] == "Hello!"
+    request = seen[0]
+    assert request.url.path == "/v1/chat/completions"
+    assert request.headers["authorization"] == "Bearer sk-test"
+    assert json.loads(request.content) == {
+        "model": "gpt-4o-mini", "messages": MESSAGES, "temperature": 0.2, "max_tokens": 50,
+    }
+
+
+async def test_complete_text_returns_message_content(openai):
+    openai(httpx.Response(200, json=completion("Sure.")))
+    assert await llm_gateway.complete_text(MESSAGES) == "Sure."
+
+
+async def test_missing_key_raises_before_any_request(openai, monkeypatch):
+    seen = openai(httpx.Response(200, json=completion()))
+    monkeypatch.delenv("OPENAI_API_KEY")
+    with pytest.raises(LLMError) as error:
+        await llm_gateway.chat_completion(MESSAGES)
+    assert error.value.status_code == 500
+    assert seen == []
+
+
+async def test_retries_retryable_status_then_succeeds(openai):
+    seen = openai(
+        httpx.Response(429, json={"error": {"message": "slow down"}}),
+        httpx.Response(503),
+        httpx.Response(200, json=completion()),
+    )
+    await llm_gateway.chat_completion(MESSAGES, purpose="test_retry")
+
+    assert len(seen) == 3
+    stats = llm_gateway.get_llm_stats()["purposes"]["test_retry"]
+    assert stats["retries"] == 2
+    assert stats["errors"] == 0
+    assert stats["prompt_tokens"] == 5
+
+
+async def test_gives_up_after_max_retries_with_provider_status(openai):
+    seen = openai(httpx.Response(503, json={"error": {"message": "overloaded"}}))
+    with pytest.raises(LLMError) as error:
+        await llm_gateway.chat_completion(MESSAGES, purpose="test_give_up")
+
+    assert error.value.status_code == 503
+    assert error.value.detail == "overloaded"
+    assert len(seen) == llm_gateway.LLM_MAX_RETRIES + 1
+    assert llm_gateway.get_llm_stats()["purposes"]["test_give_up"]["errors"] == 1
+
+
+async def test_client_errors_are_not_retried(openai):
+    seen = openai(httpx.Response(400, json={"error": {"message": "bad request"}}))
+    with pytest.raises(LLMError) as error:
+        await llm_gateway.chat_completion(MESSAGES)
+    assert error.value.status_code == 400
+    assert len(seen) == 1
+
+
+async def test_transport_errors_are_retried_then_mapped_to_500(openai):
+    seen = openai(httpx.ConnectError("refused"))
+    with pytest.raises(LLMError) as error:
+        await llm_gateway.chat_completion(MESSAGES)
+    assert error.value.status_code == 500
+    assert "Failed to connect" in error.value.detail
+    assert len(seen) == llm_gateway.LLM_MAX_RETRIES + 1
+
+
+def test_backoff_honours_retry_after_up_to_the_cap():
+    response = httpx.Response(429, headers={"retry-after": "2"})
+    assert llm_gateway._backoff_seconds(0, response) == 2
+    response = httpx.Response(429, headers={"retry-after": "600"})
+    assert llm_gateway._backoff_seconds(0, response) == llm_gateway.LLM_RETRY_MAX_SECONDS
+    assert 0 <= llm_gateway._backoff_seconds(3) <= llm_gateway.LLM_RETRY_MAX_SECONDS
+
+
+async def test_stream_yields_deltas_then_usage(openai):
+    seen = openai(sse(
+        {"choices": [{"delta": {"content": "Hel"}}]},
+        {"choices": [{"delta": {"content": "lo"}}]},
+        {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2}},
+    ))
+    events = [e async for e in llm_gateway.stream_chat_completion(MESSAGES)]
+
+    assert events == [
+        {"type": "delta", "content": "Hel"},
+        {"type": "delta", "content": "lo"},
+        {"type": "usage", "usage": {"prompt_tokens": 5, "completion_tokens": 2}},
+    ]
+    assert json.loads(seen[0].content)["stream"] is True
+
+
+async def test_stream_retries_before_first_delta(openai):
+    seen = openai(httpx.Response(502), sse({"choices": [{"delta": {"content": "ok"}}]}))
+    events = [e async for e in llm_gateway.stream_chat_completion(MESSAGES)]
+    assert events == [{"type": "delta", "content": "ok"}]
+    assert len(seen) == 2
+
+
+async def test_stream_error_status_raises(openai):
+    openai(httpx.Response(401, json={"error": {"message": "bad key"}}))
+    with pytest.raises(LLMError) as error:
+        async for _ in llm_gateway.stream_chat_completion(MESSAGES):
+            pass
+    assert (error.value.status_code, error.value.detail) == (401, "bad key")
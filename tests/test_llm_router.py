@@ -0,0 +1,186 @@
+import httpx
+import pytest
+
+from bench.fakes import Faults, create_anthropic_app, create_gemini_app, create_openai_app
+from services import completion_cache, llm_gateway, llm_router
+from services.llm_gateway import LLMError
+from services.llm_router import ADAPTERS, ProviderAdapter, ProviderHealth, route_completion
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+
+
+def asgi_client(app, base_url):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=base_url)
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """All three providers configured and served by the stand-in apps; returns their Faults"""
+    for env in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GEMINI_API_KEY"):
+        monkeypatch.setenv(env, "key-test")
+    monkeypatch.setattr(llm_router, "_health", ProviderHealth())
+    monkeypatch.setattr(llm_router, "FAILOVER_ORDER", ["openai", "anthropic", "gemini"])
+    monkeypatch.setattr(llm_gateway, "_backoff_seconds", lambda attempt, response=None: 0)
+    monkeypatch.setattr(completion_cache, "CACHE_ENABLED", False)
+
+    faults = {name: Faults() for name in ADAPTERS}
+    monkeypatch.setattr(llm_gateway, "_client", asgi_client(create_openai_app(faults["openai"]), "http://openai.test"))
+    monkeypatch.setattr(ADAPTERS["anthropic"], "_client", asgi_client(create_anthropic_app(faults["anthropic"]), "http://anthropic.test"))
+    monkeypatch.setattr(ADAPTERS["gemini"], "_client", asgi_client(create_gemini_app(faults["gemini"]), "http://gemini.test"))
+    return faults
+
+
+def replace_client(monkeypatch, provider, handler):
+    client = httpx.AsyncClient(base_url=f"http://{provider}.test", transport=httpx.MockTransport(handler))
+    if provider == "openai":
+        monkeypatch.setattr(llm_gateway, "_client", client)
+    else:
+        monkeypatch.setattr(ADAPTERS[provider], "_client", client)
+
+
+def test_adapters_must_implement_complete():
+    with pytest.raises(TypeError):
+        ProviderAdapter()
+
+
+@pytest.mark.parametrize("model, provider", [
+    ("gpt-4o-mini", "openai"),
+    ("claude-3-5-haiku-20241022", "anthropic"),
+    ("gemini-2.5-flash", "gemini"),
+])
+async def test_model_picks_its_provider_and_usage_is_normalised(providers, model, provider):
+    result = await route_completion(MESSAGES, model=model)
+    assert (result["provider"], result["model"]) == (provider, model)
+    assert result["content"]
+    assert set(result["usage"]) >= {"prompt_tokens", "completion_tokens"}
+
+
+async def test_model_from_another_provider_falls_back_to_its_default(providers):
+    result = await route_completion(MESSAGES, provider="anthropic", model="gpt-4o")
+    assert result["model"] == ADAPTERS["anthropic"].default_model
+
+
+async def test_anthropic_payload_separates_system_prompt(providers, monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json={"content": [{"type": "text", "text": "ok"}], "usage": {"input_tokens": 3, "output_tokens": 1}})
+
+    replace_client(monkeypatch, "anthropic", handler)
+    result = await route_completion(MESSAGES, model="claude-3-5-haiku-20241022", temperature=1.5)
+
+    body = httpx.Response(200, content=seen[0].content).json()
+    assert body["system"] == "Be brief."
+    assert body["messages"] == [{"role": "user", "content": "Hi"}]
+    assert body["temperature"] == 1.0
+    assert seen[0].headers["x-api-key"] == "key-test"
+    assert result["usage"] == {"prompt_tokens": 3, "completion_tokens": 1}
+
+
+async def test_provider_errors_fail_over_to_the_next_provider(providers):
+    providers["openai"].error_rate = 1
+    result = await route_completion(MESSAGES, model="gpt-4o")
+
+    assert result["provider"] == "anthropic"
+    health = llm_router._health.snapshot()
+    assert health["openai"]["errors"] == 1
+    assert health["anthropic"]["failovers"] == 1
+
+
+async def test_every_provider_failing_raises_the_last_error(providers):
+    for faults in providers.values():
+        faults.error_rate = 1
+    with pytest.raises(LLMError) as error:
+        await route_completion(MESSAGES, model="gpt-4o")
+    assert error.value.status_code in (429, 500, 503)
+    assert llm_router._health.snapshot()["gemini"]["errors"] == 1
+
+
+async def test_bad_request_is_not_failed_over(providers, monkeypatch):
+    replace_client(monkeypatch, "openai", lambda request: httpx.Response(400, json={"error": {"message": "bad"}}))
+    with pytest.raises(LLMError) as error:
+        await route_completion(MESSAGES, model="gpt-4o")
+    assert (error.value.status_code, error.value.detail) == (400, "bad")
+    assert set(llm_router._health.snapshot()) == {"openai"}
+
+
+@pytest.mark.parametrize("provider, model", [("anthropic", "claude-3-5-haiku-20241022"), ("gemini", "gemini-2.5-flash")])
+async def test_http_adapters_map_provider_errors(providers, monkeypatch, provider, model):
+    replace_client(monkeypatch, provider, lambda request: httpx.Response(
+        429, json={"type": "error", "error": {"type": "rate_limit_error", "message": "slow down"}}
+    ))
+    with pytest.raises(LLMError) as error:
+        await ADAPTERS[provider].complete(MESSAGES, model, 0, 10, None, "test")
+    assert (error.value.status_code, error.value.detail) == (429, "slow down")
+
+    def refuse(request):
+        raise httpx.ConnectError("refused")
+
+    replace_client(monkeypatch, provider, refuse)
+    with pytest.raises(LLMError) as error:
+        await ADAPTERS[provider].complete(MESSAGES, model, 0, 10, None, "test")
+    assert error.value.status_code == 503
+    assert provider in error.value.detail
+
+
+async def test_missing_key_is_a_configuration_error(providers, monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY")
+    with pytest.raises(LLMError) as error:
+        await ADAPTERS["gemini"].complete(MESSAGES, "gemini-2.5-flash", 0, 10, None, "test")
+    assert error.value.status_code == 500
+
+
+async def test_unconfigured_providers_are_not_failover_candidates(providers, monkeypatch):
+    monkeypatch.delenv("ANTHROPIC_API_KEY")
+    assert [adapter.name for adapter, _ in llm_router.plan_route(None, "gpt-4o")] == ["openai", "gemini"]
+
+
+async def test_slow_provider_is_hedged(providers):
+    providers["openai"].latency_ms = 500
+    result = await route_completion(MESSAGES, model="gpt-4o", hedge_after_ms=20)
+
+    assert result["provider"] == "anthropic"
+    health = llm_router._health.snapshot()
+    assert health["anthropic"]["hedged"] == 1
+    # The cancelled primary is not counted against it
+    assert "openai" not in health or health["openai"]["errors"] == 0
+
+
+async def test_no_hedge_when_primary_is_fast_enough(providers):
+    result = await route_completion(MESSAGES, model="gpt-4o", hedge_after_ms=1000)
+    assert result["provider"] == "openai"
+    assert set(llm_router._health.snapshot()) == {"openai"}
+
+
+async def test_degraded_provider_is_tried_last(providers, monkeypatch):
+    monkeypatch.setattr(llm_router, "HEALTH_MIN_SAMPLES", 2)
+    for _ in range(2):
+        llm_router._health.record("openai", 10, True)
+    assert [adapter.name for adapter, _ in llm_router.plan_route(None, "gpt-4o")] == ["anthropic", "gemini", "openai"]
+
+
+async def test_stream_fails_over_before_the_first_delta(providers):
+    providers["openai"].error_rate = 1
+    events = [e async for e in llm_router.stream_route_completion(MESSAGES, model="gpt-4o")]
+
+    assert [e["type"] for e in events] == ["delta", "usage"]
+    assert llm_router._health.snapshot()["anthropic"]["calls"] == 1
+
+
+async def test_unknown_failover_names_are_skipped(providers, monkeypatch):
+    monkeypatch.setattr(llm_router, "FAILOVER_ORDER", ["openai", "claude", "gemini"])
+    assert [adapter.name for adapter, _ in llm_router.plan_route(None, "gpt-4o")] == ["openai", "gemini"]
+
+    providers["openai"].error_rate = 1
+    events = [e async for e in llm_router.stream_route_completion(MESSAGES, model="gpt-4o")]
+    assert events[0]["type"] == "delta"
+    assert llm_router._health.snapshot()["gemini"]["calls"] == 1
+
+
+def test_unknown_failover_names_are_dropped_with_a_warning(caplog):
+    with caplog.at_level("WARNING", logger="services.llm_router"):
+        assert llm_router.known_providers(["openai", "claude", "gemini"]) == ["openai", "gemini"]
+    assert "claude" in caplog.text
@@ -0,0 +1,104 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from services import log_config
+from services.log_config import DeferredQueueHandler, JsonFormatter, format_payload, log_payload, redact
+
+
+class CountingStr:
+    """Counts how often the payload gets serialized"""
+
+    calls = 0
+
+    def __str__(self):
+        CountingStr.calls += 1
+        return "counted"
+
+
+@pytest.fixture
+def captured():
+    """A logger feeding a DeferredQueueHandler; returns (logger, queue)"""
+    records: queue.Queue = queue.Queue()
+    logger = logging.getLogger("test_log_config")
+    logger.handlers = [DeferredQueueHandler(records)]
+    logger.propagate = False
+    yield logger, records
+    logger.handlers = []
+    logger.setLevel(logging.NOTSET)
+
+
+def test_redact_masks_sensitive_keys_at_any_depth():
+    payload = {
+        "Authorization": "Bearer abc",
+        "nested": [{"retell_api_key": "key_123", "x-api-key": "k", "name": "ok"}],
+        "refresh_token": "t",
+        "tokens_used": 12,
+    }
+    assert redact(payload) == {
+        "Authorization": "[REDACTED]",
+        "nested": [{"retell_api_key": "[REDACTED]", "x-api-key": "[REDACTED]", "name": "ok"}],
+        "refresh_token": "[REDACTED]",
+        "tokens_used": 12,
+    }
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("sk-abcdef123456", "sk-abcd...[REDACTED]"),
+    ("Bearer eyJhbGciOi", "Bearer eyJh...[REDACTED]"),
+    ("whsec_0123456789", "whsec_0123...[REDACTED]"),
+    ("hello world", "hello world"),
+])
+def test_secret_looking_strings_keep_a_short_prefix(value, expected):
+    assert redact({"note": value}) == {"note": expected}
+
+
+def test_format_payload_masks_and_caps_size(monkeypatch):
+    assert format_payload(b"sk-abcdef123") == "sk-abcd...[REDACTED]"
+    assert format_payload({"a": 1}) == '{"a": 1}'
+    monkeypatch.setattr(log_config, "PAYLOAD_MAX_CHARS", 10)
+    assert format_payload("x" * 25) == "x" * 10 + "... [15 more chars]"
+
+
+def test_skipped_payload_is_never_serialized(captured, monkeypatch):
+    logger, records = captured
+    logger.setLevel(logging.INFO)
+    monkeypatch.setattr(log_config, "PAYLOAD_SAMPLE_RATE", 0)
+    CountingStr.calls = 0
+    log_payload(logger, "body", {"value": CountingStr()})
+    assert records.empty()
+    assert CountingStr.calls == 0
+
+
+def test_payload_is_snapshotted_when_logged(captured):
+    logger, records = captured
+    logger.setLevel(logging.DEBUG)
+    payload = {"status": "queued", "api_key": "sk-live-123456"}
+    log_payload(logger, "body", payload, endpoint="/v2/get-call")
+    # The caller keeps using its dict while the record waits in the queue
+    payload["status"] = "changed"
+    payload["api_key"] = "leaked"
+
+    record = records.get_nowait()
+    assert record.levelno == logging.DEBUG
+    assert record.getMessage() == 'body: {"status": "queued", "api_key": "[REDACTED]"}'
+    assert record.endpoint == "/v2/get-call"
+
+
+def test_payload_is_sampled_at_info_when_debug_is_off(captured, monkeypatch):
+    logger, records = captured
+    logger.setLevel(logging.INFO)
+    monkeypatch.setattr(log_config, "PAYLOAD_SAMPLE_RATE", 1.0)
+    log_payload(logger, "body", "text")
+    assert records.get_nowait().levelno == logging.INFO
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("svc", logging.INFO, __file__, 1, "hello %s", ("there",), None)
+    record.endpoint = "/x"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello there"
+    assert entry["endpoint"] == "/x"
+    assert entry["level"] == "INFO"
@@ -0,0 +1,120 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import server
+from services import metrics
+from services.metrics import Gauge, Histogram, MetricsMiddleware, normalize_endpoint, track_outbound
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Metrics created by a test register here instead of in the app's registry"""
+    monkeypatch.setattr(metrics, "_registry", [])
+    return metrics
+
+
+def samples(histogram, **labels):
+    key = histogram._key(labels)
+    return histogram._values.get(key)
+
+
+def test_histogram_renders_cumulative_buckets(registry):
+    latency = Histogram("test_seconds", "Test latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        latency.observe(value, route="/a")
+
+    assert registry.render().splitlines() == [
+        "# HELP test_seconds Test latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_seconds_bucket{route="/a",le="1.0"} 3',
+        'test_seconds_bucket{route="/a",le="+Inf"} 4',
+        'test_seconds_sum{route="/a"} 6.25',
+        'test_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_gauge_and_label_escaping(registry):
+    gauge = Gauge("test_in_flight", "Test gauge", ("name",))
+    gauge.inc(name='say "hi"\\now')
+    gauge.inc(2, name='say "hi"\\now')
+    gauge.dec(name='say "hi"\\now')
+    assert registry.render().splitlines()[-1] == 'test_in_flight{name="say \\"hi\\"\\\\now"} 2'
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/v2/get-call/call_a1b2c3d4e5", "/v2/get-call/{id}"),
+    ("/get-agent/agent_x1y2z3", "/get-agent/{id}"),
+    ("/v2/list-calls", "/v2/list-calls"),
+    ("/batch/123/results?page=2", "/batch/{id}/results"),
+    ("/jobs/4f9c2b1e-8a7d-4c3b-9e2f-1a2b3c4d5e6f", "/jobs/{id}"),
+    ("/v1beta/models/gemini-2.5-flash:generateContent", "/v1beta/models/gemini-2.5-flash:generateContent"),
+    ("/chat/completions", "/chat/completions"),
+])
+def test_normalize_endpoint_replaces_ids_only(path, expected):
+    assert normalize_endpoint(path) == expected
+
+
+def test_track_outbound_records_status_or_error():
+    with track_outbound("svc_test", "GET", "/thing/call_abcdef123") as call:
+        call["status"] = 200
+    with pytest.raises(RuntimeError):
+        with track_outbound("svc_test", "GET", "/thing/call_abcdef123"):
+            raise RuntimeError("boom")
+
+    histogram = metrics.outbound_request_duration
+    for status in (200, "error"):
+        state = samples(histogram, service="svc_test", method="GET", endpoint="/thing/{id}", status=status)
+        assert state[-1] == 1
+
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    @app.get("/fail")
+    async def fail():
+        raise RuntimeError("boom")
+
+    client = TestClient(MetricsMiddleware(app), raise_server_exceptions=False)
+    histogram = metrics.http_request_duration
+    before = samples(histogram, method="GET", route="/items/{item_id}", status=200)
+    before = before[-1] if before else 0
+
+    assert client.get("/items/a").status_code == 200
+    assert client.get("/items/b").status_code == 200
+    assert client.get("/nowhere").status_code == 404
+    assert client.get("/fail").status_code == 500
+
+    assert samples(histogram, method="GET", route="/items/{item_id}", status=200)[-1] == before + 2
+    assert samples(histogram, method="GET", route="unmatched", status=404)[-1] >= 1
+    assert samples(histogram, method="GET", route="/fail", status=500)[-1] >= 1
+    assert metrics.http_requests_in_flight._values[()] == 0
+
+
+@pytest.mark.anyio
+async def test_retell_llm_calls_are_tracked(db, monkeypatch):
+    def handler(request):
+        if request.url.path == "/create-retell-llm":
+            return httpx.Response(201, json={"llm_id": "llm_abcdef123"})
+        return httpx.Response(200, json={"response": "Hi there"})
+
+    client = httpx.AsyncClient(base_url="https://retell.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(server, "get_retell_client", lambda: client)
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setenv("RETELL_API_KEY", "key_test")
+    histogram = metrics.outbound_request_duration
+
+    def count(endpoint, status):
+        state = samples(histogram, service="retell", method="POST", endpoint=endpoint, status=status)
+        return state[-1] if state else 0
+
+    before = count("/create-retell-llm", 201), count("/v2/create-chat-completion", 200)
+    assert await server.get_or_create_retell_llm({"id": "agent_1"}) == "llm_abcdef123"
+    assert await server.call_retell_llm("llm_abcdef123", [{"role": "user", "content": "Hi"}], "prompt") == "Hi there"
+    assert (count("/create-retell-llm", 201), count("/v2/create-chat-completion", 200)) == (before[0] + 1, before[1] + 1)
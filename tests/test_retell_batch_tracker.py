@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services import retell_batch_tracker as tracker
+from services.retell_batch_tracker import summarize_retell_job
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def retell(db, monkeypatch):
+    """Serve get-batch-test from a script of responses; returns the published events"""
+    monkeypatch.setattr(tracker, "POLL_INITIAL_SECONDS", 0.001)
+    monkeypatch.setattr(tracker, "POLL_MAX_SECONDS", 0.004)
+    events = []
+    monkeypatch.setattr(tracker, "publish", lambda topic, event: events.append(event))
+
+    def install(*responses):
+        script = list(responses)
+        polls = []
+
+        async def fake_request(method, endpoint, data=None):
+            polls.append(endpoint)
+            response = script.pop(0) if len(script) > 1 else script[0]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        monkeypatch.setattr(tracker, "make_retell_request", fake_request)
+        return polls
+
+    return install, events
+
+
+async def job(db):
+    return await db.batch_tests.find_one({"id": "job_1"}, {"_id": 0})
+
+
+@pytest.fixture
+async def stored_job(db):
+    await db.batch_tests.insert_one({"id": "job_1", "status": "in_progress", "test_type": "voice_call"})
+
+
+@pytest.mark.parametrize("retell_status, status", [
+    ("Complete", "complete"),
+    ("done", "complete"),
+    ("canceled", "failed"),
+    ("running", "in_progress"),
+])
+def test_summary_maps_retell_statuses(retell_status, status):
+    assert summarize_retell_job({"status": retell_status})["status"] == status
+
+
+def test_summary_pass_rate_only_when_finished():
+    counts = {"pass_count": 3, "fail_count": 1, "error_count": 0, "total_count": 4}
+    assert "pass_rate" not in summarize_retell_job({"status": "running", **counts})
+    assert summarize_retell_job({"status": "complete", **counts})["pass_rate"] == 75
+
+
+async def test_polls_until_complete_publishing_each_change(db, retell, stored_job):
+    install, events = retell
+    polls = install(
+        {"status": "running", "pass_count": 0},
+        {"status": "running", "pass_count": 0},
+        {"status": "running", "pass_count": 1},
+        {"status": "complete", "pass_count": 2, "fail_count": 0, "total_count": 2},
+    )
+    await tracker.poll_retell_batch(db, "job_1", "rb_1")
+
+    assert polls == ["/get-batch-test/rb_1"] * 4
+    # The repeated poll with no change publishes nothing
+    assert [e["type"] for e in events] == ["progress", "progress", "complete"]
+    stored = await job(db)
+    assert stored["status"] == "complete"
+    assert stored["pass_rate"] == 100
+    assert stored["retell_result"]["total_count"] == 2
+
+
+async def test_transient_errors_keep_polling(db, retell, stored_job):
+    install, events = retell
+    install(HTTPException(status_code=502, detail="bad gateway"), {"status": "failed"})
+    await tracker.poll_retell_batch(db, "job_1", "rb_1")
+    assert [e["type"] for e in events] == ["failed"]
+    assert (await job(db))["status"] == "failed"
+
+
+async def test_missing_job_is_final(db, retell, stored_job):
+    install, events = retell
+    polls = install(HTTPException(status_code=404, detail="not found"))
+    await tracker.poll_retell_batch(db, "job_1", "rb_1")
+    assert len(polls) == 1
+    assert (await job(db))["retell_result"]["error"] == "Batch test not found in Retell"
+
+
+async def test_gives_up_after_timeout(db, retell, stored_job, monkeypatch):
+    install, events = retell
+    monkeypatch.setattr(tracker, "POLL_TIMEOUT_SECONDS", 0.01)
+    install({"status": "running"})
+    await tracker.poll_retell_batch(db, "job_1", "rb_1")
+
+    stored = await job(db)
+    assert stored["status"] == "failed"
+    assert "No final status" in stored["error"]
+    assert events[-1]["type"] == "failed"
+
+
+async def test_one_poller_per_job_and_resume(db, retell, monkeypatch):
+    install, _ = retell
+    gate = asyncio.Event()
+    polls = []
+
+    async def slow_request(method, endpoint, data=None):
+        polls.append(endpoint)
+        await gate.wait()
+        return {"status": "complete"}
+
+    monkeypatch.setattr(tracker, "make_retell_request", slow_request)
+    await db.batch_tests.insert_many([
+        {"id": "job_1", "status": "in_progress", "test_type": "voice_call", "retell_batch_id": "rb_1"},
+        {"id": "job_2", "status": "in_progress", "test_type": "text_simulation"},
+    ])
+
+    assert await tracker.resume_retell_batch_trackers(db) == 1
+    tracker.track_retell_batch(db, "job_1", "rb_1")
+    await asyncio.sleep(0.01)
+    assert polls == ["/get-batch-test/rb_1"]
+
+    gate.set()
+    while "job_1" in tracker._tracking:
+        await asyncio.sleep(0.001)
+    assert (await job(db))["status"] == "complete"
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from services import retell_client
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeListCalls:
+    """Serves /v2/list-calls from a list, recording each request"""
+
+    def __init__(self, total: int, delay: float = 0):
+        self.calls = [{"call_id": f"call_{i:04d}"} for i in range(total)]
+        self.delay = delay
+        self.requests = []
+        self.finished = 0
+
+    async def __call__(self, method, endpoint, data=None):
+        assert (method, endpoint) == ("POST", "/v2/list-calls")
+        self.requests.append(dict(data))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.finished += 1
+        start = 0
+        if data.get("pagination_key"):
+            start = [c["call_id"] for c in self.calls].index(data["pagination_key"]) + 1
+        return self.calls[start:start + data["limit"]]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    def install(total, delay=0):
+        server = FakeListCalls(total, delay)
+        monkeypatch.setattr(retell_client, "make_retell_request", server)
+        return server
+    return install
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+async def test_follows_pagination_key_until_short_page(fake):
+    server = fake(25)
+    pages = await collect(retell_client.iter_retell_call_pages(page_size=10))
+
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert [r.get("pagination_key") for r in server.requests] == [None, "call_0009", "call_0019"]
+    assert [c["call_id"] for p in pages for c in p] == [c["call_id"] for c in server.calls]
+
+
+async def test_full_last_page_costs_one_empty_request(fake):
+    server = fake(20)
+    pages = await collect(retell_client.iter_retell_call_pages(page_size=10))
+    assert [len(p) for p in pages] == [10, 10]
+    assert len(server.requests) == 3
+
+
+async def test_filter_and_sort_are_sent_on_every_page(fake):
+    server = fake(15)
+    criteria = {"agent_id": ["agent_1"]}
+    await collect(retell_client.iter_retell_call_pages(criteria, sort_order="ascending", page_size=10))
+    assert all(r["filter_criteria"] == criteria and r["sort_order"] == "ascending" for r in server.requests)
+
+
+async def test_page_size_is_clamped_to_api_limit(fake):
+    server = fake(5)
+    await collect(retell_client.iter_retell_call_pages(page_size=10_000))
+    assert server.requests[0]["limit"] == retell_client.LIST_CALLS_PAGE_SIZE
+
+
+async def test_max_calls_stops_fetching(fake):
+    server = fake(100)
+    calls = await collect(retell_client.iter_retell_calls(max_calls=15, page_size=10))
+    assert len(calls) == 15
+    assert len(server.requests) == 2
+
+
+async def test_zero_max_calls_fetches_nothing(fake):
+    server = fake(10)
+    assert await collect(retell_client.iter_retell_calls(max_calls=0)) == []
+    assert server.requests == []
+
+
+async def test_prefetch_yields_the_same_calls(fake):
+    fake(35)
+    plain = await collect(retell_client.iter_retell_calls(page_size=10))
+    fake(35)
+    prefetched = await collect(retell_client.iter_retell_calls(page_size=10, prefetch=True))
+    assert prefetched == plain
+
+
+async def test_prefetch_requests_next_page_while_caller_works(fake):
+    server = fake(30, delay=0.01)
+    pages = retell_client.iter_retell_call_pages(page_size=10, prefetch=True)
+    await pages.__anext__()
+    await asyncio.sleep(0.05)
+    # The second page was requested before the caller asked for it
+    assert len(server.requests) == 2
+    await pages.aclose()
+
+
+async def test_early_stop_cancels_prefetch(fake):
+    server = fake(100, delay=0.05)
+    async for _ in retell_client.iter_retell_calls(page_size=10, prefetch=True):
+        break
+    await asyncio.sleep(0.1)
+    # The prefetch of page two started but was cancelled rather than left running
+    assert len(server.requests) == 2
+    assert server.finished == 1
@@ -0,0 +1,105 @@
+import pytest
+
+from routes import retell_routes
+
+pytestmark = pytest.mark.anyio
+
+
+def retell_agent(agent_id, name, modified, llm_id=None):
+    agent = {"agent_id": agent_id, "agent_name": name, "last_modification_timestamp": modified}
+    if llm_id:
+        agent["response_engine"] = {"type": "retell-llm", "llm_id": llm_id}
+    return agent
+
+
+@pytest.fixture
+def retell(monkeypatch):
+    """Serves /list-agents and /get-retell-llm from the given agents, recording each request"""
+    monkeypatch.setattr(retell_routes.retell_agent_cache, "set_agents", lambda agents: None)
+
+    def install(agents, prompts=None):
+        requests = []
+
+        async def fake(method, endpoint, data=None, **kwargs):
+            requests.append((method, endpoint))
+            if endpoint == "/list-agents":
+                return agents
+            llm_id = endpoint.rsplit("/", 1)[-1]
+            return {"llm_id": llm_id, "general_prompt": (prompts or {})[llm_id]}
+
+        monkeypatch.setattr(retell_routes, "make_retell_request", fake)
+        return requests
+
+    return install
+
+
+async def local_agent(db, agent_id, name, modified):
+    await db.agents.insert_one({
+        "id": f"local_{agent_id}",
+        "name": name,
+        "retell_agent_id": agent_id,
+        "retell_last_modification_timestamp": modified,
+        "updated_at": "untouched",
+    })
+
+
+async def test_unchanged_agent_is_skipped(db, retell):
+    requests = retell([retell_agent("ag_1", "Support", 100, llm_id="llm_1")])
+    await local_agent(db, "ag_1", "Support", 100)
+
+    result = await retell_routes.sync_retell_agents_to_db(db)
+
+    assert (result["newly_imported"], result["updated"], result["unchanged"]) == (0, 0, 1)
+    assert requests == [("GET", "/list-agents")]
+    doc = await db.agents.find_one({"retell_agent_id": "ag_1"})
+    assert doc["updated_at"] == "untouched"
+
+
+@pytest.mark.parametrize("name, modified", [("Support v2", 100), ("Support", 200)])
+async def test_changed_agent_is_updated(db, retell, name, modified):
+    retell([retell_agent("ag_1", name, modified)])
+    await local_agent(db, "ag_1", "Support", 100)
+
+    result = await retell_routes.sync_retell_agents_to_db(db)
+
+    assert (result["newly_imported"], result["updated"], result["unchanged"]) == (0, 1, 0)
+    doc = await db.agents.find_one({"retell_agent_id": "ag_1"})
+    assert (doc["name"], doc["retell_last_modification_timestamp"]) == (name, modified)
+    assert doc["id"] == "local_ag_1"
+    assert doc["updated_at"] != "untouched"
+
+
+async def test_new_agent_is_inserted_with_its_llm_prompt(db, retell):
+    requests = retell(
+        # Two versions of the same agent: only the latest is imported
+        [retell_agent("ag_2", "Sales (old)", 100, llm_id="llm_old"), retell_agent("ag_2", "Sales", 200, llm_id="llm_2")],
+        prompts={"llm_2": "You sell things."},
+    )
+
+    result = await retell_routes.sync_retell_agents_to_db(db)
+
+    assert (result["total_retell_agents"], result["newly_imported"], result["already_synced"]) == (2, 1, 0)
+    assert requests == [("GET", "/list-agents"), ("GET", "/get-retell-llm/llm_2")]
+    docs = await db.agents.find({}, {"_id": 0}).to_list(None)
+    assert len(docs) == 1
+    assert (docs[0]["name"], docs[0]["retell_llm_id"], docs[0]["system_prompt"]) == ("Sales", "llm_2", "You sell things.")
+    assert docs[0]["retell_last_modification_timestamp"] == 200
+
+
+async def test_mixed_sync_inserts_updates_and_skips(db, retell):
+    retell(
+        [
+            retell_agent("ag_1", "Support", 100),
+            retell_agent("ag_2", "Billing v2", 300),
+            retell_agent("ag_3", "Sales", 200, llm_id="llm_3"),
+        ],
+        prompts={"llm_3": "You sell things."},
+    )
+    await local_agent(db, "ag_1", "Support", 100)
+    await local_agent(db, "ag_2", "Billing", 150)
+
+    result = await retell_routes.sync_retell_agents_to_db(db)
+
+    assert (result["newly_imported"], result["updated"], result["unchanged"]) == (1, 1, 1)
+    names = {doc["retell_agent_id"]: doc["name"] async for doc in db.agents.find({})}
+    assert names == {"ag_1": "Support", "ag_2": "Billing v2", "ag_3": "Sales"}
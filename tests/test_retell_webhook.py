@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routes import retell_routes
+from services.database import get_database
+
+KEY = "key_webhook_test"
+
+
+def sign(body: str, key: str = KEY, timestamp_ms: int = None) -> str:
+    timestamp_ms = timestamp_ms if timestamp_ms is not None else int(time.time() * 1000)
+    digest = hmac.new(key.encode(), (body + str(timestamp_ms)).encode(), hashlib.sha256).hexdigest()
+    return f"v={timestamp_ms},d={digest}"
+
+
+def event_body(event: str = "call_ended", call_id: str = "call_1") -> str:
+    return json.dumps({
+        "event": event,
+        "call": {
+            "call_id": call_id,
+            "agent_id": "agent_1",
+            "call_status": "ended",
+            "start_timestamp": 1767225600000,
+            "duration_ms": 60000,
+            "call_cost": {"combined_cost": 12},
+            "call_analysis": {"user_sentiment": "Positive"},
+        },
+    })
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setenv("RETELL_WEBHOOK_KEY", KEY)
+    monkeypatch.setattr(retell_routes, "WEBHOOK_ALLOW_UNSIGNED", False)
+    app = FastAPI()
+    app.include_router(retell_routes.router, prefix="/api")
+    app.dependency_overrides[get_database] = lambda: db
+    return TestClient(app)
+
+
+def post(client, body: str, signature: str = None):
+    headers = {"content-type": "application/json"}
+    if signature is not None:
+        headers["x-retell-signature"] = signature
+    return client.post("/api/retell/webhook", content=body, headers=headers)
+
+
+def test_verify_signature_accepts_valid_digest():
+    body = event_body()
+    assert retell_routes.verify_retell_signature(body, sign(body), KEY)
+
+
+@pytest.mark.parametrize("signature", [
+    "",
+    "garbage",
+    "v=123,d=abc",
+])
+def test_verify_signature_rejects_malformed_or_wrong(signature):
+    assert not retell_routes.verify_retell_signature(event_body(), signature, KEY)
+
+
+def test_verify_signature_rejects_other_key_tampered_body_and_stale_timestamp():
+    body = event_body()
+    assert not retell_routes.verify_retell_signature(body, sign(body, key="key_other"), KEY)
+    assert not retell_routes.verify_retell_signature(body + " ", sign(body), KEY)
+    stale = int(time.time() * 1000) - retell_routes.WEBHOOK_TOLERANCE_MS - 1000
+    assert not retell_routes.verify_retell_signature(body, sign(body, timestamp_ms=stale), KEY)
+
+
+def test_signed_event_is_stored(client, db):
+    body = event_body()
+    response = post(client, body, sign(body))
+    assert response.status_code == 200
+    assert response.json()["processed"] is True
+
+    call = asyncio.run(db.calls.find_one({"call_id": "call_1"}))
+    assert call["call_status"] == "ended"
+    assert call["rollup"]["calls"] == 1
+
+
+def test_bad_signature_is_rejected(client):
+    body = event_body()
+    assert post(client, body, sign(body, key="key_other")).status_code == 401
+    assert post(client, body).status_code == 401
+
+
+def test_missing_key_rejects_instead_of_skipping_verification(client, monkeypatch):
+    monkeypatch.delenv("RETELL_WEBHOOK_KEY")
+    monkeypatch.delenv("RETELL_API_KEY", raising=False)
+    assert post(client, event_body()).status_code == 503
+
+
+def test_missing_key_with_explicit_opt_in_accepts_unsigned(client, monkeypatch):
+    monkeypatch.delenv("RETELL_WEBHOOK_KEY")
+    monkeypatch.delenv("RETELL_API_KEY", raising=False)
+    monkeypatch.setattr(retell_routes, "WEBHOOK_ALLOW_UNSIGNED", True)
+    assert post(client, event_body()).json()["processed"] is True
+
+
+def test_duplicate_delivery_is_processed_once(client, db):
+    body = event_body()
+    first = post(client, body, sign(body)).json()
+    second = post(client, body, sign(body)).json()
+    assert first["processed"] is True
+    assert second == {"success": True, "event": "call_ended", "processed": False, "duplicate": True}
+
+    rollup = asyncio.run(db.call_rollups.find_one({"granularity": "day"}))
+    assert rollup["calls"] == 1
+
+
+def test_same_call_different_events_are_not_duplicates(client):
+    for event in ("call_started", "call_ended", "call_analyzed"):
+        body = event_body(event)
+        assert post(client, body, sign(body)).json()["processed"] is True
+
+
+def test_unknown_event_is_ignored(client):
+    body = event_body("call_transferred")
+    assert post(client, body, sign(body)).json()["processed"] is False
@@ -0,0 +1,88 @@
+import pytest
+
+from services.topic_matcher import TopicMatcher, compile_test_case, tokenize
+
+
+def key(word):
+    return tokenize(word)[0][0]
+
+
+@pytest.mark.parametrize("base, variant", [
+    ("cancel", "cancelled"),
+    ("cancel", "canceled"),
+    ("cancel", "cancelling"),
+    ("make", "making"),
+    ("use", "using"),
+    ("use", "used"),
+    ("agree", "agreed"),
+    ("analysis", "analyses"),
+    ("price", "Pricing"),
+    ("policy", "policies"),
+    ("charge", "charged"),
+    ("install", "installed"),
+    ("ship", "shipping"),
+    ("schedule", "scheduling"),
+    ("response", "responses"),
+    ("box", "boxes"),
+    ("tie", "ties"),
+    ("call", "calling"),
+    ("customer", "customer’s"),
+    ("cafe", "Café"),
+])
+def test_variants_share_a_key(base, variant):
+    assert key(base) == key(variant)
+
+
+@pytest.mark.parametrize("word, other", [
+    ("use", "us"),
+    ("thesis", "these"),
+    ("hope", "hopping"),
+    ("call", "cancel"),
+    ("status", "statue"),
+])
+def test_different_words_keep_different_keys(word, other):
+    assert key(word) != key(other)
+
+
+def test_tokenize_keeps_offsets_into_the_original_text():
+    text = "We’ve CANCELLED it"
+    assert [(text[start:end]) for _, start, end in tokenize(text)] == ["We’ve", "CANCELLED", "it"]
+
+
+def test_matcher_finds_phrases_and_reports_misses():
+    matcher = TopicMatcher(["refund policy", "price", "warranty"])
+    text = "Our refund policies and pricing are on the site."
+    hits = matcher.match(text)
+    assert [text[s:e] for s, e in hits["refund policy"]] == ["refund policies"]
+    assert [text[s:e] for s, e in hits["price"]] == ["pricing"]
+    assert hits["warranty"] == []
+
+
+def test_matcher_synonyms_count_for_their_topic():
+    matcher = TopicMatcher(["cancel"], {"cancel": ["terminate the plan"]})
+    assert matcher.match("I can terminate the plans today")["cancel"] == [(6, 25)]
+
+
+def test_blank_topics_are_ignored_and_duplicates_collapse():
+    assert TopicMatcher(["price", " ", "", "price"]).topics == ["price"]
+
+
+def test_compile_test_case_keeps_synonyms_per_scenario():
+    test_case = {"scenarios": [
+        {"expected_topics": ["refund"], "topic_synonyms": {"refund": ["money back"]}},
+        {"expected_topics": ["refund"]},
+        {"expected_topics": ["refund"], "topic_synonyms": {"refund": ["money back"]}},
+    ]}
+    with_synonym, without, again = compile_test_case(test_case)
+    text = "You'll get your money back."
+
+    assert with_synonym.match(text)["refund"]
+    assert without.match(text)["refund"] == []
+    # Identical scenarios share one compiled matcher
+    assert again is with_synonym
+
+
+def test_compile_test_case_has_one_matcher_per_scenario():
+    assert compile_test_case({"scenarios": []}) == []
+    matchers = compile_test_case({"scenarios": [{"expected_topics": ["a b"]}, {"expected_topics": ["price"]}]})
+    assert [m.topics for m in matchers] == [["a b"], ["price"]]
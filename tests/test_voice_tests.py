@@ -0,0 +1,120 @@
+import asyncio
+
+import httpx
+import pytest
+
+from routes import retell_routes
+from services import retell_client
+
+pytestmark = pytest.mark.anyio
+
+
+def final_call(call_id):
+    return {
+        "call_id": call_id,
+        "call_status": "ended",
+        "recording_url": f"https://recordings.test/{call_id}.wav",
+        "transcript": "Agent: Hello!",
+        "start_timestamp": 1000,
+        "end_timestamp": 61000,
+    }
+
+
+class FakeRetell:
+    """MockTransport handler for /v2/get-call, tracking how many lookups are in flight"""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.fetched = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request):
+        call_id = request.url.path.rsplit("/", 1)[-1]
+        self.fetched.append(call_id)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.in_flight -= 1
+        call = self.calls.get(call_id)
+        if call is None:
+            return httpx.Response(503, json={"error": "unavailable"})
+        return httpx.Response(200, json=call)
+
+
+@pytest.fixture
+def retell(monkeypatch):
+    monkeypatch.setenv("RETELL_API_KEY", "key_test")
+
+    def install(calls):
+        fake = FakeRetell(calls)
+        client = httpx.AsyncClient(base_url="https://retell.test", transport=httpx.MockTransport(fake))
+        monkeypatch.setattr(retell_client, "_client", client)
+        return fake
+
+    return install
+
+
+async def add_tests(db, count):
+    await db.voice_tests.insert_many([
+        {"id": f"vt_{i}", "agent_id": "agent_1", "call_id": f"call_{i}", "created_at": f"2026-01-05T10:{i:02d}:00Z"}
+        for i in range(count)
+    ])
+
+
+async def test_enrichment_is_bounded(db, retell, monkeypatch):
+    monkeypatch.setattr(retell_routes, "VOICE_TEST_ENRICH_CONCURRENCY", 2)
+    fake = retell({f"call_{i}": final_call(f"call_{i}") for i in range(6)})
+    await add_tests(db, 6)
+
+    tests = await retell_routes.list_voice_tests(db=db)
+
+    assert sorted(fake.fetched) == [f"call_{i}" for i in range(6)]
+    assert fake.max_in_flight == 2
+    assert all(t["recording_url"] and t["duration_ms"] == 60000 for t in tests)
+
+
+async def test_one_failed_lookup_does_not_fail_the_listing(db, retell):
+    calls = {f"call_{i}": final_call(f"call_{i}") for i in range(3)}
+    del calls["call_1"]
+    retell(calls)
+    await add_tests(db, 3)
+
+    tests = {t["id"]: t for t in await retell_routes.list_voice_tests(db=db)}
+
+    assert len(tests) == 3
+    assert "recording_url" not in tests["vt_1"] and "call_final" not in tests["vt_1"]
+    assert tests["vt_0"]["call_final"] and tests["vt_2"]["call_final"]
+    stored = await db.voice_tests.find_one({"id": "vt_1"})
+    assert "call_final" not in stored
+
+
+async def test_final_calls_are_persisted_and_not_fetched_again(db, retell):
+    ongoing = {"call_id": "call_1", "call_status": "ongoing", "start_timestamp": 1000}
+    fake = retell({"call_0": final_call("call_0"), "call_1": ongoing})
+    await add_tests(db, 2)
+
+    await retell_routes.list_voice_tests(db=db)
+    stored = await db.voice_tests.find_one({"id": "vt_0"}, {"_id": 0})
+    assert stored["call_final"] is True
+    assert stored["recording_url"] == "https://recordings.test/call_0.wav"
+
+    # Only the call that can still change is looked up again
+    fake.fetched.clear()
+    tests = {t["id"]: t for t in await retell_routes.list_voice_tests(db=db)}
+    assert fake.fetched == ["call_1"]
+    assert tests["vt_0"]["transcript"] == "Agent: Hello!"
+    assert tests["vt_1"]["call_status"] == "ongoing"
+
+
+async def test_calls_already_in_the_store_skip_the_api(db, retell):
+    fake = retell({})
+    await add_tests(db, 1)
+    await db.calls.insert_one(final_call("call_0"))
+
+    tests = await retell_routes.list_voice_tests(db=db)
+
+    assert fake.fetched == []
+    assert tests[0]["call_final"] is True